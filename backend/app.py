@@ -1,10 +1,23 @@
-from flask import Flask, send_from_directory, current_app
+from flask import Flask, current_app
 from flask_cors import CORS
 from config import Config, validate_config
 from models import db
 from routes.auth import auth_bp
 from routes.pets import pets_bp
 from routes.diaries import diaries_bp
+from routes.uploads import uploads_bp
+from routes.dashboard import dashboard_bp
+from routes.sync import sync_bp
+from routes.events import events_bp
+from utils.profiling import init_profiling
+from utils.media import serve_media
+from utils.db_routing import init_replicas
+from utils.rate_limit import init_rate_limit
+from utils.events import init_events
+from utils.slow_query import init_slow_query_log
+from utils.resilience import init_resilience
+from utils.health import init_health
+from utils.archive import init_archive
 import os
 import logging
 
@@ -21,7 +34,32 @@ def create_app():
     
     # 拡張機能を初期化
     db.init_app(app)
-    CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
+    CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True,
+         expose_headers=['Server-Timing', 'Idempotent-Replayed'])
+    
+    # リードレプリカ振り分け（DATABASE_REPLICA_URLS 設定時のみ）
+    init_replicas(app)
+    
+    # レート制限と重いエンドポイントの同時実行数制御
+    init_rate_limit(app)
+    
+    # 変更通知（LISTEN/NOTIFY + Server-Sent Events）
+    init_events(app)
+    
+    # 遅いSQLの記録（SLOW_QUERY_ENABLED=true の場合のみ）
+    init_slow_query_log(app)
+    
+    # 外部依存のサーキットブレーカーの状態確認（DEPENDENCY_METRICS_TOKEN 設定時のみ）
+    init_resilience(app)
+    
+    # liveness / readiness（依存はバックグラウンドで確認）
+    init_health(app)
+    
+    # アーカイブした日記の保存先と展開済みチャンクのキャッシュ
+    init_archive(app)
+    
+    # パフォーマンス計測（PROFILING_ENABLED=true の場合のみ）
+    init_profiling(app)
     
     # データベース接続テスト
     try:
@@ -36,18 +74,17 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(pets_bp)
     app.register_blueprint(diaries_bp)
+    app.register_blueprint(uploads_bp)
+    app.register_blueprint(dashboard_bp)
+    app.register_blueprint(sync_bp)
+    app.register_blueprint(events_bp)
     
-    # 開発環境でのアップロードファイルの配信
-    @app.route('/uploads/<filename>')
+    # アップロードファイルの配信
+    # ローカル: 長期キャッシュ + Range対応（MEDIA_ACCEL_REDIRECT_PREFIX設定時はnginxにオフロード）
+    # S3: 署名付きURLへリダイレクト
+    @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
-        if app.config['USE_S3']:
-            # USE_S3がtrueの場合、S3 URLにリダイレクト
-            s3_url = f"https://{app.config['S3_BUCKET_NAME']}.s3.{app.config['AWS_REGION']}.amazonaws.com/diary-images/{filename}"
-            from flask import redirect
-            return redirect(s3_url)
-        else:
-            # USE_S3がfalseの場合、ローカルフォルダから配信
-            return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        return serve_media(filename)
     
     # ヘルスチェックエンドポイント
     @app.route('/api/health')
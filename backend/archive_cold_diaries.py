@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+古い日記をアーカイブに移動（ユーザー・月ごとにzstdで圧縮してオブジェクトストレージへ）
+
+1. 作成・更新から --older-than-days が経過した日記をユーザー・月ごとにチャンクにまとめて保存し、
+   索引の行を作成して diaries から削除（チャンクごとにコミット）
+2. 戻した・削除した日記が含まれるチャンクを作り直し、空になったチャンクを削除
+
+--restore-user を指定した場合はそのユーザーのアーカイブをすべて diaries に戻す
+
+使い方:
+    python archive_cold_diaries.py [--execute] [--older-than-days 365] [--restore-user <user_id>]
+
+--execute を指定しない場合はドライラン（対象の件数の表示のみ）
+"""
+import argparse
+import uuid
+from datetime import datetime, timedelta, timezone
+from app import app
+from models import db, DiaryArchiveEntry
+from utils.archive import (
+    archive_month, compact_chunk, find_archivable_months, find_compactable_chunks, get_archive, restore_diaries
+)
+
+def archive_cold_diaries(cutoff, chunk_size, dry_run):
+    months = find_archivable_months(cutoff)
+    db.session.rollback()
+    print(f"{sum(count for _, _, count in months)} diaries in {len(months)} user-months older than {cutoff.isoformat()}")
+    if dry_run:
+        for user_id, month, count in months:
+            print(f"[dry-run] {user_id} {month.strftime('%Y-%m')}: {count} diaries")
+        return 0
+
+    summary = {'chunks': 0, 'diaries': 0, 'raw_bytes': 0, 'compressed_bytes': 0, 'errors': 0}
+    for user_id, month, _ in months:
+        while True:
+            storage_key = None
+            try:
+                chunk = archive_month(user_id, month, cutoff, chunk_size)
+                if chunk is None:
+                    break
+                storage_key = chunk.storage_key
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                # コミットに失敗した場合は保存したオブジェクトを削除（索引の行がないため参照されない）
+                if storage_key:
+                    get_archive().storage.delete(storage_key)
+                print(f"✗ Failed to archive {user_id} {month.strftime('%Y-%m')}: {e}")
+                summary['errors'] += 1
+                break
+            summary['chunks'] += 1
+            summary['diaries'] += chunk.diary_count
+            summary['raw_bytes'] += chunk.raw_size
+            summary['compressed_bytes'] += chunk.compressed_size
+            if chunk.diary_count < chunk_size:
+                break
+
+    ratio = summary['compressed_bytes'] / summary['raw_bytes'] if summary['raw_bytes'] else 0
+    print(f"Archived:        {summary['diaries']} diaries in {summary['chunks']} chunks")
+    print(f"Size:            {summary['raw_bytes'] / 1024 / 1024:.1f} MB -> "
+          f"{summary['compressed_bytes'] / 1024 / 1024:.1f} MB ({ratio:.1%})")
+    print(f"Errors:          {summary['errors']}")
+    return 1 if summary['errors'] else 0
+
+def compact_chunks():
+    errors = 0
+    compacted = 0
+    for chunk_id in find_compactable_chunks():
+        try:
+            old_key = compact_chunk(chunk_id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Failed to compact chunk {chunk_id}: {e}")
+            errors += 1
+            continue
+        # 読み出し中のワーカーは新しいキーで読み直すため、コミット後に古いオブジェクトを削除
+        if old_key:
+            get_archive().storage.delete(old_key)
+            compacted += 1
+    print(f"Compacted:       {compacted} chunks")
+    return 1 if errors else 0
+
+def restore_user(user_id, batch_size):
+    restored = 0
+    while True:
+        ids = db.session.execute(
+            db.select(DiaryArchiveEntry.id).where(DiaryArchiveEntry.user_id == user_id)
+            .order_by(DiaryArchiveEntry.chunk_id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        restored += restore_diaries(user_id, ids)
+        db.session.commit()
+    print(f"✓ Restored {restored} diaries for user {user_id}")
+    return compact_chunks()
+
+def main():
+    parser = argparse.ArgumentParser(description='Move cold diaries into compressed archive chunks')
+    parser.add_argument('--execute', action='store_true', help='Actually archive diaries (default: dry-run)')
+    parser.add_argument('--older-than-days', type=int, default=app.config['ARCHIVE_AFTER_DAYS'],
+                        help='Archive diaries created and last updated more than this many days ago')
+    parser.add_argument('--chunk-size', type=int, default=app.config['ARCHIVE_CHUNK_MAX_DIARIES'],
+                        help='Maximum diaries per chunk')
+    parser.add_argument('--restore-user', type=uuid.UUID, help='Move all archived diaries of a user back')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.restore_user:
+            return restore_user(args.restore_user, args.chunk_size)
+
+        if not app.config['ARCHIVE_ENABLED']:
+            print("ARCHIVE_ENABLED is not enabled. Please set ARCHIVE_ENABLED=true in .env file")
+            return 1
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+        status = archive_cold_diaries(cutoff, args.chunk_size, dry_run=not args.execute)
+        if args.execute:
+            status |= compact_chunks()
+        return status
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,10 +1,12 @@
 from functools import wraps
 from flask import request, jsonify, current_app
-from jose import jwt, JWTError
-from jose.exceptions import JWTClaimsError, ExpiredSignatureError
 from datetime import datetime
 import requests
 from models import User, db
+from utils.profiling import timed
+from utils.db_routing import use_primary
+from utils.rate_limit import check_user_rate_limit
+from utils.resilience import DependencyUnavailable
 
 def get_current_user():
     """トークンから現在のユーザーを取得、または開発環境ではモックユーザーを使用"""
@@ -12,6 +14,10 @@ def get_current_user():
         # 開発モード - モックユーザーを使用
         mock_sub = current_app.config['MOCK_USER_ID']
         user = User.query.filter_by(cognito_sub=mock_sub).first()
+        if not user:
+            # レプリカの遅延で見つからない可能性があるためプライマリで再確認
+            with use_primary():
+                user = User.query.filter_by(cognito_sub=mock_sub).first()
         if not user:
             user = User(
                 cognito_sub=mock_sub,
@@ -35,6 +41,10 @@ def get_current_user():
     # ユーザーを検索または作成（エラーハンドリング追加）
     try:
         user = User.query.filter_by(cognito_sub=user_info['sub']).first()
+        if not user:
+            # レプリカの遅延で見つからない可能性があるためプライマリで再確認
+            with use_primary():
+                user = User.query.filter_by(cognito_sub=user_info['sub']).first()
         if not user:
             user = User(
                 cognito_sub=user_info['sub'],
@@ -54,15 +64,29 @@ def login_required(f):
     """認証を必須とするデコレータ"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user = get_current_user()
+        try:
+            with timed('auth'):
+                user = get_current_user()
+        except DependencyUnavailable as e:
+            # 公開鍵を取得できない（キャッシュもない）場合は認証失敗ではなく一時的なエラーとする
+            current_app.logger.error(f"Authentication unavailable: {e}")
+            response = jsonify({'error': 'Authentication service unavailable'})
+            response.headers['Retry-After'] = '30'
+            return response, 503
         if not user:
             return jsonify({'error': 'Authentication required'}), 401
         request.current_user = user
+        limited = check_user_rate_limit(user)
+        if limited:
+            return limited
         return f(*args, **kwargs)
     return decorated_function
 
 def verify_cognito_token(token):
     """Cognito JWTトークンを検証"""
+    # joseはCognitoモードでのみ必要なため遅延インポート（--preload時はフォーク前に読み込み済み）
+    from jose import jwt, JWTError
+    from jose.exceptions import JWTClaimsError, ExpiredSignatureError
     from utils.cognito_cache import get_jwks_keys, find_key_by_kid
     
     try:
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+DBドライバごとの1リクエストあたりのDB時間を比較するベンチマーク
+日記一覧API（GET /api/pets/<id>/diaries）と同じクエリ列を繰り返し実行する
+
+  1. 認証時のユーザー検索
+  2. ペットの所有権の確認
+  3. 日記の件数
+  4. 日記一覧（1ページ分）
+
+比較するモード:
+  psycopg2           : 従来のドライバ（毎回パース・プランニング）
+  psycopg            : psycopg 3（プリペアドステートメントなし）
+  psycopg+prepare    : psycopg 3（自動プリペアドステートメント）
+  psycopg+pipeline   : psycopg 3（プリペアド + 2と3をパイプラインで1往復）
+
+使い方:
+    python benchmark_db_driver.py [--requests 2000] [--cognito-sub test-user-123]
+"""
+import argparse
+import os
+import statistics
+import time
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, func, select
+from models import User, Pet, Diary
+
+load_dotenv()
+
+MODES = ['psycopg2', 'psycopg', 'psycopg+prepare', 'psycopg+pipeline']
+
+def build_engine(url, mode):
+    if mode == 'psycopg2':
+        return create_engine(url.replace('postgresql://', 'postgresql+psycopg2://', 1))
+    prepare_threshold = None if mode == 'psycopg' else 1
+    return create_engine(
+        url.replace('postgresql://', 'postgresql+psycopg://', 1),
+        connect_args={'prepare_threshold': prepare_threshold}
+    )
+
+def hot_queries(cognito_sub, user_id, pet_id, per_page=10):
+    user_query = select(User).where(User.cognito_sub == cognito_sub)
+    ownership = select(Pet.id).where(Pet.id == pet_id, Pet.user_id == user_id)
+    count = select(func.count(Diary.id)).where(Diary.pet_id == pet_id)
+    page = select(Diary).where(Diary.pet_id == pet_id).order_by(Diary.created_at.desc()).limit(per_page)
+    return user_query, ownership, count, page
+
+def run_pipelined(conn, statements):
+    driver_connection = conn.connection.driver_connection
+    compiled = [statement.compile(dialect=conn.dialect) for statement in statements]
+    cursors = []
+    with driver_connection.pipeline():
+        for query in compiled:
+            cursor = driver_connection.cursor()
+            cursor.execute(str(query), query.construct_params())
+            cursors.append(cursor)
+    results = [cursor.fetchall() for cursor in cursors]
+    for cursor in cursors:
+        cursor.close()
+    return results
+
+def simulate_request(conn, mode, queries):
+    user_query, ownership, count, page = queries
+    conn.execute(user_query).first()
+    if mode == 'psycopg+pipeline':
+        run_pipelined(conn, [ownership, count])
+    else:
+        conn.execute(ownership).first()
+        conn.execute(count).scalar()
+    conn.execute(page).all()
+    conn.rollback()
+
+def benchmark(url, mode, queries, requests, warmup=50):
+    engine = build_engine(url, mode)
+    timings = []
+    with engine.connect() as conn:
+        for i in range(warmup + requests):
+            start = time.perf_counter()
+            simulate_request(conn, mode, queries)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    engine.dispose()
+    timings.sort()
+    return {
+        'mean': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95)],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-request DB time across drivers')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--cognito-sub', default=os.getenv('MOCK_USER_ID', 'test-user-123'))
+    args = parser.parse_args()
+
+    setup = create_engine(args.database_url)
+    with setup.connect() as conn:
+        user_id = conn.execute(select(User.id).where(User.cognito_sub == args.cognito_sub)).scalar()
+        pet_id = conn.execute(select(Pet.id).where(Pet.user_id == user_id).limit(1)).scalar()
+    setup.dispose()
+    if pet_id is None:
+        raise SystemExit(f"No pet found for user {args.cognito_sub}")
+
+    queries = hot_queries(args.cognito_sub, user_id, pet_id)
+    baseline = None
+    print(f"{'mode':<20}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'saved':>10}")
+    for mode in MODES:
+        result = benchmark(args.database_url, mode, queries, args.requests)
+        baseline = baseline or result['mean']
+        saved = (1 - result['mean'] / baseline) * 100
+        print(f"{mode:<20}{result['mean']:>10.3f}{result['p50']:>10.3f}{result['p95']:>10.3f}{saved:>9.1f}%")
+
+if __name__ == '__main__':
+    main()
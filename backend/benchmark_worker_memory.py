@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+gunicorn のマスターとワーカーのメモリ使用量を計測（Linuxのみ）
+/proc/<pid>/smaps_rollup から RSS・PSS・共有/専有ページを読み取る
+
+RSSは共有ページを各プロセスで重複して数えるため、ワーカー数を増やした場合の
+実際の増分は PSS の合計（または専有ページ）で見積もる
+
+使い方:
+    python benchmark_worker_memory.py --pid <gunicorn master pid> [--url http://localhost:5000/api/health]
+                                      [--requests 200]
+  --url を指定した場合は計測前にリクエストを送り、リクエスト処理後のメモリも計測する
+"""
+import argparse
+import os
+import time
+import requests
+
+FIELDS = ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty']
+
+def read_memory(pid):
+    """smaps_rollup の値（KB）"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(':') in FIELDS:
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values
+
+def child_pids(pid):
+    children = set()
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.update(int(child) for child in f.read().split())
+    return sorted(children)
+
+def report(title, master_pid):
+    workers = child_pids(master_pid)
+    rows = [('master', master_pid, read_memory(master_pid))]
+    rows += [(f"worker {i + 1}", pid, read_memory(pid)) for i, pid in enumerate(workers)]
+
+    print(f"\n{title}")
+    print(f"{'process':<12}{'pid':>8}" + ''.join(f"{field + ' MB':>18}" for field in FIELDS))
+    for name, pid, values in rows:
+        print(f"{name:<12}{pid:>8}" + ''.join(f"{values.get(field, 0) / 1024:>18.1f}" for field in FIELDS))
+
+    total = {field: sum(values.get(field, 0) for _, _, values in rows) for field in FIELDS}
+    print(f"{'total':<12}{'':>8}" + ''.join(f"{total[field] / 1024:>18.1f}" for field in FIELDS))
+    if workers:
+        per_worker = sum(values['Pss'] for _, _, values in rows[1:]) / len(workers)
+        private = sum(values['Private_Clean'] + values['Private_Dirty'] for _, _, values in rows[1:]) / len(workers)
+        print(f"PSS per worker: {per_worker / 1024:.1f} MB, private per worker: {private / 1024:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure RSS/PSS of gunicorn master and workers')
+    parser.add_argument('--pid', type=int, required=True, help='gunicorn master pid')
+    parser.add_argument('--url', help='Send requests to this URL before the second measurement')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    report('After startup', args.pid)
+    if args.url:
+        session = requests.Session()
+        for _ in range(args.requests):
+            session.get(args.url, timeout=10)
+        time.sleep(1)
+        report(f"After {args.requests} requests to {args.url}", args.pid)
+
+if __name__ == '__main__':
+    main()
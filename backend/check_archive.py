@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+古い日記のアーカイブの動作確認（ローカルの一時ディレクトリを保存先に使い、S3には接続しない）
+
+1つのトランザクション内でテスト用のユーザー・ペット・日記を投入し、
+アーカイブ → 読み出し（1件・一覧）→ キャッシュ → 戻す → チャンクの作り直し を確認してロールバックする
+想定と異なる動作があれば終了コード1で終了する
+
+使い方:
+    python check_archive.py [--diaries 50] [--chunk-size 20]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from app import app
+from models import db, User, Pet, Diary, DiaryImage, DiaryArchiveChunk, DiaryArchiveEntry
+from utils.archive import (
+    ChunkCache, DiaryArchive, LocalArchiveStorage, archive_month, compact_chunk, find_archivable_months,
+    get_archived_diary, load_archived_diaries, page_diaries, restore_diaries
+)
+
+def seed(diary_count):
+    """古い月の日記（画像・タグ付きを含む）と最近の日記を投入"""
+    now = datetime.now(timezone.utc)
+    user = User(id=uuid.uuid4(), cognito_sub=f"archive-check-{uuid.uuid4()}", email='archive@example.com',
+                username='archive-check')
+    pet = Pet(id=uuid.uuid4(), user_id=user.id, name='Archive Check')
+    db.session.add_all([user, pet])
+    db.session.flush()
+
+    month_start = (now - timedelta(days=800)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    old = []
+    for i in range(diary_count):
+        created_at = month_start + timedelta(hours=i)
+        diary = Diary(
+            id=uuid.uuid4(), pet_id=pet.id, user_id=user.id, title=f"old {i}",
+            content=f"古い日記 {i} " * 20, image_url=f"/uploads/old-{i}.jpg" if i % 3 == 0 else None,
+            tags=['archive', f"tag-{i % 4}"], created_at=created_at, updated_at=created_at
+        )
+        if diary.image_url:
+            diary.images.append(DiaryImage(image_url=diary.image_url, position=0))
+            diary.images.append(DiaryImage(image_url=f"/uploads/old-{i}-b.jpg", position=1))
+        old.append(diary)
+    recent = [
+        Diary(id=uuid.uuid4(), pet_id=pet.id, user_id=user.id, title=f"recent {i}", content='最近の日記',
+              tags=[], created_at=now - timedelta(days=i), updated_at=now - timedelta(days=i))
+        for i in range(5)
+    ]
+    db.session.add_all(old + recent)
+    db.session.flush()
+    return user, pet, old, recent, month_start.date()
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise cold-diary archival against a local directory')
+    parser.add_argument('--diaries', type=int, default=50, help='Old diaries to archive')
+    parser.add_argument('--chunk-size', type=int, default=20, help='Diaries per chunk')
+    args = parser.parse_args()
+
+    problems = []
+
+    def check(name, condition, detail=''):
+        print(f"{'✓' if condition else '✗'} {name}{': ' + detail if detail else ''}")
+        if not condition:
+            problems.append(name)
+
+    root = tempfile.mkdtemp(prefix='archive-check-')
+    with app.app_context():
+        archive = DiaryArchive(LocalArchiveStorage(root), ChunkCache(4), app.config['ARCHIVE_COMPRESSION_LEVEL'])
+        previous = app.extensions['diary_archive']
+        app.extensions['diary_archive'] = archive
+        try:
+            user, pet, old, recent, month = seed(args.diaries)
+            expected = {diary.id: diary.to_dict() for diary in old + recent}
+            cutoff = datetime.now(timezone.utc) - timedelta(days=365)
+
+            months = [(m, count) for user_id, m, count in find_archivable_months(cutoff) if user_id == user.id]
+            check('old month is archivable', months == [(month, args.diaries)], str(months))
+
+            chunks = []
+            while True:
+                chunk = archive_month(user.id, month, cutoff, args.chunk_size)
+                if chunk is None:
+                    break
+                chunks.append(chunk)
+            db.session.expire_all()
+
+            archived_count = sum(chunk.diary_count for chunk in chunks)
+            check('all old diaries archived', archived_count == args.diaries,
+                  f"{len(chunks)} chunks, {archived_count} diaries")
+            check('recent diaries stay in diaries',
+                  Diary.query.filter_by(user_id=user.id).count() == len(recent))
+            check('chunk objects written', all(
+                os.path.exists(os.path.join(root, *chunk.storage_key.split('/'))) for chunk in chunks
+            ))
+            raw = sum(chunk.raw_size for chunk in chunks)
+            compressed = sum(chunk.compressed_size for chunk in chunks)
+            check('chunks are compressed', compressed < raw, f"{raw} -> {compressed} bytes")
+
+            loaded = load_archived_diaries(user.id, [diary.id for diary in old])
+            check('archived diaries read back unchanged',
+                  all(loaded.get(diary.id) == expected[diary.id] for diary in old))
+            check('get_archived_diary finds an archived diary',
+                  get_archived_diary(user.id, str(old[0].id)) == expected[old[0].id])
+            check('other users cannot read archived diaries', get_archived_diary(uuid.uuid4(), old[0].id) is None)
+
+            archive.cache.clear()
+            hits = archive.cache.hits
+            load_archived_diaries(user.id, [old[0].id])
+            load_archived_diaries(user.id, [old[1].id])
+            check('rehydrated chunk served from cache', archive.cache.hits == hits + 1)
+
+            ordered = sorted(expected.values(), key=lambda diary: diary['created_at'], reverse=True)
+            per_page = 7
+            pages = [
+                page_diaries(user.id, [Diary.user_id == user.id], [DiaryArchiveEntry.user_id == user.id],
+                             per_page, offset)
+                for offset in range(0, len(ordered), per_page)
+            ]
+            check('list pages merge hot and archived diaries in order',
+                  [diary for page in pages for diary in page] == ordered)
+
+            filtered = page_diaries(
+                user.id, [Diary.user_id == user.id, Diary.image_url.isnot(None)],
+                [DiaryArchiveEntry.user_id == user.id, DiaryArchiveEntry.image_url.isnot(None)], 100, 0
+            )
+            check('filters apply to archived diaries',
+                  {diary['id'] for diary in filtered} == {str(d.id) for d in old if d.image_url})
+
+            target = old[0]
+            check('restore moves a diary back', restore_diaries(user.id, [target.id]) == 1)
+            check('restoring twice is a no-op', restore_diaries(user.id, [target.id]) == 0)
+            restored = Diary.query.filter_by(id=target.id).first()
+            check('restored diary keeps content, images and tags',
+                  restored is not None and restored.to_dict() == expected[target.id])
+
+            chunk = db.session.get(DiaryArchiveChunk, db.session.execute(
+                db.select(DiaryArchiveEntry.chunk_id).where(DiaryArchiveEntry.id == old[1].id)
+            ).scalar())
+            old_key = chunk.storage_key
+            check('compaction rewrites a chunk with restored diaries', compact_chunk(chunk.id) == old_key)
+            archive.storage.delete(old_key)
+            archive.cache.clear()
+            check('compacted chunk still serves remaining diaries',
+                  load_archived_diaries(user.id, [old[1].id]).get(old[1].id) == expected[old[1].id])
+        finally:
+            db.session.rollback()
+            app.extensions['diary_archive'] = previous
+            shutil.rmtree(root, ignore_errors=True)
+
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+変更通知（LISTEN/NOTIFY → ワーカー内の購読者のキュー）の動作確認（ローカルのPostgreSQLを使う）
+
+ChangeListener を起動して購読し、publish_change で通知して
+- コミットした通知は購読者のキューに届く（別のユーザーの購読者には届かない）
+- ロールバックした通知は届かない
+- 購読者数の上限を超えた購読は拒否され、スレッド数に応じて上限が制限される
+- 読み出しが追いつかないキューは再取得の合図に置き換えられる
+- 購読者がいなくなると受信スレッドが終了する
+を確認する（通知するだけでテーブルには書き込まない）
+想定と異なる動作があれば終了コード1で終了する
+
+使い方:
+    python check_events.py [--timeout 5]
+"""
+import argparse
+import queue
+import sys
+import time
+import uuid
+from app import app
+from models import db
+from utils.events import ChangeListener, limit_subscribers, publish_change
+
+def drain(events):
+    items = []
+    while True:
+        try:
+            items.append(events.get_nowait())
+        except queue.Empty:
+            return items
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise LISTEN/NOTIFY change events against local PostgreSQL')
+    parser.add_argument('--timeout', type=float, default=5.0, help='Seconds to wait for a notification')
+    args = parser.parse_args()
+
+    problems = []
+
+    def check(name, condition, detail=''):
+        print(f"{'✓' if condition else '✗'} {name}{': ' + detail if detail else ''}")
+        if not condition:
+            problems.append(name)
+
+    with app.app_context():
+        listener = ChangeListener(app.config['SQLALCHEMY_DATABASE_URI'], max_subscribers=2, queue_size=3)
+        user_id, other_id = str(uuid.uuid4()), str(uuid.uuid4())
+        events = listener.subscribe(user_id)
+        other = listener.subscribe(other_id)
+        try:
+            # 受信スレッドが LISTEN を始めるまで通知を送り直す
+            deadline = time.monotonic() + args.timeout
+            ready = False
+            while not ready and time.monotonic() < deadline:
+                publish_change(user_id, 'probe', 'ping')
+                db.session.commit()
+                try:
+                    ready = events.get(timeout=0.2)['entity'] == 'probe'
+                except queue.Empty:
+                    pass
+            check('listener receives notifications', ready)
+            time.sleep(0.5)
+            drain(events)
+            drain(other)
+
+            diary_id = uuid.uuid4()
+            publish_change(user_id, 'diary', 'created', diary_id, pet_id='p1')
+            db.session.commit()
+            try:
+                event = events.get(timeout=args.timeout)
+            except queue.Empty:
+                event = None
+            check('committed change reaches the subscriber',
+                  event == {'user_id': user_id, 'entity': 'diary', 'action': 'created', 'id': str(diary_id),
+                            'pet_id': 'p1'}, str(event))
+            check("other users' subscribers are not notified", drain(other) == [])
+
+            publish_change(user_id, 'diary', 'deleted', uuid.uuid4())
+            db.session.rollback()
+            try:
+                event = events.get(timeout=1)
+            except queue.Empty:
+                event = None
+            check('rolled-back change is not delivered', event is None, str(event))
+
+            check('subscribers over the limit are rejected', listener.subscribe(str(uuid.uuid4())) is None)
+            # gunicorn の threads=4 なら上限は1に制限される
+            previous = app.extensions['change_listener']
+            app.extensions['change_listener'] = listener
+            try:
+                check('limit follows worker threads', limit_subscribers(app, 4) == 1)
+            finally:
+                app.extensions['change_listener'] = previous
+                listener.max_subscribers = 2
+
+            for _ in range(listener.queue_size + 2):
+                publish_change(user_id, 'pet', 'updated', uuid.uuid4())
+            db.session.commit()
+            time.sleep(1)
+            received = drain(events)
+            check('slow subscriber gets a resync',
+                  {'entity': 'all', 'action': 'resync'} in received and len(received) <= listener.queue_size,
+                  f"{len(received)} events")
+        finally:
+            db.session.rollback()
+            listener.unsubscribe(user_id, events)
+            listener.unsubscribe(other_id, other)
+
+        thread = listener._thread
+        if thread is not None:
+            thread.join(timeout=10)
+        check('listener thread stops without subscribers', thread is None or not thread.is_alive())
+
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
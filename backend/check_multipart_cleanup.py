@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+放置されたマルチパートアップロードの中止の動作確認
+
+既定ではプロセス内のS3の代わり（マルチパートアップロードの一覧・中止・パートの一覧のみ）を使う
+--endpoint-url を指定した場合はそのS3互換サーバー（MinIOなど）のバケットにアップロードを作成して確認する
+（バケット内の古い未完了アップロードはすべて中止されるため、確認専用のバケットを使うこと）
+
+テスト用のユーザーとアップロードの行を投入し（中止処理がコミットするため実際に保存する）、
+- 開始・最終更新とも古いアップロードは S3 で中止され、DBも中止済みになる
+- 開始は古いが最近パートの署名を発行したアップロードは中止されない
+- DBに記録のない古いアップロードは中止される
+- S3 に存在しない放置されたアップロードの行は中止済みになる
+- ドライランでは何も変更しない
+を確認し、最後にテスト用のユーザーを削除する
+想定と異なる動作があれば終了コード1で終了する
+
+使い方:
+    python check_multipart_cleanup.py [--endpoint-url http://localhost:9000 --bucket <bucket>]
+"""
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from app import app
+from models import db, User, MultipartUpload
+from utils.s3_multipart import cleanup_abandoned_uploads
+
+class StandInS3:
+    """S3のマルチパートアップロードAPIの代わり（ローカルの確認用）"""
+
+    class exceptions:
+        class NoSuchUpload(Exception):
+            pass
+
+    def __init__(self):
+        self.uploads = {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {'Key': Key, 'UploadId': upload_id, 'Initiated': datetime.now(timezone.utc)}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        if self.uploads.pop(UploadId, None) is None:
+            raise self.exceptions.NoSuchUpload(UploadId)
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        if UploadId not in self.uploads:
+            raise self.exceptions.NoSuchUpload(UploadId)
+        return {'Parts': []}
+
+    def get_paginator(self, operation):
+        assert operation == 'list_multipart_uploads'
+        return self
+
+    def paginate(self, Bucket):
+        # ページをまたぐ場合も確認できるよう2件ずつ返す
+        uploads = list(self.uploads.values())
+        for i in range(0, max(len(uploads), 1), 2):
+            yield {'Uploads': [dict(upload) for upload in uploads[i:i + 2]]}
+
+def pending_upload_ids(s3_client, bucket):
+    return {
+        upload['UploadId']
+        for page in s3_client.get_paginator('list_multipart_uploads').paginate(Bucket=bucket)
+        for upload in page.get('Uploads', [])
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise abandoned multipart upload cleanup')
+    parser.add_argument('--endpoint-url', help='S3-compatible server to use instead of the in-process stand-in')
+    parser.add_argument('--bucket', default='multipart-cleanup-check', help='Dedicated bucket on the S3-compatible server')
+    args = parser.parse_args()
+
+    problems = []
+
+    def check(name, condition, detail=''):
+        print(f"{'✓' if condition else '✗'} {name}{': ' + detail if detail else ''}")
+        if not condition:
+            problems.append(name)
+
+    if args.endpoint_url:
+        import boto3
+        s3_client = boto3.client('s3', endpoint_url=args.endpoint_url)
+    else:
+        s3_client = StandInS3()
+    bucket = args.bucket
+    prefix = f"uploads/multipart-check-{uuid.uuid4().hex}"
+    keys = {name: f"{prefix}/{name}.mp4" for name in ('stale', 'active', 'untracked', 'missing', 'fresh')}
+
+    with app.app_context():
+        user = User(id=uuid.uuid4(), cognito_sub=f"multipart-check-{uuid.uuid4()}", email='multipart@example.com',
+                    username='multipart-check')
+        db.session.add(user)
+        db.session.commit()
+        ids = {}
+        try:
+            ids.update({
+                name: s3_client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+                for name, key in keys.items() if name not in ('missing', 'fresh')
+            })
+            ids['missing'] = uuid.uuid4().hex
+            time.sleep(1)
+            cutoff = datetime.now(timezone.utc)
+            time.sleep(1)
+            ids['fresh'] = s3_client.create_multipart_upload(Bucket=bucket, Key=keys['fresh'])['UploadId']
+
+            # active は開始は cutoff より前だが、最近パートの署名を発行している
+            updated = {
+                'stale': cutoff - timedelta(hours=1), 'active': cutoff + timedelta(hours=1),
+                'missing': cutoff - timedelta(hours=1), 'fresh': cutoff + timedelta(hours=1)
+            }
+            rows = {
+                name: MultipartUpload(user_id=user.id, s3_key=keys[name], s3_upload_id=ids[name],
+                                      part_size=5 * 1024 * 1024, created_at=at, updated_at=at)
+                for name, at in updated.items()
+            }
+            db.session.add_all(rows.values())
+            db.session.commit()
+            row_ids = {name: row.id for name, row in rows.items()}
+
+            def statuses():
+                db.session.expire_all()
+                return {name: db.session.get(MultipartUpload, row_id).status for name, row_id in row_ids.items()}
+
+            summary = cleanup_abandoned_uploads(s3_client, bucket, cutoff, dry_run=True, log=lambda message: None)
+            pending = pending_upload_ids(s3_client, bucket)
+            check('dry-run leaves S3 uploads', all(upload_id in pending for name, upload_id in ids.items()
+                                                   if name != 'missing'))
+            check('dry-run leaves DB rows', set(statuses().values()) == {'in_progress'}, str(summary))
+
+            summary = cleanup_abandoned_uploads(s3_client, bucket, cutoff, log=lambda message: None)
+            pending = pending_upload_ids(s3_client, bucket)
+            status = statuses()
+            check('stale tracked upload aborted', ids['stale'] not in pending and status['stale'] == 'aborted')
+            check('resumable upload with recent parts kept',
+                  ids['active'] in pending and status['active'] == 'in_progress')
+            check('untracked old upload aborted', ids['untracked'] not in pending)
+            check('recently initiated upload kept', ids['fresh'] in pending and status['fresh'] == 'in_progress')
+            check('stale row missing from S3 marked aborted', status['missing'] == 'aborted')
+            check('summary counts', (summary['aborted'], summary['marked'], summary['active'], summary['missing'],
+                                     summary['errors']) == (2, 1, 1, 1, 0), str(summary))
+
+            summary = cleanup_abandoned_uploads(s3_client, bucket, cutoff, log=lambda message: None)
+            check('second run is a no-op', (summary['aborted'], summary['missing']) == (0, 0), str(summary))
+        finally:
+            db.session.rollback()
+            for name in ('active', 'fresh'):
+                if name in ids:
+                    try:
+                        s3_client.abort_multipart_upload(Bucket=bucket, Key=keys[name], UploadId=ids[name])
+                    except Exception:
+                        pass
+            db.session.execute(db.delete(User).where(User.id == user.id))
+            db.session.commit()
+
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
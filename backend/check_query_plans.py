@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+ホットなクエリの実行計画の回帰チェック
+
+1. モデルで宣言したインデックスがDBに存在するか確認（--create-missing で作成）
+2. 1つのトランザクション内で実運用に近い件数のデータを投入し（古い日記はアーカイブの索引へ移す）ANALYZE
+3. 各クエリ（一覧はルートと同じ page_query・_diary_list_filters で組み立てる）の
+   EXPLAIN (ANALYZE, BUFFERS) を取得し、使用するインデックス・
+   禁止するノード・読み取りバッファ数の上限を検証
+4. ロールバックして投入したデータを破棄
+
+想定と異なる実行計画があれば終了コード1で終了する（CIでの実行を想定）
+
+使い方:
+    python check_query_plans.py [--users 2000] [--pets-per-user 2] [--diaries-per-pet 50]
+                                [--create-missing] [--dump-plans DIR]
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select, text
+from sqlalchemy.schema import CreateIndex
+from app import app
+from models import db, User, Pet, Diary, DiaryArchiveEntry
+from routes.diaries import _diary_list_filters
+from utils.archive import count_archived, page_query
+
+SEED_PREFIX = 'plan-check-'
+
+def check_declared_indexes(conn, create_missing=False):
+    """
+    モデルで宣言したインデックスのうちDBに存在しないものを返す
+
+    create_missing の場合は CREATE INDEX CONCURRENTLY で作成する
+    """
+    existing = {row[0] for row in conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+    ))}
+    missing = [
+        index for table in db.metadata.sorted_tables for index in table.indexes
+        if index.name not in existing
+    ]
+    if create_missing:
+        # CONCURRENTLY はトランザクション外で実行する必要がある
+        conn.rollback()
+        autocommit = conn.execution_options(isolation_level='AUTOCOMMIT')
+        for index in missing:
+            index.dialect_options['postgresql']['concurrently'] = True
+            print(f"Creating index {index.name} ...")
+            autocommit.execute(CreateIndex(index, if_not_exists=True))
+        return []
+    return missing
+
+def seed(conn, users, pets_per_user, diaries_per_pet):
+    """
+    テスト用のユーザー・ペット・日記を一括投入（呼び出し側のトランザクション内）
+    db.create_all() で作成したテーブルにはサーバー側のデフォルト値がないため、idや日時も指定する
+    """
+    conn.execute(text("""
+        INSERT INTO users (id, cognito_sub, email, username, created_at, updated_at)
+        SELECT gen_random_uuid(), :prefix || g, 'user' || g || '@example.com', 'user' || g, now(), now()
+        FROM generate_series(1, :users) AS g
+    """), {'prefix': SEED_PREFIX, 'users': users})
+    conn.execute(text("""
+        INSERT INTO pets (id, user_id, name, created_at, updated_at)
+        SELECT gen_random_uuid(), u.id, 'pet' || g, now(), now()
+        FROM users u CROSS JOIN generate_series(1, :pets) AS g
+        WHERE u.cognito_sub LIKE :prefix || '%'
+    """), {'prefix': SEED_PREFIX, 'pets': pets_per_user})
+    # 日時を過去2年に分散させ、1/4に画像、タグは10種類から1つ付ける
+    conn.execute(text("""
+        INSERT INTO diaries (id, pet_id, user_id, title, content, image_url, tags, created_at, updated_at)
+        SELECT gen_random_uuid(), p.id, p.user_id, 'title', repeat('content ', 20),
+               CASE WHEN g % 4 = 0 THEN 'diary-images/' || g || '.jpg' END, ARRAY['tag' || (g % 10)],
+               now() - random() * interval '730 days', now() - random() * interval '730 days'
+        FROM pets p JOIN users u ON u.id = p.user_id
+        CROSS JOIN generate_series(1, :diaries) AS g
+        WHERE u.cognito_sub LIKE :prefix || '%'
+    """), {'prefix': SEED_PREFIX, 'diaries': diaries_per_pet})
+    # 1年より古い日記はアーカイブの索引に移す（チャンクはユーザーごとに1つのダミー）
+    conn.execute(text("""
+        INSERT INTO diary_archive_chunks (id, user_id, month, storage_key, diary_count, raw_size, compressed_size,
+                                          checksum, created_at)
+        SELECT gen_random_uuid(), u.id, date_trunc('month', now() - interval '2 years')::date,
+               'plan-check/' || u.id, 0, 0, 0, '', now()
+        FROM users u WHERE u.cognito_sub LIKE :prefix || '%'
+    """), {'prefix': SEED_PREFIX})
+    conn.execute(text("""
+        WITH moved AS (
+            DELETE FROM diaries d USING users u
+            WHERE u.id = d.user_id AND u.cognito_sub LIKE :prefix || '%' AND d.created_at < now() - interval '365 days'
+            RETURNING d.id, d.user_id, d.pet_id, d.image_url, d.tags, d.created_at, d.updated_at
+        )
+        INSERT INTO diary_archive_entries (id, user_id, pet_id, chunk_id, image_url, tags, image_urls,
+                                           created_at, updated_at)
+        SELECT m.id, m.user_id, m.pet_id, c.id, m.image_url, m.tags, '{}', m.created_at, m.updated_at
+        FROM moved m JOIN diary_archive_chunks c ON c.user_id = m.user_id
+    """), {'prefix': SEED_PREFIX})
+    for table in ('users', 'pets', 'diaries', 'diary_archive_chunks', 'diary_archive_entries'):
+        conn.execute(text(f"ANALYZE {table}"))
+
+def list_conditions(query_string, model=Diary):
+    """一覧APIと同じ絞り込み条件（routes.diaries._diary_list_filters をクエリパラメータから呼ぶ）"""
+    with app.test_request_context(query_string=query_string):
+        conditions, error = _diary_list_filters(model)
+    if error:
+        raise ValueError(error)
+    return conditions
+
+def list_specs(name, owner, owner_id, filters, require, max_buffers, count_buffers=400, forbid_sort=True):
+    """
+    一覧APIの1ページ（アーカイブあり・なし）と件数のクエリをルートと同じ関数で組み立てる
+
+    owner: 'user'（get_all_diaries）または 'pet'（get_diaries）
+    """
+    hot = [getattr(Diary, f"{owner}_id") == owner_id, *list_conditions(filters)]
+    cold = [getattr(DiaryArchiveEntry, f"{owner}_id") == owner_id, *list_conditions(filters, DiaryArchiveEntry)]
+    archive_index = f"idx_diary_archive_entries_{owner}_id_created_at"
+    sort = ['Sort'] if forbid_sort else []
+    return [
+        {
+            'name': f"{name}: page",
+            'query': page_query(hot, cold, 10, 0),
+            'require': require + ([archive_index] if forbid_sort else []),
+            'forbid': ['Seq Scan:diaries', 'Seq Scan:diary_archive_entries'] + sort,
+            'max_buffers': max_buffers * 2,
+        },
+        {
+            'name': f"{name}: page (archive disabled)",
+            'query': page_query(hot, None, 10, 0),
+            'require': require,
+            'forbid': ['Seq Scan:diaries'] + sort,
+            'max_buffers': max_buffers,
+        },
+        {
+            'name': f"{name}: count",
+            'query': select(func.count(Diary.id)).where(*hot),
+            'require': [],
+            'forbid': ['Seq Scan:diaries'],
+            'max_buffers': count_buffers,
+        },
+        {
+            'name': f"{name}: archived count",
+            'query': count_archived(*cold),
+            'require': [],
+            'forbid': ['Seq Scan:diary_archive_entries'],
+            'max_buffers': count_buffers,
+        },
+    ]
+
+def hot_queries(cognito_sub, user_id, pet_id):
+    """
+    各エンドポイントと同じクエリと期待する実行計画
+
+    require: 使われるべきインデックス名、forbid: 現れてはいけないノード（ノード種別 or ノード種別:テーブル名）、
+    max_buffers: 共有バッファの読み取り数（hit + read）の上限
+    """
+    today = datetime.now(timezone.utc).date()
+    date_range = {'from': (today - timedelta(days=180)).isoformat(), 'to': (today - timedelta(days=90)).isoformat()}
+    diary_count = func.count(Diary.id)
+    return [
+        {
+            'name': 'auth: user lookup',
+            'query': select(User).where(User.cognito_sub == cognito_sub).limit(1),
+            'require': ['users_cognito_sub_key'],
+            'forbid': ['Seq Scan:users'],
+            'max_buffers': 10,
+        },
+        {
+            'name': 'get_pets: pets with diary counts',
+            'query': select(Pet, diary_count).outerjoin(Diary, Diary.pet_id == Pet.id)
+                     .where(Pet.user_id == user_id).group_by(Pet.id).order_by(Pet.created_at.desc()),
+            'require': ['idx_pets_user_id', 'idx_diaries_pet_id_created_at'],
+            'forbid': ['Seq Scan:pets', 'Seq Scan:diaries'],
+            'max_buffers': 400,
+        },
+        *list_specs('get_diaries', 'pet', pet_id, {}, ['idx_diaries_pet_id_created_at'], 40, count_buffers=200),
+        *list_specs('get_all_diaries', 'user', user_id, {}, ['idx_diaries_user_id_created_at'], 40),
+        *list_specs('get_all_diaries date range', 'user', user_id, date_range,
+                    ['idx_diaries_user_id_created_at'], 40),
+        *list_specs('get_all_diaries has_image', 'user', user_id, {'has_image': 'true'},
+                    ['idx_diaries_user_id_created_at_with_image'], 40),
+        # ユーザーの日記が少ない場合はユーザーのインデックスで絞ってから確認する方が安いため、
+        # インデックスと並べ替えは指定せず全件走査しないことのみ確認する
+        *list_specs('get_all_diaries tag filter', 'user', user_id, {'tags': 'tag1'}, [], 200,
+                    forbid_sort=False),
+    ]
+
+def _walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk(child)
+
+def explain(conn, query):
+    compiled = query.compile(dialect=conn.dialect)
+    row = conn.exec_driver_sql(
+        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}", compiled.construct_params()
+    ).scalar()
+    plan = row if isinstance(row, list) else json.loads(row)
+    return plan[0]
+
+def check_plan(spec, plan):
+    """期待と異なる点のリストを返す"""
+    nodes = list(_walk(plan['Plan']))
+    used_indexes = {node.get('Index Name') for node in nodes if node.get('Index Name')}
+    node_keys = {node['Node Type'] for node in nodes} | {
+        f"{node['Node Type']}:{node['Relation Name']}" for node in nodes if node.get('Relation Name')
+    }
+    root = plan['Plan']
+    buffers = root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0)
+
+    problems = []
+    for index_name in spec['require']:
+        if index_name not in used_indexes:
+            problems.append(f"index {index_name} not used (used: {sorted(used_indexes) or 'none'})")
+    for forbidden in spec['forbid']:
+        if forbidden in node_keys:
+            problems.append(f"plan contains {forbidden}")
+    if buffers > spec['max_buffers']:
+        problems.append(f"{buffers} shared buffers exceeds budget {spec['max_buffers']}")
+    return problems, buffers, plan.get('Execution Time', 0)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check query plans of hot queries')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--pets-per-user', type=int, default=2)
+    parser.add_argument('--diaries-per-pet', type=int, default=50)
+    parser.add_argument('--create-missing', action='store_true',
+                        help='Create indexes declared in models but missing in the database')
+    parser.add_argument('--dump-plans', metavar='DIR', help='Write each plan as JSON into DIR')
+    args = parser.parse_args()
+
+    failures = 0
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as conn:
+            missing = check_declared_indexes(conn, create_missing=args.create_missing)
+            conn.rollback()
+        for index in missing:
+            failures += 1
+            print(f"✗ missing index {index.name} on {index.table.name} (run with --create-missing)")
+
+        with engine.connect() as conn:
+            transaction = conn.begin()
+            try:
+                seed(conn, args.users, args.pets_per_user, args.diaries_per_pet)
+                cognito_sub = f"{SEED_PREFIX}1"
+                user_id = conn.execute(select(User.id).where(User.cognito_sub == cognito_sub)).scalar()
+                pet_id = conn.execute(select(Pet.id).where(Pet.user_id == user_id).limit(1)).scalar()
+
+                for spec in hot_queries(cognito_sub, user_id, pet_id):
+                    plan = explain(conn, spec['query'])
+                    problems, buffers, elapsed = check_plan(spec, plan)
+                    status = '✗' if problems else '✓'
+                    print(f"{status} {spec['name']}: {buffers} buffers, {elapsed:.2f} ms")
+                    for problem in problems:
+                        print(f"    - {problem}")
+                    failures += bool(problems)
+
+                    if args.dump_plans:
+                        os.makedirs(args.dump_plans, exist_ok=True)
+                        filename = spec['name'].replace(':', '').replace(' ', '_') + '.json'
+                        with open(os.path.join(args.dump_plans, filename), 'w') as f:
+                            json.dump(plan, f, indent=2, default=str)
+            finally:
+                # 投入したデータは保存しない
+                transaction.rollback()
+
+    print(f"\n{failures} problem(s) found" if failures else "\nAll query plans look good")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
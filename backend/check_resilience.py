@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+外部依存の障害時の動作確認（AWSに接続せず、ローカルの障害を起こすスタンドインを使う）
+
+JWKSエンドポイントのスタンドインを起動し、正常 → 遅延 → 5xx → 復旧 と切り替えながら
+タイムアウト・リトライ・サーキットブレーカー・古いキャッシュの返却を確認する
+想定と異なる動作があれば終了コード1で終了する
+
+使い方:
+    python check_resilience.py [--read-timeout 0.5] [--failures 3] [--reset-seconds 2]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from utils.cache import cached_function
+from utils.cognito_cache import JWKSServerError, _fetch_jwks
+from utils.resilience import Dependency, DependencyUnavailable
+
+KEYS = [{'kid': 'stand-in', 'kty': 'RSA'}]
+
+class StandIn(BaseHTTPRequestHandler):
+    """mode に応じて正常応答・遅延・5xx を返すJWKSエンドポイント"""
+
+    mode = 'ok'
+    delay = 2.0
+    requests = 0
+
+    def do_GET(self):
+        StandIn.requests += 1
+        if StandIn.mode == 'slow':
+            time.sleep(StandIn.delay)
+        if StandIn.mode == 'error':
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps({'keys': KEYS}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise timeouts, retries and circuit breakers against a local stand-in')
+    parser.add_argument('--read-timeout', type=float, default=0.5)
+    parser.add_argument('--failures', type=int, default=3, help='Consecutive failures that open the breaker')
+    parser.add_argument('--reset-seconds', type=float, default=2)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/.well-known/jwks.json"
+    StandIn.delay = args.read_timeout * 4
+
+    dependency = Dependency(
+        'jwks-stand-in', connect_timeout=0.5, read_timeout=args.read_timeout, max_attempts=3,
+        failure_threshold=args.failures, reset_timeout=args.reset_seconds, retry_budget_ratio=0.2
+    )
+
+    # TTLを0秒にして毎回取得し、失敗した場合は古い値を返す
+    @cached_function('check_resilience', ttl_seconds=0, stale_seconds=3600)
+    def get_keys():
+        return dependency.call(
+            _fetch_jwks, url, dependency.timeout,
+            retry_on=(requests.RequestException, JWKSServerError)
+        )
+
+    problems = []
+
+    def check(name, condition, detail=''):
+        print(f"{'✓' if condition else '✗'} {name}{': ' + detail if detail else ''}")
+        if not condition:
+            problems.append(name)
+
+    keys = get_keys()
+    check('healthy call returns keys', keys == KEYS)
+
+    StandIn.mode = 'slow'
+    start = time.monotonic()
+    keys = get_keys()
+    elapsed = time.monotonic() - start
+    bound = dependency.max_attempts * (args.read_timeout + dependency.max_delay)
+    check('slow dependency is bounded by timeouts', elapsed < bound, f"{elapsed:.2f}s (bound {bound:.2f}s)")
+    check('stale keys served while slow', keys == KEYS)
+
+    StandIn.mode = 'error'
+    for _ in range(args.failures):
+        get_keys()
+    check('breaker opens after consecutive failures', dependency.breaker.state == 'open',
+          dependency.breaker.state)
+
+    before = StandIn.requests
+    start = time.monotonic()
+    keys = get_keys()
+    check('open breaker fails fast without calling the dependency',
+          StandIn.requests == before and time.monotonic() - start < 0.05,
+          f"{(time.monotonic() - start) * 1000:.1f} ms")
+    check('stale keys served while open', keys == KEYS)
+
+    try:
+        dependency.call(lambda: None)
+        check('open breaker raises DependencyUnavailable', False)
+    except DependencyUnavailable:
+        check('open breaker raises DependencyUnavailable', True)
+
+    StandIn.mode = 'ok'
+    time.sleep(args.reset_seconds)
+    keys = get_keys()
+    check('breaker closes after a successful probe', dependency.breaker.state == 'closed' and keys == KEYS,
+          dependency.breaker.state)
+
+    print(f"\nmetrics: {json.dumps(dependency.metrics())}")
+    server.shutdown()
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+"""
+期限切れの Idempotency-Key の記録を削除（定期実行を想定）
+
+使い方:
+    python cleanup_idempotency_keys.py
+"""
+from app import app
+from models import db
+from utils.idempotency import purge_expired_keys
+
+if __name__ == '__main__':
+    with app.app_context():
+        deleted = purge_expired_keys(db.engine)
+        print(f"Deleted {deleted} expired idempotency keys")
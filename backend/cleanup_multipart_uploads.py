@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+放置されたマルチパートアップロードを中止してパートを削除
+（S3では未完了のパートも課金対象になるため、定期実行を想定）
+
+使い方:
+    python cleanup_multipart_uploads.py [--dry-run] [--hours 24]
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from app import app
+from utils.aws_client import create_s3_client_for_flask
+from utils.s3_multipart import cleanup_abandoned_uploads
+
+def cleanup_multipart_uploads(hours, dry_run=False):
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+
+    with app.app_context():
+        if not app.config['USE_S3']:
+            print("USE_S3 is not enabled. Please set USE_S3=true in .env file")
+            return
+
+        summary = cleanup_abandoned_uploads(
+            create_s3_client_for_flask(app), app.config['S3_BUCKET_NAME'], cutoff, dry_run=dry_run
+        )
+
+        print(f"\nAborted {summary['aborted']} S3 uploads ({summary['marked']} tracked), "
+              f"skipped {summary['active']} active uploads, "
+              f"marked {summary['missing']} tracked uploads missing from S3 as aborted"
+              f"{' (dry-run)' if dry_run else ''}")
+        if summary['errors']:
+            print(f"✗ {summary['errors']} errors")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean up abandoned multipart uploads')
+    parser.add_argument('--hours', type=int, default=app.config['MULTIPART_ABANDON_HOURS'],
+                        help='Abort uploads inactive for longer than this many hours')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be aborted')
+    args = parser.parse_args()
+    cleanup_multipart_uploads(args.hours, dry_run=args.dry_run)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+"""
+保持期間（SYNC_TOMBSTONE_RETENTION_DAYS）を過ぎた削除記録を削除（定期実行を想定）
+これより古い同期トークンのクライアントは全件同期からやり直す
+
+使い方:
+    python cleanup_tombstones.py [--days 30]
+"""
+import argparse
+from app import app
+from models import db
+from utils.sync import purge_tombstones
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Purge old sync tombstones')
+    parser.add_argument('--days', type=int, default=app.config['SYNC_TOMBSTONE_RETENTION_DAYS'],
+                        help='Keep tombstones newer than this many days')
+    args = parser.parse_args()
+    with app.app_context():
+        deleted = purge_tombstones(db.engine, args.days)
+        print(f"Deleted {deleted} tombstones older than {args.days} days")
@@ -43,6 +43,47 @@ def get_database_url():
         # 開発環境: ローカルPostgreSQL
         return os.getenv('DATABASE_URL', 'postgresql://animalog:animalog@db:5432/animalog')
 
+def with_db_driver(url):
+    """DB_DRIVER=psycopg の場合に psycopg 3 を使うURLに変換"""
+    if os.getenv('DB_DRIVER', 'psycopg2') == 'psycopg' and url.startswith('postgresql://'):
+        return 'postgresql+psycopg://' + url[len('postgresql://'):]
+    return url
+
+def get_connect_args():
+    """ドライバごとの接続オプション"""
+    if os.getenv('DB_DRIVER', 'psycopg2') != 'psycopg':
+        return {}
+    # 同じクエリをこの回数実行すると自動でサーバーサイドのプリペアドステートメントにする
+    # （PgBouncerのトランザクションモード等、プリペアドステートメントが使えない場合は none）
+    threshold = os.getenv('DB_PREPARE_THRESHOLD', '5')
+    return {'prepare_threshold': None if threshold.lower() == 'none' else int(threshold)}
+
+def get_dependency_settings():
+    """
+    外部依存ごとのタイムアウト・リトライ・サーキットブレーカーの設定
+    Secrets Manager はConfigの読み込み中に呼ばれるため、Configを経由せず環境変数から直接作る
+    """
+    defaults = {
+        # 名前: (接続タイムアウト秒, 読み取りタイムアウト秒, 最大試行回数)
+        's3': (2, 10, 3),
+        'jwks': (2, 5, 3),
+        'secrets_manager': (2, 5, 3),
+    }
+    settings = {}
+    for name, (connect_timeout, read_timeout, max_attempts) in defaults.items():
+        prefix = name.upper()
+        settings[name] = {
+            'connect_timeout': float(os.getenv(f'{prefix}_CONNECT_TIMEOUT', connect_timeout)),
+            'read_timeout': float(os.getenv(f'{prefix}_READ_TIMEOUT', read_timeout)),
+            'max_attempts': int(os.getenv(f'{prefix}_MAX_ATTEMPTS', max_attempts)),
+            # 連続でこの回数失敗したらオープンし、RESET秒後に1回だけ試す
+            'failure_threshold': int(os.getenv(f'{prefix}_BREAKER_FAILURES', 5)),
+            'reset_timeout': float(os.getenv(f'{prefix}_BREAKER_RESET_SECONDS', 30)),
+            # リトライは呼び出し数のこの割合まで（障害時にリトライで負荷が増幅しないように）
+            'retry_budget_ratio': float(os.getenv('RETRY_BUDGET_RATIO', 0.2)),
+        }
+    return settings
+
 def validate_config():
     """重要な環境変数が設定されているかチェック"""
     required_vars = ['FLASK_APP']
@@ -81,6 +122,13 @@ def validate_config():
         if missing_s3:
             raise ValueError(f"S3モードではこれらの変数が必要です: {', '.join(missing_s3)}")
         
+        # 署名付きCookie方式の場合はCloudFront関連の変数をチェック
+        if os.getenv('IMAGE_ACCESS_MODE', 'presigned') == 'cloudfront_cookie':
+            cf_vars = ['CLOUDFRONT_DOMAIN', 'CLOUDFRONT_KEY_PAIR_ID', 'CLOUDFRONT_PRIVATE_KEY']
+            missing_cf = [var for var in cf_vars if not os.getenv(var)]
+            if missing_cf:
+                raise ValueError(f"署名付きCookieモードではこれらの変数が必要です: {', '.join(missing_cf)}")
+        
         # AWS認証情報の確認（IAMロール使用時は不要）
         if not os.getenv('AWS_ACCESS_KEY_ID') and not os.getenv('AWS_SECRET_ACCESS_KEY'):
             print("警告: AWS認証情報が設定されていません。S3アクセス用のIAMロールが設定されていることを確認してください。")
@@ -90,7 +138,9 @@ class Config:
     DEBUG = os.getenv('FLASK_ENV', 'development') == 'development'
     
     # データベース設定
-    SQLALCHEMY_DATABASE_URI = get_database_url()
+    # DB_DRIVER: psycopg2（デフォルト）/ psycopg（psycopg 3: プリペアドステートメントとパイプラインを使用）
+    DB_DRIVER = os.getenv('DB_DRIVER', 'psycopg2')
+    SQLALCHEMY_DATABASE_URI = with_db_driver(get_database_url())
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = os.getenv('SQLALCHEMY_ECHO', 'false').lower() == 'true'
     
@@ -100,15 +150,34 @@ class Config:
         'pool_recycle': 3600,   # 1時間で接続を再作成
         'pool_timeout': 30,     # 接続取得のタイムアウト
         'max_overflow': 10,     # 最大オーバーフロー接続数
-        'pool_size': 5          # 基本接続プールサイズ
+        'pool_size': 5,         # 基本接続プールサイズ
+        'connect_args': get_connect_args()
     }
     
+    # リードレプリカ設定（カンマ区切りのURL、未設定の場合はプライマリのみ）
+    DATABASE_REPLICA_URLS = [with_db_driver(url.strip()) for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))  # 書き込み後にプライマリから読む秒数
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_HEALTH_CHECK_INTERVAL = float(os.getenv('REPLICA_HEALTH_CHECK_INTERVAL', 5))
+    
     # AWS S3
     USE_S3 = os.getenv('USE_S3', 'false').lower() == 'true'
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
     AWS_REGION = os.getenv('AWS_REGION', 'ap-northeast-1')
     S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
+    # S3互換のローカルサーバー（MinIO等）を使う場合のみ設定
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+    
+    # 画像アクセス方式
+    # presigned: 画像ごとにS3署名付きURLを発行（デフォルト）
+    # cloudfront_cookie: ユーザーごとにCloudFront署名付きCookieを1つ発行し、画像URLは固定
+    IMAGE_ACCESS_MODE = os.getenv('IMAGE_ACCESS_MODE', 'presigned')
+    CLOUDFRONT_DOMAIN = os.getenv('CLOUDFRONT_DOMAIN')
+    CLOUDFRONT_KEY_PAIR_ID = os.getenv('CLOUDFRONT_KEY_PAIR_ID')
+    CLOUDFRONT_PRIVATE_KEY = os.getenv('CLOUDFRONT_PRIVATE_KEY')  # PEM文字列またはファイルパス
+    CLOUDFRONT_COOKIE_DOMAIN = os.getenv('CLOUDFRONT_COOKIE_DOMAIN')  # 例: .example.com
+    CLOUDFRONT_COOKIE_TTL = int(os.getenv('CLOUDFRONT_COOKIE_TTL', 12 * 3600))
     
     # Cognito設定（SPAパブリッククライアント用）
     USE_COGNITO = os.getenv('USE_COGNITO', 'false').lower() == 'true'
@@ -123,6 +192,114 @@ class Config:
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', '/workspace/uploads')
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    # メディア配信設定
+    # 一意なファイル名なので長期キャッシュ可能（デフォルト1年）
+    MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 31536000))
+    # 設定するとnginxのinternal locationへX-Accel-Redirectでオフロード（例: /protected-uploads/）
+    MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+    # 署名付きアップロード（S3への直接アップロード）の設定
+    MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 16 * 1024 * 1024))  # POSTポリシーのサイズ上限
+    UPLOAD_BATCH_MAX_FILES = int(os.getenv('UPLOAD_BATCH_MAX_FILES', 10))
+    # 孤立画像GC: アップロード後この時間が経過するまでは未参照でも削除しない
+    IMAGE_GC_GRACE_HOURS = int(os.getenv('IMAGE_GC_GRACE_HOURS', 24))
+    # マルチパートアップロード（大きな画像・動画用）の設定
+    MULTIPART_ALLOWED_EXTENSIONS = ALLOWED_EXTENSIONS | {'mp4', 'mov', 'webm'}
+    MULTIPART_PART_SIZE = int(os.getenv('MULTIPART_PART_SIZE', 8 * 1024 * 1024))  # 8MB（S3の下限は5MB）
+    MULTIPART_MAX_SIZE = int(os.getenv('MULTIPART_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+    MULTIPART_PRESIGN_BATCH_SIZE = int(os.getenv('MULTIPART_PRESIGN_BATCH_SIZE', 100))
+    MULTIPART_ABANDON_HOURS = int(os.getenv('MULTIPART_ABANDON_HOURS', 24))
+    
+    # diariesを月次パーティションで運用する場合に先行して作成しておく月数
+    PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+    
+    # 投稿カレンダー・統計の日付の区切りに使うタイムゾーン
+    STATS_TIMEZONE = os.getenv('STATS_TIMEZONE', 'Asia/Tokyo')
+    
+    # 古い日記のアーカイブ設定（作成・更新からこの日数が経過した日記をユーザー・月ごとに圧縮して保存）
+    ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'false').lower() == 'true'
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 365))
+    ARCHIVE_STORAGE = os.getenv('ARCHIVE_STORAGE', 'local')  # local / s3
+    ARCHIVE_LOCAL_DIR = os.getenv('ARCHIVE_LOCAL_DIR', '/workspace/archive')
+    ARCHIVE_S3_PREFIX = os.getenv('ARCHIVE_S3_PREFIX', 'archive/diaries/')
+    ARCHIVE_CHUNK_MAX_DIARIES = int(os.getenv('ARCHIVE_CHUNK_MAX_DIARIES', 1000))  # 1チャンクあたりの日記数の上限
+    ARCHIVE_COMPRESSION_LEVEL = int(os.getenv('ARCHIVE_COMPRESSION_LEVEL', 10))  # zstdの圧縮レベル（1〜22）
+    ARCHIVE_CACHE_CHUNKS = int(os.getenv('ARCHIVE_CACHE_CHUNKS', 32))  # 展開したチャンクをワーカーごとに保持する数
+    
+    # ダッシュボードで返す日記数の上限
+    DASHBOARD_MAX_DIARIES = int(os.getenv('DASHBOARD_MAX_DIARIES', 50))
+    
+    # エクスポート設定（サーバーサイドカーソルの1バッチあたりの行数）
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    
+    # 一括インポート設定
+    BULK_IMPORT_MAX_ITEMS = int(os.getenv('BULK_IMPORT_MAX_ITEMS', 10000))
+    BULK_IMPORT_CHUNK_SIZE = int(os.getenv('BULK_IMPORT_CHUNK_SIZE', 500))
+    
+    # 一覧APIの1ページあたりの件数の上限（クライアントの指定に関わらず適用）
+    MAX_PER_PAGE = int(os.getenv('MAX_PER_PAGE', 100))
+
+    # レート制限設定（トークンバケット: RATEは1秒あたりの補充数、BURSTはバケットの容量）
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_IP_RATE = float(os.getenv('RATE_LIMIT_IP_RATE', 20))
+    RATE_LIMIT_IP_BURST = float(os.getenv('RATE_LIMIT_IP_BURST', 100))
+    RATE_LIMIT_USER_RATE = float(os.getenv('RATE_LIMIT_USER_RATE', 10))
+    RATE_LIMIT_USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', 50))
+    # クライアントとの間にあるプロキシの段数（docker-compose の nginx のみは1、ALB + nginx は2、直接公開は0）
+    RATE_LIMIT_PROXY_COUNT = int(os.getenv('RATE_LIMIT_PROXY_COUNT', 1))
+    # 設定するとワーカー間でバケットを共有（例: redis://localhost:6379/0、redisパッケージが必要）
+    RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+    # エンドポイント分類ごとのワーカー内の同時実行数（分類名:上限 のカンマ区切り）
+    RATE_LIMIT_CONCURRENCY = os.getenv('RATE_LIMIT_CONCURRENCY', 'export:1,bulk:1,upload:4')
+    RATE_LIMIT_ENDPOINT_CLASSES = {
+        'diaries.export_diaries': 'export',
+        'diaries.bulk_create_diaries': 'bulk',
+        'uploads.initiate_multipart_upload': 'upload',
+        'uploads.presign_multipart_parts': 'upload',
+        'uploads.complete_multipart': 'upload',
+    }
+
+    # 差分同期（/api/sync）の設定
+    SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))  # 1回で返す日記の上限
+    SYNC_CLOCK_SKEW_SECONDS = int(os.getenv('SYNC_CLOCK_SKEW_SECONDS', 30))  # 次回の同期で重ねて確認する秒数
+    SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+    # 変更通知（Server-Sent Events）の設定
+    # ワーカーごとの同時接続数の上限（接続ごとにスレッドを占有するため gunicorn の threads // 4 までに制限される）
+    EVENTS_MAX_SUBSCRIBERS = int(os.getenv('EVENTS_MAX_SUBSCRIBERS', 8))
+    EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+    EVENTS_MAX_STREAM_SECONDS = int(os.getenv('EVENTS_MAX_STREAM_SECONDS', 300))  # この時間で切断しクライアントが再接続
+
+    # Idempotency-Key の設定
+    IDEMPOTENCY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_TTL_HOURS', 24))  # レスポンスを保持する時間
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 10))  # 処理中の同一リクエストを待つ上限
+
+    # 遅いSQLの記録設定
+    SLOW_QUERY_ENABLED = os.getenv('SLOW_QUERY_ENABLED', 'false').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+    SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+    SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', 1.0))  # ログに出す割合（0.0〜1.0）
+    SLOW_QUERY_LOGS_PER_MINUTE = float(os.getenv('SLOW_QUERY_LOGS_PER_MINUTE', 10))
+    SLOW_QUERY_TOP_N = int(os.getenv('SLOW_QUERY_TOP_N', 20))
+    # /api/debug/slow-queries の X-Debug-Token（未設定の場合はエンドポイントを公開しない）
+    SLOW_QUERY_ACCESS_TOKEN = os.getenv('SLOW_QUERY_ACCESS_TOKEN')
+
+    # 外部依存（S3・Cognito JWKS・Secrets Manager）の呼び出し設定
+    # 環境変数は S3_CONNECT_TIMEOUT, JWKS_READ_TIMEOUT, SECRETS_MANAGER_BREAKER_FAILURES のように依存名を前に付ける
+    DEPENDENCY_SETTINGS = get_dependency_settings()
+    # 障害の注入（FAULT_INJECTION、開発・検証環境用）は utils/resilience.py が環境変数から直接読む
+    # /api/debug/dependencies の X-Debug-Token（未設定の場合はエンドポイントを公開しない）
+    DEPENDENCY_METRICS_TOKEN = os.getenv('DEPENDENCY_METRICS_TOKEN')
+
+    # ヘルスチェック設定（/readyz の依存確認はこの間隔でバックグラウンドで実行）
+    HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', 10))
+    # SIGTERM を受けてから停止するまで /readyz で draining を返す秒数（gunicorn の --graceful-timeout より短くする）
+    HEALTH_DRAIN_SECONDS = float(os.getenv('HEALTH_DRAIN_SECONDS', 15))
+
+    # パフォーマンス計測設定
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_SLOW_THRESHOLD_MS = float(os.getenv('PROFILING_SLOW_THRESHOLD_MS', 1000))
+    PROFILING_CPROFILE_SAMPLE_RATE = float(os.getenv('PROFILING_CPROFILE_SAMPLE_RATE', 0))  # 0.0〜1.0
+    PROFILING_CPROFILE_DIR = os.getenv('PROFILING_CPROFILE_DIR', '/tmp/animalog-profiles')
     
     # 開発用モックユーザー設定
     MOCK_USER_ID = os.getenv('MOCK_USER_ID', 'test-user-123')
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+どの日記からも参照されていないS3上の画像を削除
+
+使い方:
+    python gc_orphaned_images.py [--execute] [--grace-hours 24]
+
+--execute を指定しない場合はドライラン（削除候補の表示のみ）
+"""
+import argparse
+from app import app
+from models import db
+from utils.aws_client import create_s3_client_for_flask
+from utils.image_gc import collect_orphaned_images
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete S3 images not referenced by any diary')
+    parser.add_argument('--execute', action='store_true', help='Actually delete orphaned images (default: dry-run)')
+    parser.add_argument('--grace-hours', type=int, default=app.config['IMAGE_GC_GRACE_HOURS'],
+                        help='Never delete objects newer than this many hours')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not app.config['USE_S3']:
+            print("USE_S3 is not enabled. Please set USE_S3=true in .env file")
+            return 1
+
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_url_prefix = f"https://{bucket_name}.s3.{app.config['AWS_REGION']}.amazonaws.com/"
+
+        summary = collect_orphaned_images(
+            db.engine,
+            create_s3_client_for_flask(app),
+            bucket_name,
+            s3_url_prefix,
+            grace_hours=args.grace_hours,
+            dry_run=not args.execute
+        )
+
+    print("\n" + "=" * 50)
+    print(f"Mode:            {'execute' if args.execute else 'dry-run'}")
+    print(f"Scanned objects: {summary['scanned']}")
+    print(f"Referenced:      {summary['referenced']}")
+    print(f"Too recent:      {summary['too_recent']}")
+    print(f"Orphans:         {summary['orphans']} ({summary['orphan_bytes'] / 1024 / 1024:.1f} MB)")
+    print(f"Deleted:         {summary['deleted']}")
+    print(f"Errors:          {summary['errors']}")
+    return 1 if summary['errors'] else 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,30 @@
+"""
+gunicorn の設定ファイル（作業ディレクトリから自動的に読み込まれる）
+--preload でアプリケーションを読み込んだ場合のフォーク前後のフックと、
+終了時に draining を返すためのシグナルハンドラを登録する
+SSEの購読者数はワーカーのスレッド数に合わせて制限する
+"""
+
+def when_ready(server):
+    """マスターで1回、ワーカーをフォークする前に呼ばれる"""
+    if not server.cfg.preload_app:
+        return
+    from app import app
+    from utils.lifecycle import prepare_for_fork
+    prepare_for_fork(app)
+
+def post_fork(server, worker):
+    """各ワーカーでフォーク直後に呼ばれる"""
+    if not server.cfg.preload_app:
+        return
+    from app import app
+    from utils.lifecycle import reset_after_fork
+    reset_after_fork(app)
+
+def post_worker_init(worker):
+    """各ワーカーでシグナルハンドラの設定とアプリケーションの読み込みの後に呼ばれる"""
+    from app import app
+    from utils.events import limit_subscribers
+    from utils.health import install_drain_handler
+    install_drain_handler(app)
+    limit_subscribers(app, worker.cfg.threads)
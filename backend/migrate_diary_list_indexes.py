@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+既存のDBの日記一覧用インデックスに id DESC を追加（一覧を (created_at DESC, id DESC) で並べるバージョンのデプロイ前後に実行）
+
+diaries とアーカイブの UNION ALL を並べ替えなしでマージするには、両方のインデックスが
+並べ替えのキーをすべて含んでいる必要がある。定義の異なるインデックスは
+新しい定義で {名前}_new を作成し、古いものを削除してから名前を付け替える
+（書き込みを止めないよう CONCURRENTLY。パーティションテーブルの親では使えないため通常の作成・削除）
+
+使い方:
+    python migrate_diary_list_indexes.py
+"""
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+from app import app
+from models import db
+from utils.partitioning import is_partitioned
+
+REBUILT_INDEXES = [
+    'idx_diaries_pet_id_created_at',
+    'idx_diaries_user_id_created_at',
+    'idx_diaries_user_id_created_at_with_image',
+    'idx_diary_archive_entries_user_id_created_at',
+    'idx_diary_archive_entries_pet_id_created_at',
+]
+
+def main():
+    indexes = {
+        index.name: index for table in db.metadata.sorted_tables for index in table.indexes
+        if index.name in REBUILT_INDEXES
+    }
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            # CONCURRENTLY はトランザクション外で実行する必要がある
+            autocommit = conn.execution_options(isolation_level='AUTOCOMMIT')
+            autocommit.execute(text("SET lock_timeout = 0"))
+            for name in REBUILT_INDEXES:
+                index = indexes[name]
+                definition = autocommit.execute(
+                    text("SELECT pg_get_indexdef(to_regclass(:name))"), {'name': name}
+                ).scalar()
+                if definition and ', id DESC)' in definition:
+                    print(f"Index {name} is up to date")
+                    continue
+
+                concurrently = not is_partitioned(autocommit, index.table.name)
+                index.dialect_options['postgresql']['concurrently'] = concurrently
+                create = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+                create = create.replace(f" {name} ON ", f" {name}_new ON ", 1)
+                print(f"Creating index {name}_new ...")
+                autocommit.execute(text(create))
+                if definition:
+                    autocommit.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"))
+                autocommit.execute(text(f"ALTER INDEX {name}_new RENAME TO {name}"))
+                print(f"✓ Rebuilt index {name}")
+
+    print("Done")
+
+if __name__ == '__main__':
+    main()
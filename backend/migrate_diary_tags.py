@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+既存のDBに日記のタグ列と一覧の絞り込み用インデックスを追加（tags 列を使うバージョンのデプロイ前に実行）
+
+1. diaries に tags 列を追加
+   （PostgreSQL 11以降は定数のデフォルト値を持つ列の追加でテーブルを書き換えないため、行数が多くてもすぐに終わる）
+2. モデルで宣言したインデックスのうち存在しないものを作成
+   （書き込みを止めないよう CREATE INDEX CONCURRENTLY。パーティションテーブルの親では使えないため通常の作成）
+
+使い方:
+    python migrate_diary_tags.py [--lock-timeout 5s]
+"""
+import argparse
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+from app import app
+from models import db
+from check_query_plans import check_declared_indexes
+from utils.partitioning import is_partitioned
+
+def main():
+    parser = argparse.ArgumentParser(description='Add diaries.tags and the diary list filter indexes')
+    parser.add_argument('--lock-timeout', default='5s',
+                        help='Give up instead of queueing behind long transactions while altering the table')
+    args = parser.parse_args()
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT set_config('lock_timeout', :timeout, false)"), {'timeout': args.lock_timeout})
+            conn.execute(text("ALTER TABLE diaries ADD COLUMN IF NOT EXISTS tags TEXT[] NOT NULL DEFAULT '{}'"))
+            conn.commit()
+            print("Column diaries.tags is present")
+
+            missing = check_declared_indexes(conn)
+            partitioned = {index.table.name: is_partitioned(conn, index.table.name) for index in missing}
+            conn.rollback()
+
+            # CONCURRENTLY はトランザクション外で実行する必要がある
+            autocommit = conn.execution_options(isolation_level='AUTOCOMMIT')
+            autocommit.execute(text("SET lock_timeout = 0"))
+            for index in missing:
+                index.dialect_options['postgresql']['concurrently'] = not partitioned[index.table.name]
+                print(f"Creating index {index.name} ...")
+                autocommit.execute(CreateIndex(index, if_not_exists=True))
+
+    print("Done")
+
+if __name__ == '__main__':
+    main()
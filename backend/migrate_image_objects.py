@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+既存のDBの image_objects に last_used_at 列を追加（重複排除で再利用した画像を削除しないためのバージョンのデプロイ前に実行）
+
+既存の行は追加した時刻が入るため、追加から猶予期間（IMAGE_GC_GRACE_HOURS）の間は孤立画像GCで削除されない
+（PostgreSQL 11以降は定数のデフォルト値を持つ列の追加でテーブルを書き換えないため、すぐに終わる）
+
+使い方:
+    python migrate_image_objects.py [--lock-timeout 5s]
+"""
+import argparse
+from sqlalchemy import text
+from app import app
+from models import db
+
+def main():
+    parser = argparse.ArgumentParser(description='Add image_objects.last_used_at')
+    parser.add_argument('--lock-timeout', default='5s',
+                        help='Give up instead of queueing behind long transactions while altering the table')
+    args = parser.parse_args()
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT set_config('lock_timeout', :timeout, false)"), {'timeout': args.lock_timeout})
+            conn.execute(text(
+                "ALTER TABLE image_objects ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMP WITH TIME ZONE "
+                "DEFAULT CURRENT_TIMESTAMP"
+            ))
+            conn.commit()
+            print("Column image_objects.last_used_at is present")
+
+    print("Done")
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from datetime import datetime
 import uuid
+from utils.db_routing import RoutingSession
 
-db = SQLAlchemy()
+# GETリクエストの読み取りをリードレプリカへ振り分けるセッションを使用
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -29,6 +31,12 @@ class User(db.Model):
 
 class Pet(db.Model):
     __tablename__ = 'pets'
+    # init_db.sql と同じインデックスを宣言（db.create_all() で作成した環境でも同じになるように）
+    __table_args__ = (
+        db.Index('idx_pets_user_id', 'user_id'),
+        # 差分同期（/api/sync）で変更のあったペットを取得するためのインデックス
+        db.Index('idx_pets_user_id_updated_at', 'user_id', 'updated_at'),
+    )
     
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
@@ -43,7 +51,11 @@ class Pet(db.Model):
     # リレーションシップ
     diaries = db.relationship('Diary', backref='pet', lazy='dynamic', cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, diary_count=None):
+        # diary_countが集計済みで渡された場合はCOUNTクエリを省略
+        if diary_count is None:
+            diary_count = self.diaries.count() + DiaryArchiveEntry.query.filter_by(pet_id=self.id).count()
+        
         return {
             'id': str(self.id),
             'name': self.name,
@@ -52,11 +64,15 @@ class Pet(db.Model):
             'birth_date': self.birth_date.isoformat() if self.birth_date else None,
             'description': self.description,
             'created_at': self.created_at.isoformat(),
-            'diary_count': self.diaries.count()
+            'diary_count': diary_count
         }
 
 class Diary(db.Model):
     __tablename__ = 'diaries'
+    __table_args__ = (
+        # 差分同期（/api/sync）で変更のあった日記を取得するためのインデックス
+        db.Index('idx_diaries_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+    )
     
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     pet_id = db.Column(UUID(as_uuid=True), db.ForeignKey('pets.id'), nullable=False)
@@ -64,24 +80,213 @@ class Diary(db.Model):
     title = db.Column(db.String(200))
     content = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(500))
+    # タグ（一覧の絞り込みに使う。GINインデックスで @> / && を検索）
+    tags = db.Column(ARRAY(db.Text), nullable=False, default=list, server_default='{}')
     created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
     updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # リレーションシップ（一覧取得時のN+1を避けるためselectinで一括ロード）
+    images = db.relationship('DiaryImage', backref='diary', lazy='selectin',
+                             order_by='DiaryImage.position', cascade='all, delete-orphan')
+    
     def to_dict(self):
-        from flask import current_app
-        from utils.s3_url import get_presigned_url
-        
-        # USE_S3が有効な場合、画像URLを署名付きURLに変換
-        image_url = self.image_url
-        if image_url and current_app.config.get('USE_S3', False):
-            image_url = get_presigned_url(image_url)
+        return diary_to_dict(
+            self.id, self.pet_id, self.pet.name, self.title, self.content, self.image_url,
+            [image.image_url for image in self.images], self.tags, self.created_at
+        )
+
+def diary_to_dict(diary_id, pet_id, pet_name, title, content, image_url, image_urls, tags, created_at):
+    """日記のレスポンス（diaries の行とアーカイブから読み出した日記で共通）"""
+    from flask import current_app
+    from utils.s3_url import get_presigned_url, get_presigned_urls
+    
+    # 複数画像はまとめて署名付きURLに変換
+    images = get_presigned_urls(image_urls)
+    
+    # USE_S3が有効な場合、画像URLを署名付きURLに変換
+    # （先頭画像と同じ場合は署名を再利用）
+    if image_urls and image_url == image_urls[0]:
+        image_url = images[0]
+    elif image_url and current_app.config.get('USE_S3', False):
+        image_url = get_presigned_url(image_url)
+    
+    if not images and image_url:
+        images = [image_url]
+    
+    return {
+        'id': str(diary_id),
+        'pet_id': str(pet_id),
+        'pet_name': pet_name,
+        'title': title,
+        'content': content,
+        'image_url': image_url,
+        'images': images,
+        'tags': list(tags or []),
+        'created_at': created_at.isoformat()
+    }
+
+# 日記一覧（ペット別・ユーザー別、新しい順）をソートなしのインデックススキャンで返すためのインデックス
+# 一覧は (created_at DESC, id DESC) で並べてアーカイブとマージするため id も含める
+db.Index('idx_diaries_pet_id_created_at', Diary.pet_id, Diary.created_at.desc(), Diary.id.desc())
+db.Index('idx_diaries_user_id_created_at', Diary.user_id, Diary.created_at.desc(), Diary.id.desc())
+db.Index('idx_diaries_created_at', Diary.created_at.desc())
+# 一覧の絞り込み: 画像ありの日記のみ（部分インデックス）とタグ
+db.Index('idx_diaries_user_id_created_at_with_image', Diary.user_id, Diary.created_at.desc(), Diary.id.desc(),
+         postgresql_where=Diary.image_url.isnot(None))
+db.Index('idx_diaries_tags', Diary.tags, postgresql_using='gin')
+
+class DiaryImage(db.Model):
+    __tablename__ = 'diary_images'
+    
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    diary_id = db.Column(UUID(as_uuid=True), db.ForeignKey('diaries.id', ondelete='CASCADE'), nullable=False, index=True)
+    image_url = db.Column(db.String(500), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+class MultipartUpload(db.Model):
+    __tablename__ = 'multipart_uploads'
+    
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    s3_key = db.Column(db.String(500), nullable=False)
+    s3_upload_id = db.Column(db.String(1024), nullable=False)
+    file_type = db.Column(db.String(100))
+    file_size = db.Column(db.BigInteger)
+    part_size = db.Column(db.Integer, nullable=False)
+    # in_progress / completed / aborted
+    status = db.Column(db.String(20), nullable=False, default='in_progress', index=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def part_count(self):
+        if not self.file_size:
+            return None
+        return -(-self.file_size // self.part_size)
+    
+    def expected_part_size(self, part_number):
+        """パートのバイト数（最後のパート以外は part_size）"""
+        return min(self.part_size, self.file_size - (part_number - 1) * self.part_size)
+    
+    def to_dict(self):
+        from utils.s3 import build_file_url
         
         return {
             'id': str(self.id),
-            'pet_id': str(self.pet_id),
-            'pet_name': self.pet.name,
-            'title': self.title,
-            'content': self.content,
-            'image_url': image_url,
+            'key': self.s3_key,
+            'file_url': build_file_url(self.s3_key),
+            'file_type': self.file_type,
+            'file_size': self.file_size,
+            'part_size': self.part_size,
+            'part_count': self.part_count(),
+            'status': self.status,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+
+class DiaryDailyCount(db.Model):
+    __tablename__ = 'diary_daily_counts'
+    
+    # ペットごと・日ごとの日記数のロールアップ（日記の作成・削除時に増分更新）
+    pet_id = db.Column(UUID(as_uuid=True), db.ForeignKey('pets.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'count': self.count
+        }
+
+
+class ImageObject(db.Model):
+    __tablename__ = 'image_objects'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'content_hash', name='uq_image_objects_user_hash'),
+    )
+    
+    # コンテンツハッシュ（SHA-256）による画像の重複排除インデックスと参照カウント
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    s3_key = db.Column(db.String(500), nullable=False, index=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    # S3上に実在することを確認済みか（未アップロードのまま放置された登録と区別する）
+    verified = db.Column(db.Boolean, nullable=False, default=False)
+    # 最後に重複排除で再利用された日時（この時刻から猶予期間内は参照がなくても削除しない）
+    last_used_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    # Idempotency-Keyヘッダーごとの作成APIのレスポンス（再送時はこれを返す）
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    # 同じキーで異なるリクエストが送られた場合を検出するためのハッシュ
+    request_hash = db.Column(db.String(64), nullable=False)
+    # in_progress / completed
+    status = db.Column(db.String(20), nullable=False, default='in_progress')
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+
+class Tombstone(db.Model):
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('idx_tombstones_user_id_deleted_at', 'user_id', 'deleted_at'),
+    )
+    
+    # 削除されたペット・日記の記録（差分同期でクライアントに削除を伝える）
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    # pet / diary
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(UUID(as_uuid=True), nullable=False)
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+
+class DiaryArchiveChunk(db.Model):
+    __tablename__ = 'diary_archive_chunks'
+    __table_args__ = (
+        db.Index('idx_diary_archive_chunks_user_id_month', 'user_id', 'month'),
+    )
+    
+    # 古い日記をユーザー・月ごとにまとめてzstdで圧縮し、オブジェクトストレージに保存したもの
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # 月の初日（UTC）
+    storage_key = db.Column(db.String(500), nullable=False)
+    diary_count = db.Column(db.Integer, nullable=False)
+    raw_size = db.Column(db.BigInteger, nullable=False)
+    compressed_size = db.Column(db.BigInteger, nullable=False)
+    checksum = db.Column(db.String(64), nullable=False)  # 圧縮後のSHA-256
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+
+class DiaryArchiveEntry(db.Model):
+    __tablename__ = 'diary_archive_entries'
+    
+    # アーカイブした日記の索引（一覧・絞り込み・件数・差分同期はこの行で行い、本文はチャンクから読み出す）
+    id = db.Column(UUID(as_uuid=True), primary_key=True)  # 元の日記のID
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    pet_id = db.Column(UUID(as_uuid=True), db.ForeignKey('pets.id', ondelete='CASCADE'), nullable=False)
+    chunk_id = db.Column(UUID(as_uuid=True), db.ForeignKey('diary_archive_chunks.id'), nullable=False, index=True)
+    # 一覧の絞り込み（has_image・tags）は diaries と同じ列名・同じ条件で行う
+    image_url = db.Column(db.String(500))
+    tags = db.Column(ARRAY(db.Text), nullable=False, default=list, server_default='{}')
+    # 孤立画像GCが参照を確認するための全画像のURL
+    image_urls = db.Column(ARRAY(db.Text), nullable=False, default=list, server_default='{}')
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+# 一覧（ユーザー別・ペット別、新しい順）と差分同期で diaries と同じ順に読むためのインデックス
+db.Index('idx_diary_archive_entries_user_id_created_at', DiaryArchiveEntry.user_id, DiaryArchiveEntry.created_at.desc(),
+         DiaryArchiveEntry.id.desc())
+db.Index('idx_diary_archive_entries_pet_id_created_at', DiaryArchiveEntry.pet_id, DiaryArchiveEntry.created_at.desc(),
+         DiaryArchiveEntry.id.desc())
+db.Index('idx_diary_archive_entries_user_id_updated_at', DiaryArchiveEntry.user_id, DiaryArchiveEntry.updated_at,
+         DiaryArchiveEntry.id)
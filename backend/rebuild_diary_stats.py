@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""
+日別日記数のロールアップ（diary_daily_counts）をdiariesテーブルから再構築
+
+使い方:
+    python rebuild_diary_stats.py [--pet-id <pet_id>]
+"""
+import argparse
+from app import app
+from models import db
+from utils.diary_stats import rebuild_daily_counts
+
+def rebuild_diary_stats(pet_id=None):
+    with app.app_context():
+        try:
+            rebuild_daily_counts(pet_id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Failed to rebuild diary stats: {e}")
+            return 1
+        target = f"pet {pet_id}" if pet_id else "all pets"
+        print(f"✓ Rebuilt diary stats for {target}")
+        return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild diary_daily_counts from diaries')
+    parser.add_argument('--pet-id', help='Only rebuild the given pet')
+    args = parser.parse_args()
+    exit(rebuild_diary_stats(args.pet_id))
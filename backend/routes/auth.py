@@ -1,5 +1,6 @@
-from flask import Blueprint, jsonify
-from auth import get_current_user
+from flask import Blueprint, jsonify, request
+from auth import get_current_user, login_required
+from utils.cloudfront_signer import is_cookie_mode, set_image_cookies
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -11,8 +12,23 @@ def get_me():
         if not user:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        return jsonify({'user': user.to_dict()})
+        response = jsonify({'user': user.to_dict()})
+        # 署名付きCookie方式の場合、起動時の呼び出しで画像アクセス用Cookieも発行
+        if is_cookie_mode():
+            set_image_cookies(response, user)
+        return response
     except Exception as e:
         from flask import current_app
         current_app.logger.error(f"Error in /api/auth/me: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
+
+@auth_bp.route('/api/auth/image-cookie', methods=['POST'])
+@login_required
+def refresh_image_cookie():
+    """画像アクセス用の署名付きCookieを再発行"""
+    if not is_cookie_mode():
+        return jsonify({'error': 'Cookie image access not configured'}), 400
+    
+    response = jsonify({'message': 'Image cookie issued'})
+    set_image_cookies(response, request.current_user)
+    return response
\ No newline at end of file
@@ -0,0 +1,124 @@
+import hashlib
+import time
+from flask import Blueprint, jsonify, request, current_app
+from auth import login_required
+from models import db, Diary, DiaryArchiveEntry, Pet
+from routes.pets import get_pets_with_counts
+from utils.archive import archive_listed, load_archived_diaries, page_diaries
+from utils.db_pipeline import execute_pipelined
+from utils.s3_url import PRESIGNED_URL_EXPIRES
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+def _signing_epoch():
+    """
+    レスポンスに含む署名付きURLの世代（PRESIGNED_URL_EXPIRES の半分ごとに変わる）
+    304で古いレスポンスを使い続けても、URLの有効期限が半分以上残っている間だけになるようにする
+    （署名付きCookie方式でも users/ 配下以外の画像は署名付きURLのため、S3を使う場合は常に含める）
+    """
+    if not current_app.config['USE_S3']:
+        return 0
+    return int(time.time() // (PRESIGNED_URL_EXPIRES // 2))
+
+def _dashboard_version(user, params):
+    """ユーザーのデータの変更を検出するためのバージョントークンを集計クエリで算出"""
+    user_id = user.id
+    pet_stats = db.select(
+        db.func.count(Pet.id), db.func.max(Pet.updated_at)
+    ).where(Pet.user_id == user_id)
+    diary_stats = db.select(
+        db.func.count(Diary.id), db.func.max(Diary.updated_at)
+    ).where(Diary.user_id == user_id)
+    # アーカイブ・戻し（件数が変わる）とアーカイブした日記の変更も検出する
+    archived_stats = db.select(
+        db.func.count(DiaryArchiveEntry.id), db.func.max(DiaryArchiveEntry.updated_at)
+    ).where(DiaryArchiveEntry.user_id == user_id)
+
+    # 3つの集計は独立しているため1往復で実行
+    (pet_row,), (diary_row,), (archived_row,) = execute_pipelined(pet_stats, diary_stats, archived_stats)
+
+    source = (
+        f"{user_id}:{params}:{user.updated_at}:{tuple(pet_row)}:{tuple(diary_row)}:{tuple(archived_row)}:"
+        f"{_signing_epoch()}"
+    )
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def _latest_diaries_per_pet(user_id, per_pet):
+    """
+    ペットごとの最新の日記（アーカイブした日記を含む）を window 関数で1回のクエリで選んで取得
+
+    Returns:
+        list: (ペットID, 日記の辞書) をペットごとに作成日時の新しい順
+    """
+    hot = db.select(
+        Diary.id, Diary.pet_id, Diary.created_at, db.literal(False).label('archived')
+    ).where(Diary.user_id == user_id)
+    if archive_listed():
+        cold = db.select(
+            DiaryArchiveEntry.id, DiaryArchiveEntry.pet_id, DiaryArchiveEntry.created_at,
+            db.literal(True).label('archived')
+        ).where(DiaryArchiveEntry.user_id == user_id)
+        combined = db.union_all(hot, cold).subquery()
+    else:
+        combined = hot.subquery()
+    row_number = db.func.row_number().over(
+        partition_by=combined.c.pet_id,
+        order_by=(combined.c.created_at.desc(), combined.c.id.desc())
+    ).label('row_number')
+    ranked = db.select(combined, row_number).subquery()
+    rows = db.session.execute(
+        db.select(ranked).where(ranked.c.row_number <= per_pet)
+        .order_by(ranked.c.pet_id, ranked.c.row_number)
+    ).all()
+
+    hot_ids = [row.id for row in rows if not row.archived]
+    diaries = {diary.id: diary.to_dict() for diary in Diary.query.filter(Diary.id.in_(hot_ids))} \
+        if hot_ids else {}
+    archived_ids = [row.id for row in rows if row.archived]
+    if archived_ids:
+        diaries.update(load_archived_diaries(user_id, archived_ids))
+    # 読み出しの間に移動・削除された日記は除く
+    return [(row.pet_id, diaries[row.id]) for row in rows if row.id in diaries]
+
+@dashboard_bp.route('/api/dashboard', methods=['GET'])
+@login_required
+def get_dashboard():
+    """
+    SPA起動時に必要なデータ（ユーザー・ペット・最新の日記）をまとめて取得
+    前回のバージョンが一致する場合は304を返す
+    """
+    max_limit = current_app.config['DASHBOARD_MAX_DIARIES']
+    limit = min(max(request.args.get('limit', 10, type=int), 0), max_limit)
+    per_pet = min(max(request.args.get('per_pet', 0, type=int), 0), max_limit)
+
+    user = request.current_user
+    version = _dashboard_version(user, (limit, per_pet))
+    # ETag（If-None-Match）またはクエリパラメータで前回のバージョンを受け付ける
+    if version in request.if_none_match or request.args.get('version') == version:
+        response = current_app.response_class(status=304)
+        response.set_etag(version)
+        return response
+
+    pets = get_pets_with_counts(user.id)
+
+    # 最新の日記（アーカイブした日記を含む。ペット名はペット一覧の取得でセッションに読み込み済み）
+    archived_conditions = [DiaryArchiveEntry.user_id == user.id] if archive_listed() else None
+    diaries = page_diaries(user.id, [Diary.user_id == user.id], archived_conditions, limit, 0) if limit else []
+
+    result = {
+        'user': user.to_dict(),
+        'pets': [pet.to_dict(diary_count=count) for pet, count in pets],
+        'diaries': diaries,
+        'version': version
+    }
+
+    if per_pet:
+        diaries_by_pet = {str(pet.id): [] for pet, _ in pets}
+        for pet_id, diary in _latest_diaries_per_pet(user.id, per_pet):
+            diaries_by_pet.setdefault(str(pet_id), []).append(diary)
+        result['diaries_by_pet'] = diaries_by_pet
+
+    response = jsonify(result)
+    response.set_etag(version)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
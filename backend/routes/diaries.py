@@ -1,58 +1,324 @@
-from flask import Blueprint, jsonify, request, current_app
+import csv
+import heapq
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
 from auth import login_required
-from models import db, Diary, Pet
-from utils.s3 import generate_presigned_url, delete_file, allowed_file
+from models import db, Diary, DiaryImage, Pet, DiaryArchiveEntry
+from utils.s3 import generate_presigned_url, generate_presigned_uploads, delete_file, allowed_file, build_file_url
+from utils.s3_url import get_presigned_urls, extract_s3_key
+from utils.diary_stats import record_diaries_created, record_diary_deleted
+from utils.image_dedup import normalize_hash, find_existing_image, register_image, acquire_images
+from utils.idempotency import idempotent, commit_deferred
+from utils.sync import record_diary_tombstones
+from utils.events import publish_change
+from utils.db_pipeline import execute_pipelined
+from utils.archive import (
+    archive_listed, count_archived, page_diaries, get_archived_diary, iter_archived_records, restore_diaries
+)
 
 diaries_bp = Blueprint('diaries', __name__)
 
+# タグの上限（1件あたりの数と1つの文字数）
+MAX_TAGS = 20
+MAX_TAG_LENGTH = 50
+# 作成時に事前に検証する文字数（diaries の列の長さ）と1件あたりの画像の数
+MAX_TITLE_LENGTH = 200
+MAX_IMAGE_URL_LENGTH = 500
+MAX_DIARY_IMAGES = 10
+
+def _normalize_tags(value):
+    """
+    タグのリストを検証して正規化（前後の空白を除き、空のものと重複を除く）
+
+    Returns:
+        tuple: (タグのリスト, エラー文)
+    """
+    if value is None:
+        return [], None
+    if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+        return None, 'tags must be a list of strings'
+    tags = list(dict.fromkeys(tag.strip() for tag in value if tag.strip()))
+    if len(tags) > MAX_TAGS:
+        return None, f'Too many tags (max {MAX_TAGS})'
+    if any(len(tag) > MAX_TAG_LENGTH for tag in tags):
+        return None, f'Tags must be at most {MAX_TAG_LENGTH} characters'
+    return tags, None
+
+def _validate_image_urls(image_url, image_urls):
+    """
+    日記の画像URL（image_url と image_urls）を検証
+
+    Returns:
+        tuple: (image_url, image_urls のリスト, エラー文)
+    """
+    image_urls = image_urls or []
+    if not isinstance(image_urls, list) or not all(isinstance(url, str) for url in image_urls):
+        return None, None, 'image_urls must be a list of strings'
+    image_urls = [url for url in image_urls if url]
+    if len(image_urls) > MAX_DIARY_IMAGES:
+        return None, None, f'Too many images (max {MAX_DIARY_IMAGES})'
+    if image_url is not None and not isinstance(image_url, str):
+        return None, None, 'image_url must be a string'
+    image_url = image_url or (image_urls[0] if image_urls else None)
+    if any(len(url) > MAX_IMAGE_URL_LENGTH for url in [image_url or '', *image_urls]):
+        return None, None, f'Image URLs must be at most {MAX_IMAGE_URL_LENGTH} characters'
+    return image_url, image_urls, None
+
+def _parse_time(value):
+    """YYYY-MM-DD またはISO形式の日時（タイムゾーンなしはSTATS_TIMEZONEとして扱う）"""
+    tz = ZoneInfo(current_app.config['STATS_TIMEZONE'])
+    if len(value) == 10:
+        return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=tz)
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=tz)
+
+def _diary_list_filters(model=Diary):
+    """
+    一覧APIの絞り込み条件をクエリパラメータから作成
+    （アーカイブの索引 DiaryArchiveEntry も同じ列名を持つため model で切り替えられる）
+
+      from / to : 作成日時の範囲（YYYY-MM-DD の場合はその日を含む）
+      has_image : true / false（true は部分インデックスを使う）
+      tags      : カンマ区切り（tag を複数指定してもよい）、tags_match=any でいずれかを含むもの
+
+    Returns:
+        tuple: (条件のリスト, エラー文)
+    """
+    args = request.args
+    conditions = []
+    try:
+        if args.get('from'):
+            conditions.append(model.created_at >= _parse_time(args['from']))
+        if args.get('to'):
+            if len(args['to']) == 10:
+                conditions.append(model.created_at < _parse_time(args['to']) + timedelta(days=1))
+            else:
+                conditions.append(model.created_at <= _parse_time(args['to']))
+    except ValueError:
+        return None, 'Invalid date format'
+    
+    has_image = args.get('has_image')
+    if has_image:
+        if has_image.lower() not in ('true', 'false'):
+            return None, 'has_image must be true or false'
+        # 部分インデックスの条件（image_url IS NOT NULL）と同じ形で書く
+        conditions.append(model.image_url.isnot(None) if has_image.lower() == 'true' else model.image_url.is_(None))
+    
+    values = args.getlist('tag') + [tag for value in args.getlist('tags') for tag in value.split(',')]
+    tags, error = _normalize_tags(values)
+    if error:
+        return None, error
+    if tags:
+        match = args.get('tags_match', 'all')
+        if match not in ('all', 'any'):
+            return None, 'tags_match must be all or any'
+        # @>（すべて含む）/ &&（いずれかを含む）はGINインデックスで検索できる
+        conditions.append(model.tags.contains(tags) if match == 'all' else model.tags.overlap(tags))
+    return conditions, None
+
 @diaries_bp.route('/api/pets/<pet_id>/diaries', methods=['GET'])
 @login_required
 def get_diaries(pet_id):
     """特定のペットのすべての日記を取得"""
-    # ペットの所有権を検証
-    pet = Pet.query.filter_by(
-        id=pet_id,
-        user_id=request.current_user.id
-    ).first()
-    
-    if not pet:
+    try:
+        pet_id = uuid.UUID(pet_id)
+    except ValueError:
         return jsonify({'error': 'Pet not found'}), 404
     
     # ページネーションパラメータを取得
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), current_app.config['MAX_PER_PAGE'])
     
-    # 日記をクエリ
-    diaries_query = Diary.query.filter_by(pet_id=pet_id).order_by(Diary.created_at.desc())
-    pagination = diaries_query.paginate(page=page, per_page=per_page, error_out=False)
+    conditions, error = _diary_list_filters()
+    if error:
+        return jsonify({'error': error}), 400
+    archived_conditions = None
+    if archive_listed():
+        archived_filters, _ = _diary_list_filters(DiaryArchiveEntry)
+        archived_conditions = [DiaryArchiveEntry.pet_id == pet_id, *archived_filters]
+    
+    # ペットの所有権の検証と件数の取得は互いに独立しているため1往復で実行
+    statements = [
+        db.select(Pet.id).where(Pet.id == pet_id, Pet.user_id == request.current_user.id),
+        db.select(db.func.count(Diary.id)).where(Diary.pet_id == pet_id, *conditions)
+    ]
+    if archived_conditions is not None:
+        statements.append(count_archived(*archived_conditions))
+    owned, *counts = execute_pipelined(*statements)
+    
+    if not owned:
+        return jsonify({'error': 'Pet not found'}), 404
+    
+    # 日記をクエリ（アーカイブした日記も作成日時の順に含める）
+    total = sum(count[0][0] for count in counts)
+    diaries = page_diaries(
+        request.current_user.id, [Diary.pet_id == pet_id, *conditions], archived_conditions,
+        per_page, (page - 1) * per_page
+    )
     
     return jsonify({
-        'diaries': [diary.to_dict() for diary in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
+        'diaries': diaries,
+        'total': total,
+        'pages': -(-total // per_page),
         'current_page': page
     })
 
 @diaries_bp.route('/api/diaries', methods=['GET'])
 @login_required
 def get_all_diaries():
-    """現在のユーザーのペットのすべての日記を取得"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    """現在のユーザーのペットのすべての日記を取得（期間・画像の有無・タグで絞り込み可能）"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), current_app.config['MAX_PER_PAGE'])
     
-    diaries_query = Diary.query.filter_by(
-        user_id=request.current_user.id
-    ).order_by(Diary.created_at.desc())
+    conditions, error = _diary_list_filters()
+    if error:
+        return jsonify({'error': error}), 400
+    
+    user_id = request.current_user.id
+    hot_conditions = [Diary.user_id == user_id, *conditions]
+    archived_conditions = None
+    if archive_listed():
+        archived_filters, _ = _diary_list_filters(DiaryArchiveEntry)
+        archived_conditions = [DiaryArchiveEntry.user_id == user_id, *archived_filters]
     
-    pagination = diaries_query.paginate(page=page, per_page=per_page, error_out=False)
+    # diaries とアーカイブの件数は互いに独立しているため1往復で実行
+    statements = [db.select(db.func.count(Diary.id)).where(*hot_conditions)]
+    if archived_conditions is not None:
+        statements.append(count_archived(*archived_conditions))
+    total = sum(count[0][0] for count in execute_pipelined(*statements))
+    diaries = page_diaries(user_id, hot_conditions, archived_conditions, per_page, (page - 1) * per_page)
     
     return jsonify({
-        'diaries': [diary.to_dict() for diary in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
+        'diaries': diaries,
+        'total': total,
+        'pages': -(-total // per_page),
         'current_page': page
     })
 
+EXPORT_FIELDS = ['id', 'pet_id', 'pet_name', 'title', 'content', 'image_url', 'created_at']
+
+@diaries_bp.route('/api/diaries/export', methods=['GET'])
+@login_required
+def export_diaries():
+    """現在のユーザーの日記をすべてNDJSONまたはCSVでストリーミング出力"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Invalid format'}), 400
+    
+    include_images = request.args.get('include_images', 'false').lower() == 'true'
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    
+    # ORMオブジェクトを作らず列だけを取得（セッションに溜め込まない）
+    stmt = db.select(
+        Diary.id, Diary.pet_id, Pet.name, Diary.title, Diary.content,
+        Diary.image_url, Diary.created_at
+    ).join(Pet, Diary.pet_id == Pet.id).where(
+        Diary.user_id == request.current_user.id
+    ).order_by(Diary.created_at, Diary.id)
+    
+    def generate_hot_rows():
+        # サーバーサイドカーソルでバッチごとに読み出す
+        result = db.session.execute(
+            stmt.execution_options(stream_results=True, yield_per=batch_size)
+        )
+        try:
+            for batch in result.partitions():
+                image_urls = [row.image_url for row in batch]
+                if include_images:
+                    # 署名付きURLはバッチ単位でまとめて生成
+                    image_urls = get_presigned_urls(image_urls)
+                
+                for row, image_url in zip(batch, image_urls):
+                    yield (row.created_at, row.id), {
+                        'id': str(row.id),
+                        'pet_id': str(row.pet_id),
+                        'pet_name': row.name,
+                        'title': row.title,
+                        'content': row.content,
+                        'image_url': image_url,
+                        'created_at': row.created_at.isoformat()
+                    }
+        finally:
+            result.close()
+    
+    def generate_archived_rows():
+        for batch in iter_archived_records(request.current_user.id, batch_size):
+            image_urls = [record['image_url'] for record, _ in batch]
+            if include_images:
+                image_urls = get_presigned_urls(image_urls)
+            
+            for (record, pet_name), image_url in zip(batch, image_urls):
+                created_at = datetime.fromisoformat(record['created_at'])
+                yield (created_at, uuid.UUID(record['id'])), {
+                    'id': record['id'],
+                    'pet_id': record['pet_id'],
+                    'pet_name': pet_name,
+                    'title': record['title'],
+                    'content': record['content'],
+                    'image_url': image_url,
+                    'created_at': created_at.isoformat()
+                }
+    
+    def generate_rows():
+        # どちらも (created_at, id) の順なのでマージして全体の順序を保つ
+        for _, item in heapq.merge(generate_hot_rows(), generate_archived_rows(), key=lambda pair: pair[0]):
+            yield item
+    
+    def generate_ndjson():
+        for item in generate_rows():
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for i, item in enumerate(generate_rows(), 1):
+            writer.writerow(item)
+            if i % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    if export_format == 'csv':
+        body, mimetype, ext = generate_csv(), 'text/csv', 'csv'
+    else:
+        body, mimetype, ext = generate_ndjson(), 'application/x-ndjson', 'ndjson'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename=diaries.{ext}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@diaries_bp.route('/api/diaries/tags', methods=['GET'])
+@login_required
+def get_diary_tags():
+    """現在のユーザーの日記で使われているタグと件数（多い順）"""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    
+    tags = db.union_all(
+        db.select(db.func.unnest(Diary.tags).label('tag')).where(
+            Diary.user_id == request.current_user.id
+        ),
+        db.select(db.func.unnest(DiaryArchiveEntry.tags).label('tag')).where(
+            DiaryArchiveEntry.user_id == request.current_user.id
+        )
+    ).subquery()
+    count = db.func.count().label('count')
+    rows = db.session.execute(
+        db.select(tags.c.tag, count).group_by(tags.c.tag).order_by(count.desc(), tags.c.tag).limit(limit)
+    )
+    
+    return jsonify({'tags': [{'tag': row.tag, 'count': row.count} for row in rows]})
+
 @diaries_bp.route('/api/diaries/<diary_id>', methods=['GET'])
 @login_required
 def get_diary(diary_id):
@@ -63,12 +329,17 @@ def get_diary(diary_id):
     ).first()
     
     if not diary:
-        return jsonify({'error': 'Diary not found'}), 404
+        # アーカイブした日記はチャンクから読み出す
+        archived = get_archived_diary(request.current_user.id, diary_id)
+        if archived is None:
+            return jsonify({'error': 'Diary not found'}), 404
+        return jsonify({'diary': archived})
     
     return jsonify({'diary': diary.to_dict()})
 
 @diaries_bp.route('/api/diaries', methods=['POST'])
 @login_required
+@idempotent
 def create_diary():
     """新しい日記エントリを作成"""
     # JSONデータのみ受け付ける（FormDataは受け付けない）
@@ -88,30 +359,205 @@ def create_diary():
         return jsonify({'error': 'Pet not found'}), 404
     
     # 画像URLの処理（署名付きURL経由でアップロード済み）
-    image_url = data.get('image_url')
+    image_url, image_urls, error = _validate_image_urls(data.get('image_url'), data.get('image_urls'))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    if not isinstance(data['content'], str):
+        return jsonify({'error': 'content must be a string'}), 400
+    title = data.get('title')
+    if title is not None and not isinstance(title, str):
+        return jsonify({'error': 'title must be a string'}), 400
+    if title and len(title) > MAX_TITLE_LENGTH:
+        return jsonify({'error': f'title must be at most {MAX_TITLE_LENGTH} characters'}), 400
+    
+    tags, error = _normalize_tags(data.get('tags'))
+    if error:
+        return jsonify({'error': error}), 400
     
     # 日記エントリを作成
     diary = Diary(
         pet_id=pet.id,
         user_id=request.current_user.id,
-        title=data.get('title'),
+        title=title,
         content=data['content'],
-        image_url=image_url
+        image_url=image_url,
+        tags=tags
     )
+    for position, url in enumerate(image_urls):
+        diary.images.append(DiaryImage(image_url=url, position=position))
     
     db.session.add(diary)
+    db.session.flush()
+    record_diaries_created([diary])
+    acquire_images(request.current_user.id, {image_url, *image_urls} - {None})
+    publish_change(diary.user_id, 'diary', 'created', diary.id, pet_id=str(diary.pet_id))
     db.session.commit()
     
     return jsonify({'diary': diary.to_dict()}), 201
 
-@diaries_bp.route('/api/diaries/<diary_id>', methods=['PUT'])
+def _parse_bulk_items():
+    """JSON配列またはNDJSONのリクエストボディを項目のリストに変換"""
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                # 解析できない行もインデックスを保つためにそのまま残す
+                items.append(None)
+        return items
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('diaries')
+    return data if isinstance(data, list) else None
+
+def _bulk_pet_id(item):
+    """項目の pet_id をUUIDとして解釈（大文字・ハイフンなしの表記も受け付ける。不正な場合はNone）"""
+    pet_id = item.get('pet_id')
+    if not isinstance(pet_id, str):
+        return None
+    try:
+        return uuid.UUID(pet_id)
+    except ValueError:
+        return None
+
+def _validate_bulk_item(item, owned_pet_ids, user_id):
+    """
+    1件分を検証して挿入用の行を返す（エラーの場合は (None, エラー文) ）
+    型・文字数を挿入前に検証し、1件の不正な値でチャンク全体のINSERTが失敗しないようにする
+    """
+    if not isinstance(item, dict):
+        return None, 'Invalid item'
+    if not item.get('pet_id') or not item.get('content'):
+        return None, 'Pet ID and content are required'
+    
+    pet_id = _bulk_pet_id(item)
+    if pet_id is None:
+        return None, 'Invalid pet_id'
+    if pet_id not in owned_pet_ids:
+        return None, 'Pet not found'
+    
+    if not isinstance(item['content'], str):
+        return None, 'content must be a string'
+    title = item.get('title')
+    if title is not None and not isinstance(title, str):
+        return None, 'title must be a string'
+    if title and len(title) > MAX_TITLE_LENGTH:
+        return None, f'title must be at most {MAX_TITLE_LENGTH} characters'
+    image_url, _, error = _validate_image_urls(item.get('image_url'), None)
+    if error:
+        return None, error
+    
+    now = datetime.utcnow()
+    created_at = now
+    if item.get('created_at'):
+        try:
+            created_at = datetime.fromisoformat(item['created_at'])
+        except (TypeError, ValueError):
+            return None, 'Invalid created_at format'
+    
+    tags, error = _normalize_tags(item.get('tags'))
+    if error:
+        return None, error
+    
+    return {
+        'id': uuid.uuid4(),
+        'pet_id': pet_id,
+        'user_id': user_id,
+        'title': title,
+        'content': item['content'],
+        'image_url': image_url or None,
+        'tags': tags,
+        'created_at': created_at,
+        'updated_at': now
+    }, None
+
+@diaries_bp.route('/api/diaries/bulk', methods=['POST'])
 @login_required
-def update_diary(diary_id):
-    """日記エントリを更新"""
+@idempotent
+def bulk_create_diaries():
+    """複数の日記エントリをまとめて作成（JSON配列またはNDJSON）"""
+    items = _parse_bulk_items()
+    if not items:
+        return jsonify({'error': 'A JSON array or NDJSON body is required'}), 400
+    
+    max_items = current_app.config['BULK_IMPORT_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'error': f'Too many items (max {max_items})'}), 400
+    
+    user_id = request.current_user.id
+    
+    # ペットの所有権はpet_idごとに1回だけ、まとめて検証
+    requested_ids = {_bulk_pet_id(item) for item in items if isinstance(item, dict)} - {None}
+    owned_pet_ids = set()
+    if requested_ids:
+        owned_pet_ids = set(db.session.execute(
+            db.select(Pet.id).where(Pet.user_id == user_id, Pet.id.in_(requested_ids))
+        ).scalars())
+    
+    results = [None] * len(items)
+    rows = []
+    for index, item in enumerate(items):
+        row, error = _validate_bulk_item(item, owned_pet_ids, user_id)
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'error': error}
+        else:
+            rows.append((index, row))
+    
+    # チャンクごとに1回のINSERT ... VALUESで挿入し、チャンク単位でコミット
+    # （Idempotency-Key 付きの場合は全体を1つのトランザクションでコミットするため、失敗はセーブポイントまで戻す）
+    chunk_size = current_app.config['BULK_IMPORT_CHUNK_SIZE']
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Diary).values([row for _, row in chunk]))
+                record_diaries_created([row for _, row in chunk])
+                acquire_images(user_id, [row['image_url'] for _, row in chunk if row['image_url']])
+                publish_change(user_id, 'diary', 'bulk_created', count=len(chunk))
+            db.session.commit()
+        except Exception as e:
+            if not commit_deferred():
+                db.session.rollback()
+            current_app.logger.error(f"Bulk diary insert failed: {str(e)}")
+            for index, _ in chunk:
+                results[index] = {'index': index, 'status': 'error', 'error': 'Insert failed'}
+            continue
+        for index, row in chunk:
+            results[index] = {'index': index, 'status': 'created', 'id': str(row['id'])}
+    
+    created = sum(1 for r in results if r['status'] == 'created')
+    return jsonify({
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }), 201 if created else 400
+
+def _find_diary_for_write(diary_id):
+    """更新・削除する日記を取得（アーカイブした日記は diaries に戻してから返す）"""
     diary = Diary.query.filter_by(
         id=diary_id,
         user_id=request.current_user.id
     ).first()
+    if diary is None:
+        try:
+            diary_id = uuid.UUID(str(diary_id))
+        except ValueError:
+            return None
+        if restore_diaries(request.current_user.id, [diary_id]):
+            diary = Diary.query.filter_by(id=diary_id, user_id=request.current_user.id).first()
+    return diary
+
+@diaries_bp.route('/api/diaries/<diary_id>', methods=['PUT'])
+@login_required
+def update_diary(diary_id):
+    """日記エントリを更新"""
+    diary = _find_diary_for_write(diary_id)
     
     if not diary:
         return jsonify({'error': 'Diary not found'}), 404
@@ -123,7 +569,13 @@ def update_diary(diary_id):
         diary.title = data['title']
     if 'content' in data:
         diary.content = data['content']
+    if 'tags' in data:
+        tags, error = _normalize_tags(data['tags'])
+        if error:
+            return jsonify({'error': error}), 400
+        diary.tags = tags
     
+    publish_change(diary.user_id, 'diary', 'updated', diary.id, pet_id=str(diary.pet_id))
     db.session.commit()
     
     return jsonify({'diary': diary.to_dict()})
@@ -132,18 +584,21 @@ def update_diary(diary_id):
 @login_required
 def delete_diary(diary_id):
     """日記エントリを削除"""
-    diary = Diary.query.filter_by(
-        id=diary_id,
-        user_id=request.current_user.id
-    ).first()
+    diary = _find_diary_for_write(diary_id)
     
     if not diary:
         return jsonify({'error': 'Diary not found'}), 404
     
     # 関連する画像がある場合は削除
+    image_urls = {image.image_url for image in diary.images}
     if diary.image_url:
-        delete_file(diary.image_url, user_id=request.current_user.id)
+        image_urls.add(diary.image_url)
+    for image_url in image_urls:
+        delete_file(image_url, user_id=request.current_user.id)
     
+    record_diary_deleted(diary)
+    record_diary_tombstones(request.current_user.id, [diary.id])
+    publish_change(diary.user_id, 'diary', 'deleted', diary.id, pet_id=str(diary.pet_id))
     db.session.delete(diary)
     db.session.commit()
     
@@ -166,8 +621,79 @@ def get_presigned_url():
     if not allowed_file(filename):
         return jsonify({'error': 'Invalid file type'}), 400
     
-    result = generate_presigned_url(filename, file_type, user_id=request.current_user.id)
+    # コンテンツハッシュが指定された場合、同じ画像がアップロード済みならアップロードを省略
+    content_hash = None
+    if data.get('content_hash'):
+        content_hash = normalize_hash(data['content_hash'])
+        if not content_hash:
+            return jsonify({'error': 'Invalid content_hash'}), 400
+        existing_key = find_existing_image(request.current_user.id, content_hash)
+        if existing_key:
+            return jsonify({'exists': True, 'file_url': build_file_url(existing_key)})
+    
+    result = generate_presigned_url(filename, file_type, user_id=request.current_user.id,
+                                    content_hash=content_hash)
     if not result:
         return jsonify({'error': 'Failed to generate upload URL'}), 500
     
-    return jsonify(result)
\ No newline at end of file
+    if content_hash:
+        register_image(request.current_user.id, content_hash, extract_s3_key(result['file_url']))
+        db.session.commit()
+    
+    result['exists'] = False
+    return jsonify(result)
+
+@diaries_bp.route('/api/upload/presigned-urls', methods=['POST'])
+@login_required
+def get_presigned_urls_batch():
+    """複数ファイル分のS3アップロード用署名付きURLをまとめて取得"""
+    if not current_app.config['USE_S3']:
+        return jsonify({'error': 'S3 uploads not configured'}), 400
+    
+    data = request.get_json() or {}
+    files = data.get('files')
+    use_post = bool(data.get('use_post', False))
+    
+    if not files or not isinstance(files, list):
+        return jsonify({'error': 'Files required'}), 400
+    
+    max_files = current_app.config['UPLOAD_BATCH_MAX_FILES']
+    if len(files) > max_files:
+        return jsonify({'error': f'Too many files (max {max_files})'}), 400
+    
+    user_id = request.current_user.id
+    results = [None] * len(files)
+    pending = []
+    for index, f in enumerate(files):
+        if not isinstance(f, dict) or not f.get('filename'):
+            return jsonify({'error': 'Filename required'}), 400
+        if not allowed_file(f['filename']):
+            return jsonify({'error': 'Invalid file type'}), 400
+        if f.get('content_hash'):
+            content_hash = normalize_hash(f['content_hash'])
+            if not content_hash:
+                return jsonify({'error': 'Invalid content_hash'}), 400
+            # 同じ画像がアップロード済みならそのURLを返す
+            existing_key = find_existing_image(user_id, content_hash)
+            if existing_key:
+                results[index] = {'exists': True, 'file_url': build_file_url(existing_key)}
+                continue
+            f = dict(f, content_hash=content_hash)
+        pending.append((index, f))
+    
+    try:
+        uploads = generate_presigned_uploads([f for _, f in pending], user_id=user_id, use_post=use_post)
+    except Exception as e:
+        current_app.logger.error(f"Failed to generate upload URLs: {str(e)}")
+        uploads = None
+    if uploads is None:
+        return jsonify({'error': 'Failed to generate upload URLs'}), 500
+    
+    for (index, f), upload in zip(pending, uploads):
+        upload['exists'] = False
+        results[index] = upload
+        if f.get('content_hash'):
+            register_image(user_id, f['content_hash'], extract_s3_key(upload['file_url']))
+    db.session.commit()
+    
+    return jsonify({'uploads': results})
\ No newline at end of file
@@ -0,0 +1,48 @@
+import json
+import queue
+import time
+from flask import Blueprint, Response, jsonify, request, current_app
+from auth import login_required
+
+events_bp = Blueprint('events', __name__)
+
+@events_bp.route('/api/events', methods=['GET'])
+@login_required
+def stream_events():
+    """
+    現在のユーザーのペット・日記の変更をServer-Sent Eventsで配信
+    一定時間で接続を終了するので、クライアントは再接続する
+    """
+    listener = current_app.extensions['change_listener']
+    user_id = str(request.current_user.id)
+    heartbeat = current_app.config['EVENTS_HEARTBEAT_SECONDS']
+    max_age = current_app.config['EVENTS_MAX_STREAM_SECONDS']
+
+    events = listener.subscribe(user_id)
+    if events is None:
+        response = jsonify({'error': 'Too many subscribers, please retry'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    # stream_with_contextは使わない（配信中にDBセッションとリクエストコンテキストを保持しない）
+    def generate():
+        deadline = time.monotonic() + max_age
+        try:
+            # 接続前の変更は通知されないため、接続直後にクライアントが再取得する合図
+            yield "retry: 3000\nevent: ready\ndata: {}\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    event = events.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: change\ndata: {json.dumps(event)}\n\n"
+        finally:
+            listener.unsubscribe(user_id, events)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginxのバッファリングを無効化してイベントを即座に届ける
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,16 +1,36 @@
+import uuid
 from flask import Blueprint, jsonify, request
 from auth import login_required
-from models import db, Pet
-from datetime import datetime
+from models import db, Pet, Diary, DiaryImage, DiaryDailyCount, DiaryArchiveEntry
+from datetime import datetime, timedelta
+from utils.diary_stats import local_day
+from utils.image_dedup import release_images
+from utils.idempotency import idempotent
+from utils.sync import record_pet_tombstones
+from utils.events import publish_change
+from utils.db_pipeline import execute_pipelined
+from utils.archive import archived_count_for_pet
 
 pets_bp = Blueprint('pets', __name__)
 
+def get_pets_with_counts(user_id):
+    """ユーザーのペットと日記数（アーカイブした日記を含む）を1回のクエリで取得"""
+    diary_count = db.func.count(Diary.id) + archived_count_for_pet()
+    rows = db.session.execute(
+        db.select(Pet, diary_count)
+        .outerjoin(Diary, Diary.pet_id == Pet.id)
+        .where(Pet.user_id == user_id)
+        .group_by(Pet.id)
+        .order_by(Pet.created_at.desc())
+    ).all()
+    return [(pet, count) for pet, count in rows]
+
 @pets_bp.route('/api/pets', methods=['GET'])
 @login_required
 def get_pets():
     """現在のユーザーのすべてのペットを取得"""
-    pets = request.current_user.pets.order_by(Pet.created_at.desc()).all()
-    return jsonify({'pets': [pet.to_dict() for pet in pets]})
+    pets = get_pets_with_counts(request.current_user.id)
+    return jsonify({'pets': [pet.to_dict(diary_count=count) for pet, count in pets]})
 
 @pets_bp.route('/api/pets/<pet_id>', methods=['GET'])
 @login_required
@@ -28,6 +48,7 @@ def get_pet(pet_id):
 
 @pets_bp.route('/api/pets', methods=['POST'])
 @login_required
+@idempotent
 def create_pet():
     """新しいペットを作成"""
     data = request.get_json()
@@ -55,6 +76,8 @@ def create_pet():
     )
     
     db.session.add(pet)
+    db.session.flush()
+    publish_change(pet.user_id, 'pet', 'created', pet.id)
     db.session.commit()
     
     return jsonify({'pet': pet.to_dict()}), 201
@@ -91,6 +114,7 @@ def update_pet(pet_id):
         else:
             pet.birth_date = None
     
+    publish_change(pet.user_id, 'pet', 'updated', pet.id)
     db.session.commit()
     
     return jsonify({'pet': pet.to_dict()})
@@ -107,8 +131,78 @@ def delete_pet(pet_id):
     if not pet:
         return jsonify({'error': 'Pet not found'}), 404
     
-    # ペットを削除（日記はカスケード削除）
+    # 重複排除された画像の参照カウントを戻す（画像自体は孤立画像GCで回収）
+    image_rows = db.session.execute(
+        db.select(Diary.id, Diary.image_url)
+        .where(Diary.pet_id == pet.id, Diary.image_url.isnot(None))
+        .union(
+            db.select(DiaryImage.diary_id, DiaryImage.image_url)
+            .join(Diary, DiaryImage.diary_id == Diary.id)
+            .where(Diary.pet_id == pet.id)
+        )
+        .union(
+            db.select(DiaryArchiveEntry.id, db.func.unnest(DiaryArchiveEntry.image_urls))
+            .where(DiaryArchiveEntry.pet_id == pet.id)
+        )
+    ).all()
+    release_images(request.current_user.id, [image_url for _, image_url in image_rows])
+    
+    # 差分同期のためにペットと日記の削除を記録
+    record_pet_tombstones(pet)
+    publish_change(pet.user_id, 'pet', 'deleted', pet.id)
+    
+    # ペットを削除（日記とアーカイブの索引はカスケード削除、空になったチャンクはアーカイブのジョブで削除）
     db.session.delete(pet)
     db.session.commit()
     
-    return jsonify({'message': 'Pet deleted successfully'})
\ No newline at end of file
+    return jsonify({'message': 'Pet deleted successfully'})
+
+@pets_bp.route('/api/pets/<pet_id>/stats', methods=['GET'])
+@login_required
+def get_pet_stats(pet_id):
+    """ペットの投稿カレンダーと月別統計を取得（日別ロールアップから集計）"""
+    try:
+        pet_id = uuid.UUID(pet_id)
+    except ValueError:
+        return jsonify({'error': 'Pet not found'}), 404
+    
+    # 期間を解析（デフォルトは直近1年）
+    try:
+        to_date = datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+            if request.args.get('to') else local_day(datetime.utcnow())
+        from_date = datetime.strptime(request.args['from'], '%Y-%m-%d').date() \
+            if request.args.get('from') else to_date - timedelta(days=365)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    if from_date > to_date:
+        return jsonify({'error': 'from must be before to'}), 400
+    
+    # ペットの所有権の検証と日別の集計の取得は互いに独立しているため1往復で実行
+    owned, rows = execute_pipelined(
+        db.select(Pet.id).where(Pet.id == pet_id, Pet.user_id == request.current_user.id),
+        db.select(DiaryDailyCount.day, DiaryDailyCount.count).where(
+            DiaryDailyCount.pet_id == pet_id,
+            DiaryDailyCount.day >= from_date,
+            DiaryDailyCount.day <= to_date
+        ).order_by(DiaryDailyCount.day)
+    )
+    
+    if not owned:
+        return jsonify({'error': 'Pet not found'}), 404
+    
+    # 月別の集計は日別の行から組み立てる（最大でも期間の日数分）
+    months = {}
+    for row in rows:
+        month = row.day.strftime('%Y-%m')
+        months[month] = months.get(month, 0) + row.count
+    
+    return jsonify({
+        'pet_id': str(pet_id),
+        'from': from_date.isoformat(),
+        'to': to_date.isoformat(),
+        'days': [{'day': row.day.isoformat(), 'count': row.count} for row in rows],
+        'months': [{'month': month, 'count': count} for month, count in months.items()],
+        'total': sum(row.count for row in rows),
+        'active_days': len(rows)
+    })
\ No newline at end of file
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, jsonify, request, current_app
+from auth import login_required
+from models import db, Diary, Pet, Tombstone
+from utils.sync import InvalidSyncToken, decode_token, encode_token
+from utils.archive import changed_archived_diaries
+
+sync_bp = Blueprint('sync', __name__)
+
+def _changed_pets(user_id, since):
+    query = db.select(Pet).where(Pet.user_id == user_id)
+    if since:
+        query = query.where(Pet.updated_at > since)
+    return db.session.execute(query).scalars().all()
+
+def _deleted_ids(user_id, since):
+    deleted = {'pets': [], 'diaries': []}
+    if since is None:
+        # 初回の全件同期では削除を伝える必要はない
+        return deleted
+    rows = db.session.execute(
+        db.select(Tombstone.entity_type, Tombstone.entity_id)
+        .where(Tombstone.user_id == user_id, Tombstone.deleted_at > since)
+        .order_by(Tombstone.id)
+    ).all()
+    for entity_type, entity_id in rows:
+        deleted['pets' if entity_type == 'pet' else 'diaries'].append(str(entity_id))
+    return deleted
+
+def _changed_diaries(user_id, since, cursor, limit):
+    """
+    (updated_at, id) の順に最大 limit + 1 件
+    アーカイブした日記も同じキーで並べてマージする（アーカイブで削除扱いにはしない）
+
+    Returns:
+        list: (updated_at, id, 日記の辞書)
+    """
+    query = Diary.query.filter(Diary.user_id == user_id)
+    if cursor:
+        query = query.filter(db.tuple_(Diary.updated_at, Diary.id) > db.tuple_(*cursor))
+    elif since:
+        query = query.filter(Diary.updated_at > since)
+    diaries = [
+        (diary.updated_at, diary.id, diary.to_dict())
+        for diary in query.order_by(Diary.updated_at, Diary.id).limit(limit + 1)
+    ]
+    archived = changed_archived_diaries(user_id, since, cursor, limit + 1)
+    return sorted(diaries + archived, key=lambda item: item[:2])[:limit + 1]
+
+@sync_bp.route('/api/sync', methods=['GET'])
+@login_required
+def sync():
+    """
+    前回の同期以降に作成・更新・削除されたペットと日記を取得
+    sinceを省略すると全件を返す。has_moreがtrueの間はnext_tokenで続きを取得する
+    日記にはペット名を、ペットには日記数を含めない（クライアントが同期した日記から求める）
+    """
+    user_id = request.current_user.id
+    token = request.args.get('since')
+    try:
+        state = decode_token(token) if token else {'since': None, 'high': None, 'cursor': None}
+    except InvalidSyncToken:
+        return jsonify({'error': 'Invalid sync token'}), 400
+
+    since, cursor = state['since'], state['cursor']
+    retention = timedelta(days=current_app.config['SYNC_TOMBSTONE_RETENTION_DAYS'])
+    if since and since < datetime.now(timezone.utc) - retention:
+        # 削除記録が残っていないため全件同期からやり直してもらう
+        return jsonify({'error': 'Sync token expired', 'reset': True}), 410
+
+    # 次回のsinceは少し前の時刻にする（コミットが遅れた書き込みやレプリカの遅延を取りこぼさない）
+    # 重複して返る変更はクライアント側で上書きするだけなので問題ない
+    high = state['high']
+    if high is None:
+        skew = timedelta(seconds=current_app.config['SYNC_CLOCK_SKEW_SECONDS'])
+        high = db.session.execute(db.select(db.func.now())).scalar() - skew
+
+    result = {'pets': [], 'deleted': {'pets': [], 'diaries': []}}
+    if cursor is None:
+        # ペットと削除記録は最初のページでまとめて返す
+        # 日記数は返さない（日記の作成・削除・アーカイブではペットの updated_at が変わらず、古い値が残るため）
+        result['pets'] = [
+            {key: value for key, value in pet.to_dict(diary_count=0).items() if key != 'diary_count'}
+            | {'updated_at': pet.updated_at.isoformat()}
+            for pet in _changed_pets(user_id, since)
+        ]
+        result['deleted'] = _deleted_ids(user_id, since)
+
+    page_size = current_app.config['SYNC_PAGE_SIZE']
+    diaries = _changed_diaries(user_id, since, cursor, page_size)
+    has_more = len(diaries) > page_size
+    diaries = diaries[:page_size]
+    # ペット名は返さない（ペットの名前を変更しても日記の updated_at は変わらず、古い名前が残るため）
+    # クライアントは pet_id で同期したペットから名前を引く
+    result['diaries'] = [
+        {key: value for key, value in diary.items() if key != 'pet_name'} | {'updated_at': updated_at.isoformat()}
+        for updated_at, _, diary in diaries
+    ]
+
+    if has_more:
+        last_updated_at, last_id, _ = diaries[-1]
+        next_state = {
+            'since': since.isoformat() if since else None,
+            'high': high.isoformat(),
+            'cursor': [last_updated_at.isoformat(), str(last_id)]
+        }
+    else:
+        next_state = {'since': high.isoformat()}
+
+    result['has_more'] = has_more
+    result['next_token'] = encode_token(next_state)
+    return jsonify(result)
@@ -0,0 +1,188 @@
+from flask import Blueprint, jsonify, request, current_app
+from auth import login_required
+from models import db, MultipartUpload
+from utils.s3 import build_upload_key
+from utils.aws_client import create_s3_client_for_flask
+from utils.s3_multipart import (
+    MAX_PART_NUMBER, create_multipart_upload, presign_part_urls, list_uploaded_parts,
+    verify_uploaded_parts, complete_multipart_upload, abort_multipart_upload, is_invalid_part_error
+)
+
+uploads_bp = Blueprint('uploads', __name__)
+
+def _get_upload(upload_id):
+    """現在のユーザーの進行中のマルチパートアップロードを取得"""
+    try:
+        return MultipartUpload.query.filter_by(
+            id=upload_id,
+            user_id=request.current_user.id
+        ).first()
+    except Exception:
+        db.session.rollback()
+        return None
+
+@uploads_bp.route('/api/upload/multipart', methods=['POST'])
+@login_required
+def initiate_multipart_upload():
+    """マルチパートアップロードを開始"""
+    if not current_app.config['USE_S3']:
+        return jsonify({'error': 'S3 uploads not configured'}), 400
+
+    data = request.get_json() or {}
+    filename = data.get('filename')
+    file_type = data.get('file_type', 'application/octet-stream')
+    file_size = data.get('file_size')
+
+    if not filename:
+        return jsonify({'error': 'Filename required'}), 400
+
+    if '.' not in filename or \
+            filename.rsplit('.', 1)[1].lower() not in current_app.config['MULTIPART_ALLOWED_EXTENSIONS']:
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    if not isinstance(file_size, int) or file_size <= 0:
+        return jsonify({'error': 'file_size is required'}), 400
+    if file_size > current_app.config['MULTIPART_MAX_SIZE']:
+        return jsonify({'error': 'File too large'}), 400
+
+    # パート数がS3の上限を超えないようにパートサイズを調整
+    part_size = max(current_app.config['MULTIPART_PART_SIZE'], -(-file_size // MAX_PART_NUMBER))
+
+    key = build_upload_key(filename, user_id=request.current_user.id)
+    try:
+        s3_upload_id = create_multipart_upload(key, file_type)
+    except Exception as e:
+        current_app.logger.error(f"Failed to initiate multipart upload: {str(e)}")
+        return jsonify({'error': 'Failed to initiate upload'}), 500
+
+    upload = MultipartUpload(
+        user_id=request.current_user.id,
+        s3_key=key,
+        s3_upload_id=s3_upload_id,
+        file_type=file_type,
+        file_size=file_size,
+        part_size=part_size
+    )
+    db.session.add(upload)
+    db.session.commit()
+
+    return jsonify({'upload': upload.to_dict()}), 201
+
+@uploads_bp.route('/api/upload/multipart/<upload_id>/parts', methods=['POST'])
+@login_required
+def presign_multipart_parts(upload_id):
+    """指定したパートのアップロード用署名付きURLをまとめて取得"""
+    upload = _get_upload(upload_id)
+    if not upload or upload.status != 'in_progress':
+        return jsonify({'error': 'Upload not found'}), 404
+
+    data = request.get_json() or {}
+    part_numbers = data.get('part_numbers')
+
+    if not part_numbers or not isinstance(part_numbers, list):
+        return jsonify({'error': 'part_numbers required'}), 400
+    if len(part_numbers) > current_app.config['MULTIPART_PRESIGN_BATCH_SIZE']:
+        return jsonify({'error': 'Too many parts requested'}), 400
+
+    part_count = upload.part_count()
+    for n in part_numbers:
+        if not isinstance(n, int) or n < 1 or n > part_count:
+            return jsonify({'error': f'Invalid part number: {n}'}), 400
+
+    urls = presign_part_urls(
+        upload.s3_key, upload.s3_upload_id, part_numbers,
+        {n: upload.expected_part_size(n) for n in part_numbers}
+    )
+
+    # 放置判定用に最終アクティビティ時刻を更新
+    upload.updated_at = db.func.now()
+    db.session.commit()
+
+    return jsonify({'parts': urls})
+
+@uploads_bp.route('/api/upload/multipart/<upload_id>', methods=['GET'])
+@login_required
+def get_multipart_upload(upload_id):
+    """アップロードの状態とアップロード済みパートを取得（再開用）"""
+    upload = _get_upload(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    parts = []
+    if upload.status == 'in_progress':
+        try:
+            parts = list_uploaded_parts(upload.s3_key, upload.s3_upload_id)
+        except Exception as e:
+            current_app.logger.error(f"Failed to list uploaded parts: {str(e)}")
+            return jsonify({'error': 'Failed to list uploaded parts'}), 500
+
+    return jsonify({'upload': upload.to_dict(), 'parts': parts})
+
+@uploads_bp.route('/api/upload/multipart/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_multipart(upload_id):
+    """マルチパートアップロードを完了"""
+    upload = _get_upload(upload_id)
+    if not upload or upload.status != 'in_progress':
+        return jsonify({'error': 'Upload not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    parts = data.get('parts')
+
+    try:
+        # 宣言したファイルサイズ（MULTIPART_MAX_SIZE で確認済み）と実際のパートのサイズを照合する
+        uploaded = list_uploaded_parts(upload.s3_key, upload.s3_upload_id)
+        if not parts:
+            # パート情報が省略された場合はS3側の記録を使用
+            parts = uploaded
+        if not isinstance(parts, list) or len(parts) != upload.part_count():
+            return jsonify({'error': 'Not all parts have been uploaded'}), 400
+        error, discard = verify_uploaded_parts(upload, parts, uploaded)
+        if error and not discard:
+            return jsonify({'error': error}), 400
+        if error:
+            # 宣言と異なるサイズのアップロードは完了させずに破棄する
+            abort_multipart_upload(
+                create_s3_client_for_flask(current_app), current_app.config['S3_BUCKET_NAME'],
+                upload.s3_key, upload.s3_upload_id
+            )
+            upload.status = 'aborted'
+            db.session.commit()
+            return jsonify({'error': error}), 400
+        complete_multipart_upload(upload.s3_key, upload.s3_upload_id, parts)
+    except (KeyError, TypeError, AttributeError):
+        return jsonify({'error': 'Invalid parts'}), 400
+    except Exception as e:
+        if is_invalid_part_error(e):
+            return jsonify({'error': 'Invalid parts'}), 400
+        current_app.logger.error(f"Failed to complete multipart upload: {str(e)}")
+        return jsonify({'error': 'Failed to complete upload'}), 500
+
+    upload.status = 'completed'
+    db.session.commit()
+
+    return jsonify({'upload': upload.to_dict()})
+
+@uploads_bp.route('/api/upload/multipart/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_multipart(upload_id):
+    """マルチパートアップロードを中止"""
+    upload = _get_upload(upload_id)
+    if not upload or upload.status != 'in_progress':
+        return jsonify({'error': 'Upload not found'}), 404
+
+    try:
+        abort_multipart_upload(
+            create_s3_client_for_flask(current_app),
+            current_app.config['S3_BUCKET_NAME'],
+            upload.s3_key,
+            upload.s3_upload_id
+        )
+    except Exception as e:
+        current_app.logger.error(f"Failed to abort multipart upload: {str(e)}")
+        return jsonify({'error': 'Failed to abort upload'}), 500
+
+    upload.status = 'aborted'
+    db.session.commit()
+
+    return jsonify({'message': 'Upload aborted successfully'})
@@ -0,0 +1,554 @@
+"""
+古い日記のアーカイブ（コールドストレージへの移動と透過的な読み出し）
+作成・更新から ARCHIVE_AFTER_DAYS が経過した日記をユーザー・月ごとにまとめてzstdで圧縮し、
+オブジェクトストレージ（ローカルディレクトリまたはS3）に保存して diaries から削除する
+
+日記ごとに小さな索引の行（diary_archive_entries）を残し、一覧の絞り込み・件数・差分同期・孤立画像GCは
+この行で行う。本文はチャンクを展開して読み出し、展開したチャンクはワーカーごとにLRUで保持する
+アーカイブした日記を更新・削除する場合は diaries に戻してから通常どおり処理する
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from flask import current_app
+from models import db, Diary, DiaryImage, Pet, DiaryArchiveChunk, DiaryArchiveEntry, diary_to_dict
+from .profiling import timed
+
+logger = logging.getLogger(__name__)
+
+# チャンクの形式（読み出し時に確認する）
+CHUNK_FORMAT_VERSION = 1
+
+class ArchiveChunkMissing(Exception):
+    """チャンクのオブジェクトが見つからない"""
+
+class ArchiveChunkCorrupted(Exception):
+    """チャンクのチェックサムまたは形式が一致しない"""
+
+class LocalArchiveStorage:
+    """ローカルディレクトリに保存（開発環境・検証用）"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 読み出し中のワーカーに書きかけのファイルを見せないよう、一時ファイルに書いてから置き換える
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise ArchiveChunkMissing(key)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+class S3ArchiveStorage:
+    """S3_BUCKET_NAME の prefix 以下に保存（タイムアウト・サーキットブレーカーはS3クライアントで適用）"""
+
+    def __init__(self, bucket_name, prefix):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _client(self):
+        from .aws_client import create_s3_client_for_flask
+        return create_s3_client_for_flask(current_app)
+
+    def put(self, key, data):
+        with timed('s3'):
+            self._client().put_object(
+                Bucket=self.bucket_name, Key=self.prefix + key, Body=data, ContentType='application/zstd'
+            )
+
+    def get(self, key):
+        s3_client = self._client()
+        try:
+            with timed('s3'):
+                return s3_client.get_object(Bucket=self.bucket_name, Key=self.prefix + key)['Body'].read()
+        except s3_client.exceptions.NoSuchKey:
+            raise ArchiveChunkMissing(key)
+
+    def delete(self, key):
+        with timed('s3'):
+            self._client().delete_object(Bucket=self.bucket_name, Key=self.prefix + key)
+
+class ChunkCache:
+    """展開したチャンク（日記IDから記録への辞書）のLRUキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, max_chunks):
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            records = self._chunks.get(key)
+            if records is None:
+                self.misses += 1
+                return None
+            self._chunks.move_to_end(key)
+            self.hits += 1
+            return records
+
+    def put(self, key, records):
+        if self.max_chunks <= 0:
+            return
+        with self._lock:
+            self._chunks[key] = records
+            self._chunks.move_to_end(key)
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+
+class DiaryArchive:
+    """アーカイブの保存先と展開済みチャンクのキャッシュ（app.extensions['diary_archive']）"""
+
+    def __init__(self, storage, cache, compression_level):
+        self.storage = storage
+        self.cache = cache
+        self.compression_level = compression_level
+
+def get_archive():
+    return current_app.extensions['diary_archive']
+
+def compress_chunk(payload, level):
+    """
+    チャンクをJSONにしてzstdで圧縮
+
+    Returns:
+        tuple: (圧縮後のバイト列, 圧縮前のサイズ, 圧縮後のSHA-256)
+    """
+    import zstandard
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    data = zstandard.ZstdCompressor(level=level).compress(raw)
+    return data, len(raw), hashlib.sha256(data).hexdigest()
+
+def decompress_chunk(data, checksum):
+    """チェックサムを確認して展開"""
+    import zstandard
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise ArchiveChunkCorrupted('checksum mismatch')
+    payload = json.loads(zstandard.ZstdDecompressor().decompress(data))
+    if payload.get('version') != CHUNK_FORMAT_VERSION:
+        raise ArchiveChunkCorrupted(f"unsupported chunk version {payload.get('version')}")
+    return payload
+
+def _diary_record(diary):
+    """日記をチャンクに保存する記録に変換（diaries に戻すのに必要な列をすべて含む）"""
+    return {
+        'id': str(diary.id),
+        'pet_id': str(diary.pet_id),
+        'user_id': str(diary.user_id),
+        'title': diary.title,
+        'content': diary.content,
+        'image_url': diary.image_url,
+        'images': [image.image_url for image in diary.images],
+        'tags': list(diary.tags or []),
+        'created_at': diary.created_at.isoformat(),
+        'updated_at': diary.updated_at.isoformat()
+    }
+
+def record_to_dict(record, pet_name):
+    """チャンクの記録を日記のレスポンスに変換（diaries の行と同じ形）"""
+    return diary_to_dict(
+        record['id'], record['pet_id'], pet_name, record['title'], record['content'],
+        record['image_url'], record['images'], record['tags'], datetime.fromisoformat(record['created_at'])
+    )
+
+def load_chunk(chunk_id, storage_key, checksum):
+    """
+    チャンクを展開して {日記ID: 記録} を返す（キャッシュ付き）
+    圧縮し直しで保存先が置き換わっていた場合は新しい保存先から読み直す
+    """
+    archive = get_archive()
+    records = archive.cache.get(storage_key)
+    if records is not None:
+        return records
+
+    try:
+        data = archive.storage.get(storage_key)
+    except ArchiveChunkMissing:
+        current = db.session.execute(
+            db.select(DiaryArchiveChunk.storage_key, DiaryArchiveChunk.checksum)
+            .where(DiaryArchiveChunk.id == chunk_id)
+        ).first()
+        if current is None or current.storage_key == storage_key:
+            raise
+        return load_chunk(chunk_id, current.storage_key, current.checksum)
+
+    payload = decompress_chunk(data, checksum)
+    records = {record['id']: record for record in payload['diaries']}
+    archive.cache.put(storage_key, records)
+    return records
+
+def _entry_rows(*conditions):
+    """索引の行とチャンクの保存先・ペット名"""
+    return db.session.execute(
+        db.select(
+            DiaryArchiveEntry.id, DiaryArchiveEntry.chunk_id, DiaryArchiveEntry.created_at,
+            DiaryArchiveEntry.updated_at, DiaryArchiveChunk.storage_key, DiaryArchiveChunk.checksum,
+            Pet.name.label('pet_name')
+        )
+        .join(DiaryArchiveChunk, DiaryArchiveEntry.chunk_id == DiaryArchiveChunk.id)
+        .join(Pet, DiaryArchiveEntry.pet_id == Pet.id)
+        .where(*conditions)
+    ).all()
+
+def load_archived_diaries(user_id, diary_ids):
+    """
+    アーカイブした日記をレスポンスの形で取得
+
+    Returns:
+        dict: {日記ID: 日記の辞書}（見つからないものは含まない）
+    """
+    if not diary_ids:
+        return {}
+    rows = _entry_rows(DiaryArchiveEntry.user_id == user_id, DiaryArchiveEntry.id.in_(diary_ids))
+    result = {}
+    for row in rows:
+        record = load_chunk(row.chunk_id, row.storage_key, row.checksum).get(str(row.id))
+        if record is None:
+            logger.error(f"Archived diary {row.id} is missing from chunk {row.chunk_id}")
+            continue
+        result[row.id] = record_to_dict(record, row.pet_name)
+    return result
+
+def get_archived_diary(user_id, diary_id):
+    """アーカイブした日記を1件取得（見つからない場合はNone）"""
+    try:
+        diary_id = uuid.UUID(str(diary_id))
+    except ValueError:
+        return None
+    return load_archived_diaries(user_id, [diary_id]).get(diary_id)
+
+def count_archived(*conditions):
+    """アーカイブした日記の件数を数えるSELECT（execute_pipelined に渡せる）"""
+    return db.select(db.func.count(DiaryArchiveEntry.id)).where(*conditions)
+
+def archived_count_for_pet():
+    """ペットごとのアーカイブした日記の件数（Pet と相関するスカラーサブクエリ）"""
+    return db.select(db.func.count(DiaryArchiveEntry.id)) \
+        .where(DiaryArchiveEntry.pet_id == Pet.id).scalar_subquery()
+
+def archive_listed():
+    """
+    一覧・件数にアーカイブした日記を含めるか（ARCHIVE_ENABLED）
+    無効の場合は diaries だけを読む（無効にする前に archive_cold_diaries.py --restore-user で戻しておく）
+    """
+    return current_app.config['ARCHIVE_ENABLED']
+
+def page_query(hot_conditions, archived_conditions, limit, offset):
+    """
+    page_diaries で1ページ分の (id, created_at, archived) を選ぶクエリ
+    （archived_conditions が None の場合は diaries のみ）
+
+    (created_at DESC, id DESC) の順はユーザー別・ペット別のインデックスの列順と同じため、
+    diaries とアーカイブのインデックススキャンをソートなしでマージしてLIMIT件で止められる
+    """
+    hot = db.select(Diary.id, Diary.created_at, db.literal(False).label('archived')).where(*hot_conditions)
+    if archived_conditions is None:
+        return hot.order_by(Diary.created_at.desc(), Diary.id.desc()).limit(limit).offset(offset)
+    cold = db.select(
+        DiaryArchiveEntry.id, DiaryArchiveEntry.created_at, db.literal(True).label('archived')
+    ).where(*archived_conditions)
+    combined = db.union_all(hot, cold).subquery()
+    return db.select(combined).order_by(combined.c.created_at.desc(), combined.c.id.desc()) \
+        .limit(limit).offset(offset)
+
+def page_diaries(user_id, hot_conditions, archived_conditions, limit, offset):
+    """
+    diaries とアーカイブを合わせて作成日時の新しい順に1ページ分を取得
+    並べ替えとページングは (id, created_at) だけの UNION ALL で行い、そのページの日記だけを読み出す
+    （archived_conditions が None の場合は diaries のみ）
+
+    Returns:
+        list: 日記の辞書
+    """
+    rows = db.session.execute(page_query(hot_conditions, archived_conditions, limit, offset)).all()
+
+    hot_ids = [row.id for row in rows if not row.archived]
+    diaries = {diary.id: diary.to_dict() for diary in Diary.query.filter(Diary.id.in_(hot_ids))} \
+        if hot_ids else {}
+    archived_ids = [row.id for row in rows if row.archived]
+    if archived_ids:
+        diaries.update(load_archived_diaries(user_id, archived_ids))
+    # 読み出しの間に移動・削除された日記は除く
+    return [diaries[row.id] for row in rows if row.id in diaries]
+
+def changed_archived_diaries(user_id, since, cursor, limit):
+    """
+    差分同期: アーカイブした日記のうち (updated_at, id) がカーソルより後のもの
+
+    Returns:
+        list: (updated_at, id, 日記の辞書) を (updated_at, id) の順に最大 limit 件
+    """
+    query = db.select(DiaryArchiveEntry.updated_at, DiaryArchiveEntry.id).where(DiaryArchiveEntry.user_id == user_id)
+    if cursor:
+        query = query.where(db.tuple_(DiaryArchiveEntry.updated_at, DiaryArchiveEntry.id) > db.tuple_(*cursor))
+    elif since:
+        query = query.where(DiaryArchiveEntry.updated_at > since)
+    rows = db.session.execute(
+        query.order_by(DiaryArchiveEntry.updated_at, DiaryArchiveEntry.id).limit(limit)
+    ).all()
+    diaries = load_archived_diaries(user_id, [row.id for row in rows])
+    return [(row.updated_at, row.id, diaries[row.id]) for row in rows if row.id in diaries]
+
+def iter_archived_records(user_id, batch_size):
+    """
+    エクスポート用: アーカイブした日記を (created_at, id) の順にバッチで読み出す
+    同じ月の日記は同じチャンクにあるため、チャンクはキャッシュから読み出される
+
+    Yields:
+        list: (記録, ペット名) のリスト
+    """
+    last = None
+    while True:
+        conditions = [DiaryArchiveEntry.user_id == user_id]
+        if last is not None:
+            conditions.append(db.tuple_(DiaryArchiveEntry.created_at, DiaryArchiveEntry.id) > db.tuple_(*last))
+        ids = db.session.execute(
+            db.select(DiaryArchiveEntry.id).where(*conditions)
+            .order_by(DiaryArchiveEntry.created_at, DiaryArchiveEntry.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return
+        rows = sorted(_entry_rows(DiaryArchiveEntry.id.in_(ids)), key=lambda row: (row.created_at, row.id))
+        batch = []
+        for row in rows:
+            record = load_chunk(row.chunk_id, row.storage_key, row.checksum).get(str(row.id))
+            if record is not None:
+                batch.append((record, row.pet_name))
+        yield batch
+        last = (rows[-1].created_at, rows[-1].id)
+
+def restore_diaries(user_id, diary_ids):
+    """
+    アーカイブした日記を diaries に戻す（コミットは呼び出し側で行う）
+    索引の行を DELETE ... RETURNING で取得するため、同時に同じ日記を戻しても二重に挿入しない
+
+    Returns:
+        int: 戻した件数
+    """
+    if not diary_ids:
+        return 0
+    entries = db.session.execute(
+        db.delete(DiaryArchiveEntry)
+        .where(DiaryArchiveEntry.user_id == user_id, DiaryArchiveEntry.id.in_(diary_ids))
+        .returning(DiaryArchiveEntry.id, DiaryArchiveEntry.chunk_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not entries:
+        return 0
+
+    chunks = {
+        chunk.id: chunk for chunk in db.session.execute(
+            db.select(DiaryArchiveChunk.id, DiaryArchiveChunk.storage_key, DiaryArchiveChunk.checksum)
+            .where(DiaryArchiveChunk.id.in_({entry.chunk_id for entry in entries}))
+        )
+    }
+    diaries, images = [], []
+    for entry in entries:
+        chunk = chunks[entry.chunk_id]
+        record = load_chunk(chunk.id, chunk.storage_key, chunk.checksum)[str(entry.id)]
+        diaries.append({
+            'id': entry.id,
+            'pet_id': uuid.UUID(record['pet_id']),
+            'user_id': uuid.UUID(record['user_id']),
+            'title': record['title'],
+            'content': record['content'],
+            'image_url': record['image_url'],
+            'tags': record['tags'],
+            'created_at': datetime.fromisoformat(record['created_at']),
+            'updated_at': datetime.fromisoformat(record['updated_at'])
+        })
+        images.extend(
+            {'diary_id': entry.id, 'image_url': url, 'position': position}
+            for position, url in enumerate(record['images'])
+        )
+
+    db.session.execute(db.insert(Diary).values(diaries))
+    if images:
+        db.session.execute(db.insert(DiaryImage).values(images))
+    return len(diaries)
+
+def find_archivable_months(cutoff):
+    """
+    アーカイブ対象の日記があるユーザーと月（UTC）
+
+    Returns:
+        list: (user_id, 月の初日, 件数)
+    """
+    month = db.func.date_trunc('month', db.func.timezone('UTC', Diary.created_at))
+    rows = db.session.execute(
+        db.select(Diary.user_id, month.label('month'), db.func.count().label('count'))
+        .where(Diary.created_at < cutoff, Diary.updated_at < cutoff)
+        .group_by(Diary.user_id, month)
+        .order_by(Diary.user_id, month)
+    ).all()
+    return [(row.user_id, row.month.date(), row.count) for row in rows]
+
+def _next_month(month):
+    return date(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+def archive_month(user_id, month, cutoff, chunk_size):
+    """
+    ユーザーの1か月分の日記を最大 chunk_size 件、1つのチャンクにまとめて移動（コミットは呼び出し側で行う）
+    対象の行は FOR UPDATE SKIP LOCKED で取得し、編集中の日記はスキップする
+
+    Returns:
+        DiaryArchiveChunk: 作成したチャンク（対象がない場合はNone）
+    """
+    archive = get_archive()
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    end = datetime.combine(_next_month(month), datetime.min.time(), tzinfo=timezone.utc)
+    diaries = Diary.query.filter(
+        Diary.user_id == user_id,
+        Diary.created_at >= start, Diary.created_at < end,
+        Diary.created_at < cutoff, Diary.updated_at < cutoff
+    ).order_by(Diary.created_at, Diary.id).limit(chunk_size).with_for_update(skip_locked=True, of=Diary).all()
+    if not diaries:
+        return None
+
+    chunk_id = uuid.uuid4()
+    payload = {
+        'version': CHUNK_FORMAT_VERSION,
+        'user_id': str(user_id),
+        'month': month.isoformat(),
+        'diaries': [_diary_record(diary) for diary in diaries]
+    }
+    data, raw_size, checksum = compress_chunk(payload, archive.compression_level)
+    storage_key = f"{user_id}/{month.strftime('%Y-%m')}/{chunk_id}.json.zst"
+    archive.storage.put(storage_key, data)
+
+    try:
+        chunk = DiaryArchiveChunk(
+            id=chunk_id, user_id=user_id, month=month, storage_key=storage_key,
+            diary_count=len(diaries), raw_size=raw_size, compressed_size=len(data), checksum=checksum
+        )
+        db.session.add(chunk)
+        db.session.flush()
+        db.session.execute(db.insert(DiaryArchiveEntry).values([
+            {
+                'id': diary.id,
+                'user_id': diary.user_id,
+                'pet_id': diary.pet_id,
+                'chunk_id': chunk_id,
+                'image_url': diary.image_url,
+                'tags': list(diary.tags or []),
+                'image_urls': list(dict.fromkeys(
+                    url for url in [diary.image_url, *(image.image_url for image in diary.images)] if url
+                )),
+                'created_at': diary.created_at,
+                'updated_at': diary.updated_at
+            }
+            for diary in diaries
+        ]))
+        # 日別の集計・画像の参照カウントはそのまま（日記は削除されていない）
+        # diary_images はパーティションテーブルでは外部キーのカスケードがないため明示的に削除する
+        diary_ids = [diary.id for diary in diaries]
+        for diary in diaries:
+            db.session.expunge(diary)
+        db.session.execute(
+            db.delete(DiaryImage).where(DiaryImage.diary_id.in_(diary_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            db.delete(Diary).where(Diary.id.in_(diary_ids)).execution_options(synchronize_session=False)
+        )
+    except Exception:
+        archive.storage.delete(storage_key)
+        raise
+    return chunk
+
+def compact_chunk(chunk_id):
+    """
+    戻した・削除した日記が含まれるチャンクを残りの日記だけで作り直す（コミットは呼び出し側で行う）
+    残りがない場合はチャンクの行を削除する
+
+    Returns:
+        str: コミット後に削除する古いオブジェクトのキー（作り直す必要がない場合はNone）
+    """
+    archive = get_archive()
+    chunk = db.session.execute(
+        db.select(DiaryArchiveChunk).where(DiaryArchiveChunk.id == chunk_id).with_for_update()
+    ).scalar_one_or_none()
+    if chunk is None:
+        return None
+    live_ids = set(db.session.execute(
+        db.select(DiaryArchiveEntry.id).where(DiaryArchiveEntry.chunk_id == chunk_id)
+    ).scalars())
+    if len(live_ids) >= chunk.diary_count:
+        return None
+
+    old_key = chunk.storage_key
+    if not live_ids:
+        db.session.delete(chunk)
+        return old_key
+
+    records = load_chunk(chunk.id, chunk.storage_key, chunk.checksum)
+    payload = {
+        'version': CHUNK_FORMAT_VERSION,
+        'user_id': str(chunk.user_id),
+        'month': chunk.month.isoformat(),
+        'diaries': [record for record_id, record in records.items() if uuid.UUID(record_id) in live_ids]
+    }
+    data, raw_size, checksum = compress_chunk(payload, archive.compression_level)
+    new_key = f"{chunk.user_id}/{chunk.month.strftime('%Y-%m')}/{uuid.uuid4()}.json.zst"
+    archive.storage.put(new_key, data)
+    chunk.storage_key = new_key
+    chunk.diary_count = len(payload['diaries'])
+    chunk.raw_size = raw_size
+    chunk.compressed_size = len(data)
+    chunk.checksum = checksum
+    return old_key
+
+def find_compactable_chunks():
+    """索引の行がチャンク作成時より減っているチャンクのID"""
+    live = db.select(db.func.count(DiaryArchiveEntry.id)) \
+        .where(DiaryArchiveEntry.chunk_id == DiaryArchiveChunk.id).scalar_subquery()
+    return db.session.execute(
+        db.select(DiaryArchiveChunk.id).where(live < DiaryArchiveChunk.diary_count)
+    ).scalars().all()
+
+def create_storage(config):
+    """ARCHIVE_STORAGE に応じた保存先"""
+    if config['ARCHIVE_STORAGE'] == 's3':
+        return S3ArchiveStorage(config['S3_BUCKET_NAME'], config['ARCHIVE_S3_PREFIX'])
+    return LocalArchiveStorage(config['ARCHIVE_LOCAL_DIR'])
+
+def init_archive(app):
+    """
+    アーカイブの保存先とキャッシュを登録
+    1件の取得・更新時の戻しは ARCHIVE_ENABLED に関わらず有効（一覧・件数に含めるのは有効な場合のみ）
+
+    Args:
+        app: Flask アプリケーション
+    """
+    app.extensions['diary_archive'] = DiaryArchive(
+        create_storage(app.config),
+        ChunkCache(app.config['ARCHIVE_CACHE_CHUNKS']),
+        app.config['ARCHIVE_COMPRESSION_LEVEL']
+    )
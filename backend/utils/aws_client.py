@@ -2,8 +2,12 @@
 AWS S3クライアント初期化ユーティリティ
 本番環境（IAMロール）と開発環境（明示的クレデンシャル）を自動切り替え
 """
-import boto3
 import os
+import threading
+
+# S3クライアントのプール（boto3クライアントはスレッドセーフなので使い回す）
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
 
 
 def create_s3_client(config=None):
@@ -21,31 +25,45 @@ def create_s3_client(config=None):
         aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
         aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
         aws_region = os.getenv('AWS_REGION', 'ap-northeast-1')
+        endpoint_url = os.getenv('S3_ENDPOINT_URL')
     else:
         # Flask アプリケーション実行時は config から読み取り
         aws_access_key_id = config.get('AWS_ACCESS_KEY_ID')
         aws_secret_access_key = config.get('AWS_SECRET_ACCESS_KEY')
         aws_region = config.get('AWS_REGION', 'ap-northeast-1')
+        endpoint_url = config.get('S3_ENDPOINT_URL')
+    
+    # boto3はS3使用時のみ必要なため遅延インポート（--preload時はフォーク前に読み込み済み）
+    import boto3
+    from .resilience import botocore_config, instrument_boto_client
+    
+    # S3互換のローカルサーバー（MinIO等）を使う場合のみエンドポイントを指定
+    extra_args = {'endpoint_url': endpoint_url} if endpoint_url else {}
+    # タイムアウトとリトライ（全呼び出しにサーキットブレーカーを適用）
+    extra_args['config'] = botocore_config('s3')
     
     # IAMロール使用の判定条件: AWS_ACCESS_KEY_ID が未設定または空
     use_iam = not aws_access_key_id or aws_access_key_id.strip() == ''
     
     if use_iam:
         # 本番環境: IAMロールを使用（クレデンシャル省略）
-        return boto3.client('s3', region_name=aws_region)
+        client = boto3.client('s3', region_name=aws_region, **extra_args)
     else:
         # 開発環境: 明示的クレデンシャルを使用
-        return boto3.client(
+        client = boto3.client(
             's3',
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
-            region_name=aws_region
+            region_name=aws_region,
+            **extra_args
         )
+    return instrument_boto_client(client, 's3')
 
 
 def create_s3_client_for_flask(current_app):
     """
     Flask アプリケーション用のS3クライアント初期化
+    同じ設定のクライアントはプロセス内で1つだけ作成して使い回す
     
     Args:
         current_app: Flask の current_app
@@ -53,7 +71,28 @@ def create_s3_client_for_flask(current_app):
     Returns:
         boto3.client: S3クライアント
     """
-    return create_s3_client(current_app.config)
+    config = current_app.config
+    pool_key = (
+        config.get('AWS_REGION', 'ap-northeast-1'),
+        config.get('AWS_ACCESS_KEY_ID'),
+        config.get('AWS_SECRET_ACCESS_KEY'),
+        config.get('S3_ENDPOINT_URL')
+    )
+    
+    client = _s3_clients.get(pool_key)
+    if client is None:
+        with _s3_clients_lock:
+            client = _s3_clients.get(pool_key)
+            if client is None:
+                client = create_s3_client(config)
+                _s3_clients[pool_key] = client
+    return client
+
+
+def reset_s3_clients():
+    """プールしたクライアントを破棄（フォーク後のワーカーで親の接続を共有しないように）"""
+    with _s3_clients_lock:
+        _s3_clients.clear()
 
 
 def create_s3_client_for_script(config_obj):
@@ -69,6 +108,7 @@ def create_s3_client_for_script(config_obj):
     config_dict = {
         'AWS_ACCESS_KEY_ID': config_obj.AWS_ACCESS_KEY_ID,
         'AWS_SECRET_ACCESS_KEY': config_obj.AWS_SECRET_ACCESS_KEY,
-        'AWS_REGION': config_obj.AWS_REGION
+        'AWS_REGION': config_obj.AWS_REGION,
+        'S3_ENDPOINT_URL': config_obj.S3_ENDPOINT_URL
     }
     return create_s3_client(config_dict)
\ No newline at end of file
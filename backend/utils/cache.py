@@ -2,9 +2,12 @@
 簡易キャッシュシステム
 Secrets ManagerとCognito JWKSのレスポンスをキャッシュして高速化
 """
+import logging
 import time
 import threading
-from typing import Optional, Any, Dict, Callable
+from typing import Optional, Any, Dict, Callable, Tuple
+
+logger = logging.getLogger(__name__)
 
 class SimpleCache:
     """シンプルなインメモリキャッシュ"""
@@ -27,6 +30,14 @@ class SimpleCache:
             
             return entry['value']
     
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """TTLに関係なく値と経過秒数を取得（依存の障害時に古い値を返すため）"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            return entry['value'], time.time() - entry['timestamp']
+    
     def set(self, key: str, value: Any) -> None:
         """キャッシュに値を設定"""
         with self._lock:
@@ -43,13 +54,30 @@ class SimpleCache:
 # グローバルキャッシュインスタンス
 _global_cache = SimpleCache()
 
-def cached_function(cache_key: str, ttl_seconds: int = 300):
-    """関数の戻り値をキャッシュするデコレータ"""
+def cached_function(cache_key: str, ttl_seconds: int = 300, stale_seconds: int = 0):
+    """
+    関数の戻り値をキャッシュするデコレータ
+    stale_seconds を指定すると、関数が失敗した場合にTTL切れからその秒数までは古い値を返す
+    """
     def decorator(func: Callable):
         def wrapper(*args, **kwargs):
             # キャッシュキーを引数から生成
             full_key = f"{cache_key}:{str(args)}:{str(kwargs)}"
             
+            if stale_seconds:
+                entry = _global_cache.get_entry(full_key)
+                if entry is not None and entry[1] <= ttl_seconds:
+                    return entry[0]
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    if entry is not None and entry[1] <= ttl_seconds + stale_seconds:
+                        logger.warning(f"Serving stale {cache_key} ({entry[1]:.0f}s old) after error: {e}")
+                        return entry[0]
+                    raise
+                _global_cache.set(full_key, result)
+                return result
+            
             # キャッシュから取得を試行
             cached_value = _global_cache.get(full_key, ttl_seconds)
             if cached_value is not None:
@@ -65,6 +93,11 @@ def cached_function(cache_key: str, ttl_seconds: int = 300):
         return wrapper
     return decorator
 
+def get_cached_age(cache_key: str, *args, **kwargs) -> Optional[float]:
+    """cached_function でキャッシュした値の経過秒数（キャッシュがない場合はNone）"""
+    entry = _global_cache.get_entry(f"{cache_key}:{str(args)}:{str(kwargs)}")
+    return entry[1] if entry is not None else None
+
 def get_cache_stats() -> Dict[str, Any]:
     """キャッシュの統計情報を取得"""
     with _global_cache._lock:
@@ -0,0 +1,148 @@
+"""
+CloudFront署名付きCookieユーティリティ
+ユーザーごとに users/<id>/* をカバーするポリシーを1つだけ署名し、
+画像URLを安定化（ブラウザキャッシュ可能）させて画像ごとの署名処理をなくす
+"""
+import base64
+import json
+import time
+from flask import current_app
+
+def _cloudfront_b64encode(data):
+    """CloudFront用のURLセーフなBase64（+ → -, = → _, / → ~）"""
+    return base64.b64encode(data).decode('ascii').translate(str.maketrans('+=/', '-_~'))
+
+def _cloudfront_b64decode(value):
+    return base64.b64decode(value.translate(str.maketrans('-_~', '+=/')))
+
+def load_private_key(pem):
+    """PEM文字列（またはファイルパス）から秘密鍵を読み込む"""
+    from cryptography.hazmat.primitives import serialization
+
+    if not pem.lstrip().startswith('-----BEGIN'):
+        with open(pem, 'rb') as f:
+            pem = f.read().decode('ascii')
+    # 環境変数で改行が \n とエスケープされている場合に対応
+    pem = pem.replace('\\n', '\n')
+    return serialization.load_pem_private_key(pem.encode('ascii'), password=None)
+
+def generate_key_pair():
+    """
+    ローカル検証用のRSA鍵ペアを生成
+
+    Returns:
+        tuple: (秘密鍵PEM, 公開鍵PEM)
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('ascii')
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('ascii')
+    return private_pem, public_pem
+
+def build_policy(resource, expires_at):
+    """カスタムポリシーのJSONを生成（空白なしのコンパクト形式）"""
+    policy = {
+        'Statement': [{
+            'Resource': resource,
+            'Condition': {'DateLessThan': {'AWS:EpochTime': int(expires_at)}}
+        }]
+    }
+    return json.dumps(policy, separators=(',', ':')).encode('utf-8')
+
+def sign_policy(policy, private_key):
+    """ポリシーをRSA-SHA1で署名（CloudFrontの仕様）"""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    return private_key.sign(policy, padding.PKCS1v15(), hashes.SHA1())
+
+def verify_signed_policy(encoded_policy, encoded_signature, public_key):
+    """
+    署名付きCookieの値を検証（ローカルでのテスト用）
+
+    Returns:
+        dict: 署名が正しい場合はデコードしたポリシー、不正な場合はNone
+    """
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    policy = _cloudfront_b64decode(encoded_policy)
+    try:
+        public_key.verify(_cloudfront_b64decode(encoded_signature), policy,
+                          padding.PKCS1v15(), hashes.SHA1())
+    except InvalidSignature:
+        return None
+    return json.loads(policy)
+
+def generate_signed_cookies(resource, expires_at, key_pair_id, private_key):
+    """
+    CloudFront署名付きCookieの値を生成
+
+    Args:
+        resource: 対象リソース（ワイルドカード可 例: https://cdn.example.com/users/<id>/*）
+        expires_at: 有効期限（UNIX時刻）
+        key_pair_id: CloudFrontの公開鍵ID
+        private_key: 署名用の秘密鍵
+
+    Returns:
+        dict: Cookie名と値
+    """
+    policy = build_policy(resource, expires_at)
+    return {
+        'CloudFront-Policy': _cloudfront_b64encode(policy),
+        'CloudFront-Signature': _cloudfront_b64encode(sign_policy(policy, private_key)),
+        'CloudFront-Key-Pair-Id': key_pair_id
+    }
+
+def is_cookie_mode():
+    """画像アクセスが署名付きCookie方式かどうか"""
+    return current_app.config.get('IMAGE_ACCESS_MODE') == 'cloudfront_cookie'
+
+def get_cloudfront_url(key):
+    """S3キーに対応する（署名なしの）CloudFront URL"""
+    return f"https://{current_app.config['CLOUDFRONT_DOMAIN']}/{key}"
+
+_private_key = None
+
+def _get_private_key():
+    global _private_key
+    if _private_key is None:
+        _private_key = load_private_key(current_app.config['CLOUDFRONT_PRIVATE_KEY'])
+    return _private_key
+
+def set_image_cookies(response, user):
+    """
+    ユーザーの画像（users/<id>/*）にアクセスするための署名付きCookieをレスポンスに設定
+
+    Returns:
+        int: Cookieの有効期限（UNIX時刻）
+    """
+    ttl = current_app.config['CLOUDFRONT_COOKIE_TTL']
+    expires_at = int(time.time()) + ttl
+    resource = get_cloudfront_url(f"users/{user.id}/*")
+    cookies = generate_signed_cookies(
+        resource, expires_at,
+        current_app.config['CLOUDFRONT_KEY_PAIR_ID'],
+        _get_private_key()
+    )
+    for name, value in cookies.items():
+        response.set_cookie(
+            name, value,
+            max_age=ttl,
+            domain=current_app.config.get('CLOUDFRONT_COOKIE_DOMAIN') or None,
+            path='/',
+            secure=True,
+            httponly=True,
+            samesite='None'
+        )
+    return expires_at
@@ -4,11 +4,27 @@ Cognito JWKS キャッシュ
 """
 import requests
 import logging
-from utils.cache import cached_function
+from utils.cache import cached_function, get_cached_age
+from utils.resilience import get_dependency
 
 logger = logging.getLogger(__name__)
 
-@cached_function('cognito_jwks', ttl_seconds=3600)  # 1時間キャッシュ
+# 1時間キャッシュ（取得できない場合は最大24時間前の鍵を使い続ける）
+JWKS_TTL_SECONDS = 3600
+JWKS_STALE_SECONDS = 24 * 3600
+
+class JWKSServerError(Exception):
+    """JWKSエンドポイントの5xx（リトライ対象）"""
+
+def _fetch_jwks(keys_url, timeout):
+    response = requests.get(keys_url, timeout=timeout)
+    if response.status_code >= 500:
+        raise JWKSServerError(f"JWKS fetch failed with status {response.status_code}")
+    if response.status_code != 200:
+        raise Exception(f"JWKS fetch failed with status {response.status_code}")
+    return response.json()['keys']
+
+@cached_function('cognito_jwks', ttl_seconds=JWKS_TTL_SECONDS, stale_seconds=JWKS_STALE_SECONDS)
 def get_jwks_keys(region: str, user_pool_id: str) -> list:
     """
     Cognito JWKSキーを取得（キャッシュ付き）
@@ -19,21 +35,27 @@ def get_jwks_keys(region: str, user_pool_id: str) -> list:
         
     Returns:
         list: JWKS keys
+        
+    Raises:
+        DependencyUnavailable: 取得に失敗し、使えるキャッシュもない場合
     """
     keys_url = f'https://cognito-idp.{region}.amazonaws.com/{user_pool_id}/.well-known/jwks.json'
     
+    dependency = get_dependency('jwks')
+    
     try:
-        response = requests.get(keys_url, timeout=30)
-        
-        if response.status_code != 200:
-            raise Exception(f"JWKS fetch failed with status {response.status_code}")
-        
-        keys = response.json()['keys']
-        return keys
-        
-    except requests.RequestException as e:
+        # タイムアウト・リトライ・サーキットブレーカー付きで取得
+        return dependency.call(
+            _fetch_jwks, keys_url, dependency.timeout,
+            retry_on=(requests.RequestException, JWKSServerError)
+        )
+    except Exception as e:
         logger.error(f"JWKS fetch failed: {str(e)}")
-        raise Exception(f"Failed to fetch JWKS keys: {str(e)}")
+        raise
+
+def get_jwks_age(region: str, user_pool_id: str):
+    """キャッシュしたJWKSの経過秒数（未取得の場合はNone）"""
+    return get_cached_age('cognito_jwks', region, user_pool_id)
 
 def find_key_by_kid(keys: list, kid: str) -> dict:
     """
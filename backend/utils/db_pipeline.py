@@ -0,0 +1,60 @@
+"""
+互いに依存しない複数のクエリを1往復で実行（psycopg 3 のパイプラインモード）
+psycopg2 の場合は順番に実行する
+"""
+from models import db
+from .profiling import timed
+
+def supports_pipeline(connection):
+    """SQLAlchemyの接続がパイプラインモードを使えるドライバ（psycopg 3）かどうか"""
+    return hasattr(connection.connection.driver_connection, 'pipeline')
+
+def driver_statement(compiled):
+    """
+    コンパイル済みの文からドライバに渡すSQLとパラメータを作成
+    （SQLAlchemyでの実行時と同様に、INリストなどの展開と型ごとのバインド処理を適用する）
+
+    Returns:
+        tuple: (SQL, パラメータの辞書)
+    """
+    state = compiled.construct_expanded_state()
+    escaped = compiled.escaped_bind_names
+    processors = {escaped.get(key, key): processor for key, processor in compiled._bind_processors.items()}
+    processors.update(state.processors)
+    params = {
+        key: processors[key](value) if callable(processors.get(key)) else value
+        for key, value in state.parameters.items()
+    }
+    return state.statement, params
+
+def execute_pipelined(*statements):
+    """
+    Core の SELECT 文をまとめて送信し、それぞれの結果行のリストを返す
+    （ORMのエンティティではなく列の値を取得するクエリに使う）
+
+    Returns:
+        list: 文ごとの結果行のリスト
+    """
+    # 先頭の文でバインド先を決める（GETリクエストではリードレプリカ）
+    connection = db.session.connection(bind_arguments={'clause': statements[0]})
+    if not supports_pipeline(connection):
+        return [connection.execute(statement).all() for statement in statements]
+
+    from psycopg.rows import namedtuple_row
+
+    driver_connection = connection.connection.driver_connection
+    compiled = [statement.compile(dialect=connection.dialect) for statement in statements]
+    cursors = []
+    with timed('db'):
+        try:
+            # パイプライン終了時にまとめて同期され、各カーソルに結果が入る
+            with driver_connection.pipeline():
+                for query in compiled:
+                    # SQLAlchemyのRowと同様に列名でアクセスできるようにする
+                    cursor = driver_connection.cursor(row_factory=namedtuple_row)
+                    cursor.execute(*driver_statement(query))
+                    cursors.append(cursor)
+            return [cursor.fetchall() for cursor in cursors]
+        finally:
+            for cursor in cursors:
+                cursor.close()
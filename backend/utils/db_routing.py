@@ -0,0 +1,180 @@
+"""
+リードレプリカへのクエリ振り分け
+GETリクエストの読み取りはレプリカへ、書き込みと書き込み直後の読み取りはプライマリへ送る
+レプリカが停止・遅延している場合はプライマリにフォールバックする
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+# 書き込み直後のクライアントをプライマリに固定するためのCookie
+STICKY_COOKIE = 'db_primary_until'
+
+LAG_QUERY = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+class ReplicaPool:
+    """レプリカのエンジンとヘルス状態を管理"""
+
+    def __init__(self, urls, engine_options, max_lag, check_interval):
+        self.engines = [create_engine(url, **engine_options) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._healthy = {id(e): True for e in self.engines}
+        self._checked_at = {id(e): 0.0 for e in self.engines}
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(self.engines)
+
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._on_error(engine))
+
+    def _on_error(self, engine):
+        def handler(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_unhealthy(engine)
+        return handler
+
+    def mark_unhealthy(self, engine):
+        with self._lock:
+            self._healthy[id(engine)] = False
+            self._checked_at[id(engine)] = time.monotonic()
+        logger.warning(f"Replica marked unhealthy: {engine.url.render_as_string(hide_password=True)}")
+
+    def _check(self, engine):
+        """レプリカの接続と遅延を確認（check_interval秒に1回まで）"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at[id(engine)] < self.check_interval:
+                return self._healthy[id(engine)]
+            self._checked_at[id(engine)] = now
+
+        try:
+            with engine.connect() as conn:
+                lag = float(conn.execute(LAG_QUERY).scalar() or 0)
+            healthy = lag <= self.max_lag
+            if not healthy:
+                logger.warning(f"Replica lag {lag:.1f}s exceeds {self.max_lag}s")
+        except Exception as e:
+            logger.warning(f"Replica health check failed: {e}")
+            healthy = False
+
+        with self._lock:
+            self._healthy[id(engine)] = healthy
+        return healthy
+
+    def choose(self):
+        """正常なレプリカをラウンドロビンで選択（なければNone）"""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self._check(engine):
+                return engine
+        return None
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+def _replicas():
+    return current_app.extensions.get('db_replicas')
+
+def _read_from_replica():
+    """現在のリクエストの読み取りをレプリカに送ってよいか"""
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    if g.get('db_use_primary') or g.get('db_wrote'):
+        return False
+    # 直前に書き込みを行ったクライアントはスティッキー期間中プライマリを使う
+    sticky_until = request.cookies.get(STICKY_COOKIE, type=float)
+    if sticky_until and sticky_until > time.time():
+        return False
+    return True
+
+class RoutingSession(Session):
+    """読み取りクエリをレプリカへ振り分けるセッション"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase):
+            pool = _replicas() if has_request_context() else None
+            if pool is not None and _read_from_replica():
+                # 1リクエスト内では同じレプリカを使う
+                if 'db_replica' not in g:
+                    g.db_replica = pool.choose()
+                if g.db_replica is not None:
+                    return g.db_replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        # Idempotency-Key 付きのリクエストではレスポンスの記録と同じトランザクションでコミットするため、
+        # ハンドラ内のコミットはフラッシュのみにする（utils/idempotency.py がまとめてコミット）
+        if self.info.get('defer_commit'):
+            self.flush()
+            return
+        super().commit()
+
+@contextmanager
+def use_primary():
+    """このブロック以降、現在のリクエストのクエリをプライマリに送る"""
+    previous = g.get('db_use_primary', False)
+    g.db_use_primary = True
+    try:
+        yield
+    finally:
+        g.db_use_primary = previous
+
+def _mark_write(*args, **kwargs):
+    if has_request_context():
+        g.db_wrote = True
+
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_write()
+
+def init_replicas(app):
+    """
+    DATABASE_REPLICA_URLSが設定されている場合にレプリカ振り分けを有効化
+
+    Args:
+        app: Flask アプリケーション
+    """
+    urls = app.config.get('DATABASE_REPLICA_URLS') or []
+    if not urls:
+        return
+
+    app.extensions['db_replicas'] = ReplicaPool(
+        urls,
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+        max_lag=app.config['REPLICA_MAX_LAG_SECONDS'],
+        check_interval=app.config['REPLICA_HEALTH_CHECK_INTERVAL']
+    )
+
+    if not event.contains(RoutingSession, 'after_flush', _mark_write):
+        event.listen(RoutingSession, 'after_flush', _mark_write)
+        event.listen(RoutingSession, 'do_orm_execute', _mark_dml)
+
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    @app.after_request
+    def _set_sticky_cookie(response):
+        # 書き込みを行ったクライアントは一定時間プライマリから読む（read-your-writes）
+        if g.get('db_wrote') or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                STICKY_COOKIE, str(time.time() + sticky_seconds),
+                max_age=sticky_seconds, httponly=True, samesite='Lax',
+                secure=request.is_secure
+            )
+        return response
+
+    logger.info(f"Read replica routing enabled ({len(urls)} replicas)")
@@ -0,0 +1,83 @@
+"""
+ペットごとの日別日記数ロールアップ（diary_daily_counts）の更新ユーティリティ
+日記の作成・削除と同じトランザクション内で増分更新する
+"""
+from collections import Counter
+from datetime import timezone
+from zoneinfo import ZoneInfo
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert
+from models import db, DiaryDailyCount
+
+def local_day(created_at):
+    """日記の作成日時をSTATS_TIMEZONEでの日付に変換"""
+    if created_at.tzinfo is None:
+        # datetime.utcnow() で作成された日時はUTCとして扱う
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(ZoneInfo(current_app.config['STATS_TIMEZONE'])).date()
+
+def apply_daily_count_deltas(deltas):
+    """
+    日別日記数に増減を反映（コミットは呼び出し側で行う）
+
+    Args:
+        deltas: {(pet_id, day): 増減数} の辞書
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+
+    stmt = insert(DiaryDailyCount).values([
+        {'pet_id': pet_id, 'day': day, 'count': delta}
+        for (pet_id, day), delta in sorted(deltas.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['pet_id', 'day'],
+        set_={'count': DiaryDailyCount.count + stmt.excluded.count}
+    )
+    db.session.execute(stmt)
+
+    # 0件になった日は削除して行数を抑える
+    if any(delta < 0 for delta in deltas.values()):
+        db.session.execute(
+            db.delete(DiaryDailyCount).where(DiaryDailyCount.count <= 0).where(
+                DiaryDailyCount.pet_id.in_({pet_id for pet_id, _ in deltas})
+            )
+        )
+
+def record_diaries_created(diaries):
+    """作成した日記（pet_idとcreated_atを持つもの）をロールアップに加算"""
+    deltas = Counter((d['pet_id'], local_day(d['created_at'])) if isinstance(d, dict)
+                     else (d.pet_id, local_day(d.created_at)) for d in diaries)
+    apply_daily_count_deltas(deltas)
+
+def record_diary_deleted(diary):
+    """削除した日記をロールアップから減算"""
+    apply_daily_count_deltas({(diary.pet_id, local_day(diary.created_at)): -1})
+
+def rebuild_daily_counts(pet_id=None):
+    """
+    diariesテーブルとアーカイブの索引からロールアップを再構築（コミットは呼び出し側で行う）
+
+    Args:
+        pet_id: 指定した場合はそのペットのみ再構築
+    """
+    from models import Diary, DiaryArchiveEntry
+
+    hot = db.select(Diary.pet_id, Diary.created_at)
+    archived = db.select(DiaryArchiveEntry.pet_id, DiaryArchiveEntry.created_at)
+    delete_stmt = db.delete(DiaryDailyCount)
+    if pet_id is not None:
+        hot = hot.where(Diary.pet_id == pet_id)
+        archived = archived.where(DiaryArchiveEntry.pet_id == pet_id)
+        delete_stmt = delete_stmt.where(DiaryDailyCount.pet_id == pet_id)
+
+    diaries = db.union_all(hot, archived).subquery()
+    day = db.func.date(db.func.timezone(current_app.config['STATS_TIMEZONE'], diaries.c.created_at))
+    source = db.select(diaries.c.pet_id, day.label('day'), db.func.count().label('count')) \
+        .group_by(diaries.c.pet_id, day)
+
+    db.session.execute(delete_stmt)
+    db.session.execute(
+        insert(DiaryDailyCount).from_select(['pet_id', 'day', 'count'], source)
+    )
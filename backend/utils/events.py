@@ -0,0 +1,181 @@
+"""
+PostgreSQL の LISTEN/NOTIFY による変更通知
+書き込み時に NOTIFY を発行し、ワーカーごとに1本のLISTEN接続で受信して
+Server-Sent Events の購読者（ユーザーごと）へ振り分ける
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from models import db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'animalog_changes'
+
+# 受信待ちの最大秒数（停止要求やエラーを確認する間隔）
+POLL_TIMEOUT = 5
+
+def publish_change(user_id, entity, action, entity_id=None, **extra):
+    """
+    変更を通知する（コミットは呼び出し側で行う）
+
+    NOTIFY はトランザクションのコミット時に配信され、ロールバックした場合は破棄されるため、
+    購読者がコミット前のデータを取得しに来ることはない
+    """
+    payload = {'user_id': str(user_id), 'entity': entity, 'action': action}
+    if entity_id is not None:
+        payload['id'] = str(entity_id)
+    payload.update(extra)
+    db.session.execute(db.select(db.func.pg_notify(CHANNEL, json.dumps(payload))))
+
+class ChangeListener:
+    """ワーカー内の購読者を管理し、1本のLISTEN接続で受信した通知を振り分ける"""
+
+    def __init__(self, database_uri, max_subscribers, queue_size=100):
+        self._engine = create_engine(database_uri, poolclass=NullPool)
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_id):
+        """
+        購読を開始
+
+        Returns:
+            queue.Queue: 通知を受け取るキュー（購読者数が上限に達した場合はNone）
+        """
+        events = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            self._subscribers[user_id].add(events)
+            self._count += 1
+            # --preload のためフォーク前にスレッドを作らず、最初の購読時に起動する
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='change-listener', daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, user_id, events):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers and events in subscribers:
+                subscribers.discard(events)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Invalid change notification: {payload!r}")
+            return
+        with self._lock:
+            targets = list(self._subscribers.get(event.get('user_id'), ()))
+        for events in targets:
+            self._put(events, event)
+
+    def _put(self, events, event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            # 読み出しが追いつかないクライアントには再取得を促す
+            with events.mutex:
+                events.queue.clear()
+            events.put_nowait({'entity': 'all', 'action': 'resync'})
+
+    def _broadcast_resync(self):
+        """通知を取りこぼした可能性がある場合（再接続時）に全購読者へ再取得を促す"""
+        with self._lock:
+            targets = [events for subscribers in self._subscribers.values() for events in subscribers]
+        for events in targets:
+            self._put(events, {'entity': 'all', 'action': 'resync'})
+
+    def _listen(self):
+        raw = self._engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            logger.info("Listening for change notifications")
+
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        # 購読者がいなくなったら接続を閉じる（次の購読時に再接続）
+                        return
+                if callable(conn.notifies):
+                    # psycopg 3
+                    for notify in conn.notifies(timeout=POLL_TIMEOUT):
+                        self._dispatch(notify.payload)
+                    continue
+                readable, _, _ = select.select([conn], [], [], POLL_TIMEOUT)
+                if not readable:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            raw.close()
+
+    def _run(self):
+        delay = 1
+        first = True
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                if not first:
+                    self._broadcast_resync()
+                first = False
+                self._listen()
+                delay = 1
+            except Exception as e:
+                logger.warning(f"Change listener connection failed, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+def limit_subscribers(app, threads):
+    """
+    購読者数の上限をワーカーのスレッド数の1/4までに制限（gunicorn の post_worker_init から呼ぶ）
+
+    SSEの接続は配信中ずっとスレッドを1つ占有するため、上限がスレッド数に近いと
+    APIリクエスト（長いエクスポートを含む）を処理するスレッドが足りなくなる
+
+    Returns:
+        int: 適用した上限
+    """
+    listener = app.extensions['change_listener']
+    cap = max(threads // 4, 1)
+    if listener.max_subscribers > cap:
+        logger.warning(
+            f"EVENTS_MAX_SUBSCRIBERS={listener.max_subscribers} exceeds threads // 4 ({threads} threads), "
+            f"limiting to {cap}"
+        )
+        listener.max_subscribers = cap
+    return listener.max_subscribers
+
+def init_events(app):
+    """
+    変更通知の受信を登録（接続は最初の購読時に作成）
+
+    Args:
+        app: Flask アプリケーション
+    """
+    app.extensions['change_listener'] = ChangeListener(
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS']
+    )
@@ -0,0 +1,172 @@
+"""
+liveness / readiness のヘルスチェック
+依存（DBの接続プール・S3・Cognito JWKS）はワーカーごとにバックグラウンドで一定間隔で確認して結果を保持し、
+/readyz は保持した結果を返すだけにする（ロードバランサーの確認ごとにDBやS3へ問い合わせない）
+終了時（SIGTERM）は draining を返し、ロードバランサーから外れるのを待ってから停止する
+"""
+import logging
+import signal
+import threading
+import time
+from flask import current_app, jsonify
+from sqlalchemy import text
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# 依存の確認結果の status（ok と degraded は準備完了として扱う）
+HEALTHY = ('ok', 'degraded')
+
+def probe_database():
+    """接続プールから接続を取得して SELECT 1（プールの使用状況も返す）"""
+    engine = db.engine
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    pool = engine.pool
+    return {'pool_size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': pool.overflow()}
+
+def probe_s3():
+    """バケットへの HEAD（サーキットブレーカーがオープン中は失敗する）"""
+    from .aws_client import create_s3_client_for_flask
+    from .resilience import get_dependency
+    s3_client = create_s3_client_for_flask(current_app)
+    s3_client.head_bucket(Bucket=current_app.config['S3_BUCKET_NAME'])
+    return {'breaker': get_dependency('s3').breaker.metrics()['state']}
+
+def probe_jwks():
+    """
+    公開鍵のキャッシュの鮮度
+    期限切れの場合はここで再取得するため、リクエスト時の取得も減る
+    取得できず古い鍵を使っている間は degraded（認証はできるため準備完了のまま）
+    """
+    from .cognito_cache import JWKS_TTL_SECONDS, get_jwks_keys, get_jwks_age
+    region = current_app.config['COGNITO_REGION']
+    user_pool_id = current_app.config['COGNITO_USER_POOL_ID']
+    get_jwks_keys(region, user_pool_id)
+    age = get_jwks_age(region, user_pool_id)
+    return {'status': 'ok' if age <= JWKS_TTL_SECONDS else 'degraded', 'age_seconds': round(age)}
+
+class HealthMonitor:
+    """依存の確認を一定間隔で実行し、最新の結果を保持する"""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        # 確認が止まっている（ハングしている）とみなす経過秒数
+        self.stale_after = interval * 3
+        self.draining = False
+        self._probes = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add_probe(self, name, func):
+        self._probes[name] = func
+
+    def ensure_started(self):
+        """--preload のためフォーク前にスレッドを作らず、最初の /readyz で起動する"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+                self._thread.start()
+
+    def run_probes(self):
+        for name, func in self._probes.items():
+            start = time.monotonic()
+            try:
+                with self.app.app_context():
+                    result = func() or {}
+                result.setdefault('status', 'ok')
+            except Exception as e:
+                result = {'status': 'fail', 'error': str(e)}
+            result['latency_ms'] = round((time.monotonic() - start) * 1000, 2)
+            result['checked_at'] = time.time()
+            with self._lock:
+                self._results[name] = result
+            if result['status'] not in HEALTHY:
+                logger.warning(f"Health probe {name} failed: {result.get('error')}")
+
+    def _run(self):
+        while True:
+            self.run_probes()
+            time.sleep(self.interval)
+
+    def readiness(self):
+        """
+        保持している確認結果から準備状態を判定
+
+        Returns:
+            tuple: (準備完了か, レスポンスの内容)
+        """
+        self.ensure_started()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+
+        now = time.time()
+        for name in self._probes:
+            result = results.get(name)
+            if result is None:
+                results[name] = {'status': 'pending'}
+            elif now - result['checked_at'] > self.stale_after:
+                result['status'] = 'stale'
+
+        if self.draining:
+            status = 'draining'
+        elif any(result['status'] == 'pending' for result in results.values()):
+            status = 'starting'
+        elif all(result['status'] in HEALTHY for result in results.values()):
+            status = 'ready'
+        else:
+            status = 'not_ready'
+        return status == 'ready', {'status': status, 'checks': results}
+
+def install_drain_handler(app):
+    """
+    SIGTERM を受けたら draining にし、HEALTH_DRAIN_SECONDS 後に元のハンドラ（gunicorn の終了処理）を呼ぶ
+    その間も新しいリクエストは処理し、ロードバランサーが /readyz の失敗で振り分けを止めるのを待つ
+    （gunicorn の post_worker_init から呼ぶ。ワーカーが自身のシグナルハンドラを設定した後に上書きするため）
+    """
+    monitor = app.extensions.get('health_monitor')
+    drain_seconds = app.config['HEALTH_DRAIN_SECONDS']
+    previous = signal.getsignal(signal.SIGTERM)
+    if monitor is None or drain_seconds <= 0 or not callable(previous):
+        return
+
+    def handler(signum, frame):
+        if monitor.draining:
+            return
+        monitor.draining = True
+        logger.info(f"Draining for {drain_seconds}s before shutdown")
+        timer = threading.Timer(drain_seconds, previous, args=(signum, frame))
+        timer.daemon = True
+        timer.start()
+
+    signal.signal(signal.SIGTERM, handler)
+
+def init_health(app):
+    """
+    /livez と /readyz を登録
+
+    Args:
+        app: Flask アプリケーション
+    """
+    monitor = HealthMonitor(app, interval=app.config['HEALTH_CHECK_INTERVAL'])
+    monitor.add_probe('database', probe_database)
+    if app.config['USE_S3']:
+        monitor.add_probe('s3', probe_s3)
+    if app.config['USE_COGNITO']:
+        monitor.add_probe('jwks', probe_jwks)
+    app.extensions['health_monitor'] = monitor
+
+    @app.route('/livez')
+    def livez():
+        """プロセスが応答できるか（依存は確認しない）"""
+        return jsonify({'status': 'alive'})
+
+    @app.route('/readyz')
+    def readyz():
+        """トラフィックを受けられるか（バックグラウンドで確認した結果を返す）"""
+        ready, body = monitor.readiness()
+        return jsonify(body), 200 if ready else 503
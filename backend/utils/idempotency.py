@@ -0,0 +1,175 @@
+"""
+作成APIの Idempotency-Key ヘッダー対応
+同じキーで再送されたリクエストには記録済みのレスポンスを返し、処理を二重に実行しない
+キーの記録・ハンドラの書き込み・レスポンスの記録は1つのトランザクションでコミットする
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import current_app, jsonify, request
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.postgresql import insert
+from models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# lock_timeout を超えた場合の SQLSTATE
+LOCK_NOT_AVAILABLE = '55P03'
+
+_table = IdempotencyKey.__table__
+
+def _request_hash():
+    """リクエストの内容のハッシュ（multipartは境界文字列が毎回変わるため解析後の値から計算）"""
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode('utf-8'))
+    if request.mimetype == 'multipart/form-data':
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode('utf-8'))
+        for name, file in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{file.filename}\n".encode('utf-8'))
+            for chunk in iter(lambda: file.stream.read(65536), b''):
+                digest.update(chunk)
+            file.stream.seek(0)
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+def _claim(user_id, key, request_hash):
+    """
+    キーの処理権を取得（新規または期限切れのものは取得できる）
+
+    リクエストのセッションのトランザクション内で挿入し、ハンドラの書き込み・レスポンスの記録と一緒にコミットする
+    同じキーの処理中のリクエストがあれば、その行のロックが解放される（コミットまたはロールバック）まで
+    IDEMPOTENCY_WAIT_SECONDS を上限に待つ。処理中のワーカーが異常終了した場合はロールバックされるため、
+    再送は期限切れを待たずに処理権を取得できる
+
+    Returns:
+        bool: 取得できた場合True（ロックの待機がタイムアウトした場合は LockNotAvailable）
+    """
+    now = datetime.now(timezone.utc)
+    stmt = insert(_table).values(
+        user_id=user_id, key=key, request_hash=request_hash, status='in_progress',
+        created_at=now, expires_at=now + timedelta(hours=current_app.config['IDEMPOTENCY_TTL_HOURS'])
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'key'],
+        set_={
+            'request_hash': stmt.excluded.request_hash,
+            'status': 'in_progress',
+            'response_status': None,
+            'response_body': None,
+            'created_at': stmt.excluded.created_at,
+            'expires_at': stmt.excluded.expires_at,
+        },
+        where=_table.c.expires_at < now
+    ).returning(_table.c.key)
+
+    wait_ms = int(current_app.config['IDEMPOTENCY_WAIT_SECONDS'] * 1000)
+    db.session.execute(text(f"SET LOCAL lock_timeout = {wait_ms}"))
+    try:
+        return db.session.execute(stmt).first() is not None
+    finally:
+        db.session.execute(text("SET LOCAL lock_timeout TO DEFAULT"))
+
+def _is_lock_timeout(error):
+    """lock_timeout による失敗か（psycopg2 は pgcode、psycopg 3 は sqlstate）"""
+    orig = getattr(error, 'orig', None)
+    return (getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)) == LOCK_NOT_AVAILABLE
+
+def _store(user_id, key, response):
+    """レスポンスを記録（ハンドラの書き込みと同じトランザクション、コミットは呼び出し側で行う）"""
+    db.session.execute(_table.update().where(
+        _table.c.user_id == user_id, _table.c.key == key
+    ).values(
+        status='completed',
+        response_status=response.status_code,
+        response_body=response.get_data(as_text=True)
+    ))
+
+def _replay(row):
+    response = current_app.response_class(
+        row.response_body, status=row.response_status, mimetype='application/json'
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _in_progress():
+    response = jsonify({'error': 'A request with the same Idempotency-Key is in progress'})
+    response.status_code = 409
+    response.headers['Retry-After'] = '1'
+    return response
+
+def _recorded_response(user_id, key, request_hash):
+    """処理権を取得できなかった場合に記録済みのレスポンスを返す"""
+    row = db.session.execute(select(
+        _table.c.request_hash, _table.c.status, _table.c.response_status, _table.c.response_body
+    ).where(_table.c.user_id == user_id, _table.c.key == key)).first()
+    db.session.rollback()
+
+    if row is not None and row.request_hash != request_hash:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    if row is not None and row.status == 'completed':
+        return _replay(row)
+    return _in_progress()
+
+def idempotent(f):
+    """
+    Idempotency-Key ヘッダーが指定された場合にレスポンスを記録・再利用するデコレータ
+    （login_required の内側で使用する）
+
+    ハンドラ内の db.session.commit() はフラッシュのみにし（RoutingSession.commit）、
+    レスポンスを記録してから1つのトランザクションとしてコミットする
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = request.current_user.id
+        request_hash = _request_hash()
+        try:
+            claimed = _claim(user_id, key, request_hash)
+        except OperationalError as e:
+            db.session.rollback()
+            if _is_lock_timeout(e):
+                return _in_progress()
+            raise
+        if not claimed:
+            return _recorded_response(user_id, key, request_hash)
+
+        db.session.info['defer_commit'] = True
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.info.pop('defer_commit', None)
+
+        # サーバーエラーは記録せず（ハンドラの書き込みごとロールバック）、同じキーでの再試行を許可する
+        if response.status_code >= 500:
+            db.session.rollback()
+        else:
+            _store(user_id, key, response)
+            db.session.commit()
+        return response
+    return decorated_function
+
+def commit_deferred():
+    """Idempotency-Key 付きのリクエストでコミットを遅らせている間か（ハンドラ内でロールバックしてはいけない）"""
+    return bool(db.session.info.get('defer_commit'))
+
+def purge_expired_keys(engine):
+    """
+    期限切れのキーを削除
+
+    Returns:
+        int: 削除した件数
+    """
+    with engine.begin() as conn:
+        result = conn.execute(_table.delete().where(_table.c.expires_at < datetime.now(timezone.utc)))
+    return result.rowcount
@@ -0,0 +1,125 @@
+"""
+コンテンツハッシュ（SHA-256）による画像の重複排除
+ユーザーごとに同じ内容の画像は1つのS3オブジェクトを共有し、参照カウントで削除を管理する
+"""
+import base64
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert
+from models import db, ImageObject
+from .aws_client import create_s3_client_for_flask
+from .profiling import timed
+
+_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def normalize_hash(value):
+    """SHA-256の16進文字列を正規化（不正な場合はNone）"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value if _HASH_PATTERN.match(value) else None
+
+def checksum_header(content_hash):
+    """S3の x-amz-checksum-sha256 ヘッダー値（Base64）"""
+    return base64.b64encode(bytes.fromhex(content_hash)).decode('ascii')
+
+def content_key(user_id, content_hash, filename):
+    """コンテンツハッシュから決まるS3キー"""
+    ext = filename.rsplit('.', 1)[1].lower()
+    return f"users/{user_id}/diary-images/sha256-{content_hash}.{ext}"
+
+def _key_from_url(file_url):
+    prefix = f"https://{current_app.config['S3_BUCKET_NAME']}.s3.{current_app.config['AWS_REGION']}.amazonaws.com/"
+    return file_url[len(prefix):] if file_url and file_url.startswith(prefix) else None
+
+def find_existing_image(user_id, content_hash):
+    """
+    同じ内容の画像がアップロード済みであればそのS3キーを返す
+
+    日記から参照されていない登録（署名発行だけで未アップロード、またはペット削除で参照が0になったもの）は
+    HEADで実在を確認する。返したキーは last_used_at を更新し、クライアントが日記を作成するまでの間に
+    削除（delete_file・孤立画像GC）されないようにする
+    """
+    image = ImageObject.query.filter_by(user_id=user_id, content_hash=content_hash).first()
+    if image is None:
+        return None
+    if not (image.verified and image.ref_count > 0):
+        try:
+            with timed('s3'):
+                create_s3_client_for_flask(current_app).head_object(
+                    Bucket=current_app.config['S3_BUCKET_NAME'], Key=image.s3_key
+                )
+        except Exception:
+            return None
+        image.verified = True
+
+    image.last_used_at = datetime.now(timezone.utc)
+    db.session.commit()
+    return image.s3_key
+
+def recently_used_since():
+    """この時刻より後に再利用された画像は参照がなくても削除しない"""
+    return datetime.now(timezone.utc) - timedelta(hours=current_app.config['IMAGE_GC_GRACE_HOURS'])
+
+def register_image(user_id, content_hash, key):
+    """アップロード予定の画像をインデックスに登録（既に登録済みなら何もしない）"""
+    db.session.execute(
+        insert(ImageObject).values(
+            user_id=user_id, content_hash=content_hash, s3_key=key
+        ).on_conflict_do_nothing(constraint='uq_image_objects_user_hash')
+    )
+
+def acquire_images(user_id, file_urls):
+    """日記から参照される画像の参照カウントを増やす（コミットは呼び出し側で行う）"""
+    _adjust_ref_counts(user_id, Counter(filter(None, map(_key_from_url, file_urls))), 1)
+
+def release_images(user_id, file_urls):
+    """日記から外れた画像の参照カウントを減らす（コミットは呼び出し側で行う）"""
+    _adjust_ref_counts(user_id, Counter(filter(None, map(_key_from_url, file_urls))), -1)
+
+def _adjust_ref_counts(user_id, key_counts, sign):
+    for count, keys in _group_by_count(key_counts).items():
+        values = {'ref_count': ImageObject.ref_count + sign * count}
+        if sign > 0:
+            # 日記から参照された時点でアップロード済みとみなす
+            values['verified'] = True
+        db.session.execute(
+            db.update(ImageObject)
+            .where(ImageObject.user_id == user_id, ImageObject.s3_key.in_(keys))
+            .values(**values)
+        )
+
+def _group_by_count(key_counts):
+    groups = {}
+    for key, count in key_counts.items():
+        groups.setdefault(count, []).append(key)
+    return groups
+
+def release_image_for_delete(user_id, key):
+    """
+    画像の参照を1つ外し、S3オブジェクトを削除してよいかを返す
+    参照が0になっても猶予期間内に重複排除で再利用されたものは削除しない（行は孤立画像GCまで残す）
+
+    Returns:
+        bool: 他に参照がなく削除してよい場合はTrue（インデックス外の画像も True）
+    """
+    if user_id is None:
+        return True
+    row = db.session.execute(
+        db.update(ImageObject)
+        .where(ImageObject.user_id == user_id, ImageObject.s3_key == key)
+        .values(ref_count=ImageObject.ref_count - 1)
+        .returning(ImageObject.ref_count, ImageObject.last_used_at)
+    ).first()
+    if row is None:
+        return True
+    if row.ref_count > 0:
+        return False
+    if row.last_used_at is not None and row.last_used_at > recently_used_since():
+        return False
+    db.session.execute(
+        db.delete(ImageObject).where(ImageObject.user_id == user_id, ImageObject.s3_key == key)
+    )
+    return True
@@ -0,0 +1,172 @@
+"""
+どの日記からも参照されていない画像（孤立画像）のガベージコレクション
+S3のオブジェクト一覧とDB上の画像キーをどちらもソート済みのストリームとして読み、
+マージジョインで突き合わせる（どちらも全件をメモリに載せない）
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# S3のキーはUTF-8のバイト順で返るため、コード順（COLLATE "C"）でソートした値と突き合わせる
+# 旧形式の diary-images/ は users/ より辞書順で前なのでこの順に列挙すれば全体がソート済みになる
+LIST_PREFIXES = ['diary-images/', 'users/']
+
+# DELETE Objects APIの1リクエストあたりの上限
+DELETE_BATCH_SIZE = 1000
+
+def _is_diary_image_key(key):
+    """GC対象の画像キーかどうか（diary-images/* または users/<id>/diary-images/*）"""
+    if key.startswith('diary-images/'):
+        return True
+    parts = key.split('/', 3)
+    return len(parts) == 4 and parts[0] == 'users' and parts[2] == 'diary-images'
+
+def iter_s3_objects(s3_client, bucket_name):
+    """画像オブジェクトをキーの昇順でストリーミング"""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for prefix in LIST_PREFIXES:
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if _is_diary_image_key(obj['Key']):
+                    yield obj
+
+def iter_referenced_keys(engine, s3_url_prefix, recent_since, batch_size=5000):
+    """
+    日記（アーカイブした日記を含む）から参照されている画像のS3キーを昇順・重複なしでストリーミング
+    recent_since より後に重複排除で再利用された画像（日記の作成前の可能性がある）も参照中として扱う
+    （サーバーサイドカーソルを使用）
+    """
+    key_expr = (
+        "CASE WHEN image_url LIKE '/uploads/%' "
+        "THEN 'diary-images/' || substr(image_url, length('/uploads/') + 1) "
+        "ELSE substr(image_url, :prefix_length + 1) END"
+    )
+    condition = "image_url LIKE '/uploads/%' OR starts_with(image_url, :prefix)"
+    query = text(f"""
+        SELECT DISTINCT key COLLATE "C" AS key FROM (
+            SELECT {key_expr} AS key FROM diaries WHERE {condition}
+            UNION ALL
+            SELECT {key_expr} AS key FROM diary_images WHERE {condition}
+            UNION ALL
+            SELECT {key_expr} AS key FROM (
+                SELECT unnest(image_urls) AS image_url FROM diary_archive_entries
+            ) AS archived WHERE {condition}
+            UNION ALL
+            SELECT s3_key AS key FROM image_objects WHERE ref_count > 0 OR last_used_at >= :recent_since
+        ) AS referenced
+        ORDER BY 1
+    """)
+    params = {'prefix': s3_url_prefix, 'prefix_length': len(s3_url_prefix), 'recent_since': recent_since}
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query, params)
+        for row in result:
+            yield row[0]
+
+def find_orphans(s3_objects, referenced_keys, cutoff, summary):
+    """
+    ソート済みの2つのストリームをマージジョインして孤立画像を返す
+
+    Args:
+        s3_objects: キー昇順のS3オブジェクト
+        referenced_keys: キー昇順の参照中キー
+        cutoff: これより新しいオブジェクトは対象外（アップロード直後で未登録の可能性）
+        summary: 集計結果を書き込む辞書
+    """
+    referenced = iter(referenced_keys)
+    current = next(referenced, None)
+
+    for obj in s3_objects:
+        key = obj['Key']
+        summary['scanned'] += 1
+
+        while current is not None and current < key:
+            current = next(referenced, None)
+
+        if current == key:
+            summary['referenced'] += 1
+            continue
+        if obj['LastModified'] >= cutoff:
+            summary['too_recent'] += 1
+            continue
+
+        summary['orphans'] += 1
+        summary['orphan_bytes'] += obj.get('Size', 0)
+        yield obj
+
+def _delete_batch(engine, s3_client, bucket_name, keys, recent_since, summary):
+    # 走査の後に重複排除で再利用・参照された画像は削除しない
+    with engine.connect() as conn:
+        in_use = {row[0] for row in conn.execute(text(
+            "SELECT s3_key FROM image_objects WHERE s3_key = ANY(:keys) "
+            "AND (ref_count > 0 OR last_used_at >= :recent_since)"
+        ), {'keys': keys, 'recent_since': recent_since})}
+    if in_use:
+        summary['orphans'] -= len(in_use)
+        summary['referenced'] += len(in_use)
+        keys = [key for key in keys if key not in in_use]
+        if not keys:
+            return
+
+    response = s3_client.delete_objects(
+        Bucket=bucket_name,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+    )
+    errors = response.get('Errors', [])
+    for error in errors:
+        logger.error(f"Failed to delete {error.get('Key')}: {error.get('Message')}")
+    summary['errors'] += len(errors)
+    summary['deleted'] += len(keys) - len(errors)
+
+    # 削除したオブジェクトを重複排除インデックスからも外す
+    failed = {error.get('Key') for error in errors}
+    deleted = [key for key in keys if key not in failed]
+    if deleted:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM image_objects WHERE s3_key = ANY(:keys) AND ref_count <= 0"),
+                         {'keys': deleted})
+
+def collect_orphaned_images(engine, s3_client, bucket_name, s3_url_prefix,
+                            grace_hours=24, dry_run=True, log=print):
+    """
+    孤立画像を検出して削除
+
+    Args:
+        engine: SQLAlchemy エンジン
+        s3_client: S3クライアント
+        bucket_name: バケット名
+        s3_url_prefix: DBに保存されているS3 URLの接頭辞（https://{bucket}.s3.{region}.amazonaws.com/）
+        grace_hours: この時間より新しいオブジェクトは削除しない
+        dry_run: Trueの場合は削除せずに報告のみ
+
+    Returns:
+        dict: 集計結果
+    """
+    summary = {
+        'scanned': 0, 'referenced': 0, 'too_recent': 0,
+        'orphans': 0, 'orphan_bytes': 0, 'deleted': 0, 'errors': 0
+    }
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+
+    orphans = find_orphans(
+        iter_s3_objects(s3_client, bucket_name),
+        iter_referenced_keys(engine, s3_url_prefix, cutoff),
+        cutoff,
+        summary
+    )
+
+    batch = []
+    for obj in orphans:
+        if dry_run:
+            log(f"[dry-run] orphan: {obj['Key']} ({obj.get('Size', 0)} bytes, {obj['LastModified']})")
+            continue
+        batch.append(obj['Key'])
+        if len(batch) >= DELETE_BATCH_SIZE:
+            _delete_batch(engine, s3_client, bucket_name, batch, cutoff, summary)
+            batch = []
+    if batch:
+        _delete_batch(engine, s3_client, bucket_name, batch, cutoff, summary)
+
+    return summary
@@ -0,0 +1,62 @@
+"""
+gunicorn --preload 時のフォーク前後の処理（gunicorn.conf.py のフックから呼ぶ）
+
+フォーク前（マスター）: 使う重いモジュールを読み込み、起動時に開いたDB接続を閉じてから
+                        gc.freeze() で既存オブジェクトをGCの対象外にする
+フォーク後（ワーカー）: 親から引き継いだ接続プールとS3クライアントを破棄する
+
+参照カウントの更新でもページはコピーされるため完全には共有できないが、
+GCの世代走査による全オブジェクトへの書き込み（コピーオンライトの発生）は避けられる
+"""
+import gc
+import importlib
+import logging
+from models import db
+from .aws_client import reset_s3_clients
+
+logger = logging.getLogger(__name__)
+
+def _engines(app):
+    """アプリケーションが持つ全エンジン（プライマリとレプリカ）"""
+    with app.app_context():
+        engines = list(db.engines.values())
+    replicas = app.extensions.get('db_replicas')
+    if replicas is not None:
+        engines.extend(replicas.engines)
+    return engines
+
+def preload_modules(app):
+    """
+    設定で使うモジュールのみフォーク前に読み込む（各ワーカーで重複して読み込まないように）
+    使わないモジュールは読み込まないため、ローカルモードのメモリは増えない
+    """
+    modules = []
+    if app.config.get('USE_S3') or app.config.get('USE_RDS'):
+        modules += ['boto3', 'botocore.client']
+    if app.config.get('USE_COGNITO'):
+        modules += ['jose.jwt', 'utils.cognito_cache']
+    if app.config.get('ARCHIVE_ENABLED'):
+        modules += ['zstandard']
+    for name in modules:
+        importlib.import_module(name)
+    return modules
+
+def prepare_for_fork(app):
+    """マスタープロセスでアプリケーションの読み込み後、最初のワーカーをフォークする前に呼ぶ"""
+    modules = preload_modules(app)
+
+    # 起動時の接続確認で開いた接続を複数のワーカーで共有しないよう閉じておく
+    for engine in _engines(app):
+        engine.dispose()
+
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Prepared for fork: preloaded {modules or 'no modules'}, "
+                f"{gc.get_freeze_count()} objects frozen")
+
+def reset_after_fork(app):
+    """ワーカープロセスでフォーク直後に呼ぶ"""
+    # close=False: 親プロセスの接続（ソケット）を閉じずにプールから外すだけにする
+    for engine in _engines(app):
+        engine.dispose(close=False)
+    reset_s3_clients()
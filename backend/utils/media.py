@@ -0,0 +1,77 @@
+"""
+アップロード画像の配信ユーティリティ
+ローカル保存時は長期キャッシュ・Range対応・nginxへのオフロード、
+S3使用時は署名付きURLへのリダイレクトで配信する
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, redirect, send_from_directory, abort, make_response
+from werkzeug.security import safe_join
+from .aws_client import create_s3_client_for_flask
+from .profiling import timed
+
+# 署名付きURLの有効期限とリダイレクト自体のキャッシュ時間
+PRESIGNED_EXPIRES_IN = 3600
+REDIRECT_MAX_AGE = 3000
+
+def _immutable_cache_control(response):
+    # generate_unique_filename で生成したファイル名は内容が変わらないため immutable にできる
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['MEDIA_CACHE_MAX_AGE']}, immutable"
+    return response
+
+def _serve_local(filename):
+    """ローカルフォルダから配信（Range/ETag/条件付きリクエスト対応）"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    accel_prefix = current_app.config['MEDIA_ACCEL_REDIRECT_PREFIX']
+
+    if accel_prefix:
+        # nginxにファイル送信を任せる（Range・sendfileはnginx側で処理）
+        path = safe_join(upload_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{quote(filename)}"
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return _immutable_cache_control(response)
+
+    response = send_from_directory(upload_folder, filename, conditional=True, etag=True)
+    return _immutable_cache_control(response)
+
+def _serve_s3(key):
+    """S3の署名付きURLへリダイレクト"""
+    try:
+        with timed('s3'):
+            s3_client = create_s3_client_for_flask(current_app)
+            url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': current_app.config['S3_BUCKET_NAME'], 'Key': key},
+                ExpiresIn=PRESIGNED_EXPIRES_IN
+            )
+    except Exception as e:
+        current_app.logger.error(f"Failed to generate presigned URL: {e}")
+        abort(502)
+
+    response = redirect(url)
+    # 署名の有効期限内はブラウザがリダイレクトを再利用できるようにする
+    response.headers['Cache-Control'] = f"private, max-age={REDIRECT_MAX_AGE}"
+    return response
+
+def serve_media(filename):
+    """
+    /uploads/<path:filename> の配信処理
+
+    ユーザー別のキー（users/<id>/...）はここでは配信しない
+    （<img> のリクエストには Authorization ヘッダーが付かず本人確認ができないため、
+    APIが返す署名付きURLまたはCloudFrontの署名付きCookieで直接配信する）
+
+    Args:
+        filename: 要求されたパス（ローカルファイル名、または旧形式のS3キーのファイル名）
+    """
+    if not current_app.config['USE_S3']:
+        return _serve_local(filename)
+
+    if '/' in filename:
+        abort(404)
+    # 旧形式のキー（diary-images/ 直下）
+    return _serve_s3(f"diary-images/{filename}")
@@ -0,0 +1,259 @@
+"""
+diariesテーブルの月次レンジパーティショニング（created_at）ユーティリティ
+パーティションの作成と、既存テーブルからのオンライン移行を行う
+"""
+import time
+from datetime import date
+from sqlalchemy import text
+
+PARENT_TABLE = 'diaries'
+NEW_TABLE = 'diaries_partitioned'
+OLD_TABLE = 'diaries_unpartitioned'
+SYNC_FUNCTION = 'diaries_partition_sync'
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+# 親テーブルに作成するインデックス（各パーティションにも自動で作成される）
+PARTITION_INDEXES = [
+    ('idx_diaries_user_id_created_at', '(user_id, created_at DESC, id DESC)'),
+    ('idx_diaries_pet_id_created_at', '(pet_id, created_at DESC, id DESC)'),
+    ('idx_diaries_created_at', '(created_at DESC)'),
+    ('idx_diaries_user_id_updated_at', '(user_id, updated_at, id)'),
+    ('idx_diaries_user_id_created_at_with_image', '(user_id, created_at DESC, id DESC) WHERE image_url IS NOT NULL'),
+    ('idx_diaries_tags', 'USING gin (tags)'),
+]
+
+def _add_months(d, months):
+    month = d.month - 1 + months
+    return date(d.year + month // 12, month % 12 + 1, 1)
+
+def partition_name(table, month_start):
+    return f"{table}_y{month_start.year}m{month_start.month:02d}"
+
+def is_partitioned(conn, table=PARENT_TABLE):
+    """テーブルがパーティションテーブルかどうか"""
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table)"
+    ), {'table': table}).scalar()
+
+def create_month_partitions(conn, table, start, end, log=print):
+    """
+    start〜endの月のパーティションを作成（既存のものはスキップ）
+
+    DEFAULTパーティションにその月の行がある場合は、そのまま作成すると失敗するため
+    単独のテーブルとして作成して行を移してからアタッチする
+
+    Returns:
+        list: 作成したパーティション名
+    """
+    created = []
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        name = partition_name(PARENT_TABLE, month)
+        exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+        if not exists:
+            bounds = f"FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            in_default = conn.execute(text(
+                f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end"
+            ), {'start': month, 'end': _add_months(month, 1)}).scalar() if _has_default_partition(conn) else 0
+            if in_default:
+                conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+                conn.execute(text(f"""
+                    WITH moved AS (
+                        DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end RETURNING *
+                    )
+                    INSERT INTO {name} SELECT * FROM moved
+                """), {'start': month, 'end': _add_months(month, 1)})
+                conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+                log(f"Moved {in_default} rows from {DEFAULT_PARTITION} into {name}")
+            else:
+                conn.execute(text(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}"))
+            created.append(name)
+        month = _add_months(month, 1)
+    return created
+
+def _has_default_partition(conn):
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': DEFAULT_PARTITION}).scalar()
+
+def default_partition_rows(conn):
+    """DEFAULTパーティション（月次パーティションの範囲外）にある行数"""
+    if not _has_default_partition(conn):
+        return 0
+    return conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+
+def ensure_future_partitions(conn, months_ahead=3, log=print):
+    """
+    今月から months_ahead ヶ月先までのパーティションを作成（定期実行を想定）
+    DEFAULTパーティションに入った範囲外の行（インポートされた古い日記など）の月のパーティションも作成して行を移す
+    """
+    created = []
+    if _has_default_partition(conn):
+        months = conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {DEFAULT_PARTITION}"
+        )).scalars().all()
+        for month in months:
+            created += create_month_partitions(conn, PARENT_TABLE, month, month, log)
+    today = date.today()
+    return created + create_month_partitions(conn, PARENT_TABLE, today, _add_months(today, months_ahead), log)
+
+def _column_names(conn, table):
+    rows = conn.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = :table ORDER BY ordinal_position"
+    ), {'table': table})
+    return [row[0] for row in rows]
+
+def create_partitioned_table(conn, months_ahead=3):
+    """既存のdiariesと同じ列を持つパーティションテーブルとパーティション・インデックスを作成"""
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {NEW_TABLE} "
+        f"(LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE (created_at)"
+    ))
+    # パーティションキーはNOT NULLかつ主キーに含める必要がある
+    conn.execute(text(f"ALTER TABLE {NEW_TABLE} ALTER COLUMN created_at SET NOT NULL"))
+    conn.execute(text(
+        f"DO $$ BEGIN "
+        f"ALTER TABLE {NEW_TABLE} ADD CONSTRAINT {NEW_TABLE}_pkey PRIMARY KEY (id, created_at); "
+        f"EXCEPTION WHEN invalid_table_definition OR duplicate_object THEN NULL; END $$"
+    ))
+
+    oldest = conn.execute(text(f"SELECT min(created_at) FROM {PARENT_TABLE}")).scalar()
+    start = oldest.date() if oldest else date.today()
+    end = _add_months(date.today(), months_ahead)
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        name = partition_name(PARENT_TABLE, month)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {NEW_TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        ))
+        month = _add_months(month, 1)
+    # 範囲外の日時（インポートされた古い日記など）の受け皿
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {NEW_TABLE} DEFAULT"))
+
+    # LIKE では外部キー（pets・users への参照）がコピーされないため、元のテーブルと同じ定義で追加する
+    foreign_keys = """
+        SELECT pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = CAST(:table AS regclass)
+    """
+    existing = set(conn.execute(text(foreign_keys), {'table': NEW_TABLE}).scalars())
+    for definition in conn.execute(text(foreign_keys), {'table': PARENT_TABLE}).scalars().all():
+        if definition not in existing:
+            conn.execute(text(f"ALTER TABLE {NEW_TABLE} ADD {definition}"))
+
+    for index_name, columns in PARTITION_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name}_p ON {NEW_TABLE} {columns}"))
+
+def install_sync_trigger(conn):
+    """移行中の書き込みを新テーブルへ反映するトリガーを作成"""
+    columns = _column_names(conn, PARENT_TABLE)
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f"NEW.{c}" for c in columns)
+    updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in columns if c not in ('id', 'created_at'))
+
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION {SYNC_FUNCTION}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM {NEW_TABLE} WHERE id = OLD.id AND created_at = OLD.created_at;
+                RETURN OLD;
+            END IF;
+            INSERT INTO {NEW_TABLE} ({column_list}) VALUES ({new_values})
+            ON CONFLICT (id, created_at) DO UPDATE SET {updates};
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text(f"DROP TRIGGER IF EXISTS {SYNC_FUNCTION} ON {PARENT_TABLE}"))
+    conn.execute(text(
+        f"CREATE TRIGGER {SYNC_FUNCTION} AFTER INSERT OR UPDATE OR DELETE ON {PARENT_TABLE} "
+        f"FOR EACH ROW EXECUTE FUNCTION {SYNC_FUNCTION}()"
+    ))
+
+def copy_batch(conn, after, batch_size):
+    """
+    (created_at, id) の順に1バッチ分を新テーブルへコピー
+
+    FOR SHARE で元の行をロックするため、コピー中の行に対する同時削除は
+    このバッチのコミット後に実行され、トリガーで新テーブルからも削除される
+
+    Returns:
+        tuple: 最後にコピーした (created_at, id)、終了時はNone
+    """
+    columns = ', '.join(_column_names(conn, PARENT_TABLE))
+    where = "WHERE (created_at, id) > (:created_at, :id)" if after else ""
+    params = {'limit': batch_size}
+    if after:
+        params.update({'created_at': after[0], 'id': after[1]})
+
+    row = conn.execute(text(f"""
+        WITH batch AS (
+            SELECT {columns} FROM {PARENT_TABLE} {where}
+            ORDER BY created_at, id LIMIT :limit FOR SHARE
+        ), copied AS (
+            INSERT INTO {NEW_TABLE} ({columns}) SELECT {columns} FROM batch
+            ON CONFLICT (id, created_at) DO NOTHING
+        )
+        SELECT created_at, id FROM batch ORDER BY created_at DESC, id DESC LIMIT 1
+    """), params).first()
+    return tuple(row) if row else None
+
+def swap_tables(conn):
+    """
+    短いロックの中でテーブルを入れ替える
+    diariesを参照する外部キーはパーティションテーブルでは (id) 単独で張れないため削除する
+    （日記画像の削除はORMのcascadeで行われる）
+    """
+    conn.execute(text(f"LOCK TABLE {PARENT_TABLE} IN ACCESS EXCLUSIVE MODE"))
+    referencing = conn.execute(text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = CAST(:table AS regclass)"
+    ), {'table': PARENT_TABLE}).all()
+    for table, constraint in referencing:
+        conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{constraint}"'))
+
+    conn.execute(text(f"DROP TRIGGER IF EXISTS {SYNC_FUNCTION} ON {PARENT_TABLE}"))
+    conn.execute(text(f"DROP FUNCTION IF EXISTS {SYNC_FUNCTION}()"))
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {OLD_TABLE}"))
+    conn.execute(text(f"ALTER TABLE {NEW_TABLE} RENAME TO {PARENT_TABLE}"))
+    for index_name, _ in PARTITION_INDEXES:
+        # 旧テーブルに同名のインデックスがある場合は退避してから名前を付け替える
+        conn.execute(text(f"ALTER INDEX IF EXISTS {index_name} RENAME TO {index_name}_old"))
+        conn.execute(text(f"ALTER INDEX IF EXISTS {index_name}_p RENAME TO {index_name}"))
+
+def migrate_to_partitioned(engine, batch_size=5000, months_ahead=3, pause=0.0, log=print):
+    """
+    diariesをオンラインでパーティションテーブルへ移行
+
+    1. パーティションテーブルとパーティションを作成
+    2. 同期トリガーを設置（以降の書き込みは新テーブルにも反映）
+    3. 既存の行をバッチごとにコピー（バッチごとにコミット）
+    4. 短いロックの中でテーブル名を入れ替え
+
+    旧テーブルは diaries_unpartitioned として残すので、確認後に手動で削除する
+    """
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            log("diaries is already partitioned")
+            return
+        create_partitioned_table(conn, months_ahead)
+        install_sync_trigger(conn)
+    log("Created partitioned table and sync trigger")
+
+    after = None
+    copied_batches = 0
+    while True:
+        with engine.begin() as conn:
+            after = copy_batch(conn, after, batch_size)
+        if after is None:
+            break
+        copied_batches += 1
+        if copied_batches % 20 == 0:
+            log(f"Copied {copied_batches * batch_size} rows (up to {after[0]})")
+        if pause:
+            time.sleep(pause)
+
+    with engine.begin() as conn:
+        swap_tables(conn)
+    log(f"Swapped tables. Old table kept as {OLD_TABLE}")
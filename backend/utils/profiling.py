@@ -0,0 +1,167 @@
+"""
+リクエスト単位のパフォーマンス計測
+DBクエリ・S3呼び出し・認証・JSONエンコードの所要時間を計測し、
+Server-Timingヘッダーと構造化ログに出力する
+"""
+import cProfile
+import logging
+import os
+import random
+import time
+from contextlib import nullcontext
+from flask import g, request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 計測が無効な場合は timed() が共有の nullcontext を返すだけにする
+_enabled = False
+_NULL_TIMER = nullcontext()
+
+def record(name, elapsed):
+    """計測結果を現在のリクエストに加算"""
+    if not _enabled or not has_request_context():
+        return
+    timings = g.get('perf_timings')
+    if timings is None:
+        return
+    total, count = timings.get(name, (0.0, 0))
+    timings[name] = (total + elapsed, count + 1)
+
+class _Timer:
+    """区間の所要時間を計測するコンテキストマネージャ"""
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+def timed(name):
+    """
+    指定した名前で区間を計測する
+
+    使い方:
+        with timed('s3'):
+            s3_client.generate_presigned_url(...)
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSONエンコード時間を計測するJSONプロバイダ"""
+
+    def dumps(self, obj, **kwargs):
+        with timed('json'):
+            return super().dumps(obj, **kwargs)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('perf_query_start')
+    if starts:
+        record('db', time.perf_counter() - starts.pop())
+
+def _format_server_timing(timings, total):
+    """Server-Timingヘッダーの値を組み立てる"""
+    parts = []
+    for name, (elapsed, count) in timings.items():
+        parts.append(f'{name};dur={elapsed * 1000:.2f};desc="{count} calls"')
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+def _dump_profile(app, profiler, total):
+    """遅いリクエストのcProfile結果をファイルに保存"""
+    profile_dir = app.config['PROFILING_CPROFILE_DIR']
+    try:
+        os.makedirs(profile_dir, exist_ok=True)
+        endpoint = (request.endpoint or 'unknown').replace('.', '_')
+        filename = f"{time.strftime('%Y%m%d%H%M%S')}_{request.method}_{endpoint}_{int(total * 1000)}ms.prof"
+        path = os.path.join(profile_dir, filename)
+        profiler.dump_stats(path)
+        logger.info(f"cProfile dump saved: {path}")
+    except Exception as e:
+        logger.error(f"Failed to save cProfile dump: {e}")
+
+def init_profiling(app):
+    """
+    パフォーマンス計測をアプリケーションに登録
+    PROFILING_ENABLEDがfalseの場合は何も登録しない
+
+    Args:
+        app: Flask アプリケーション
+    """
+    global _enabled
+
+    if not app.config.get('PROFILING_ENABLED', False):
+        return
+
+    _enabled = True
+    app.json = TimedJSONProvider(app)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    threshold = app.config['PROFILING_SLOW_THRESHOLD_MS'] / 1000
+    sample_rate = app.config['PROFILING_CPROFILE_SAMPLE_RATE']
+
+    @app.before_request
+    def _start_profiling():
+        g.perf_timings = {}
+        g.perf_start = time.perf_counter()
+        g.perf_profiler = None
+        if sample_rate > 0 and random.random() < sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.perf_profiler = profiler
+            except ValueError:
+                # 他のプロファイラが有効な場合はスキップ
+                pass
+
+    @app.after_request
+    def _finish_profiling(response):
+        start = g.get('perf_start')
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        timings = g.perf_timings
+
+        profiler = g.get('perf_profiler')
+        if profiler is not None:
+            profiler.disable()
+            if total >= threshold:
+                _dump_profile(app, profiler, total)
+
+        response.headers['Server-Timing'] = _format_server_timing(timings, total)
+
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+        }
+        for name, (elapsed, count) in timings.items():
+            fields[f'{name}_ms'] = round(elapsed * 1000, 2)
+            fields[f'{name}_count'] = count
+
+        message = ' '.join(f'{k}={v}' for k, v in fields.items())
+        if total >= threshold:
+            logger.warning(f"slow request {message}", extra={'perf': fields})
+        else:
+            logger.info(f"request timing {message}", extra={'perf': fields})
+        return response
@@ -0,0 +1,189 @@
+"""
+トークンバケットによるレート制限と同時実行数の制御（アドミッション制御）
+少数のワーカーを特定のクライアントや重いエンドポイントが占有しないようにする
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+class MemoryBackend:
+    """プロセス内のトークンバケット（LRUで保持するキー数を制限）"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """
+        トークンを消費する
+
+        Returns:
+            tuple: (許可されたか, 再試行までの秒数)
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                allowed, retry_after = True, 0.0
+                tokens -= cost
+            else:
+                allowed, retry_after = False, (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+class RedisBackend:
+    """Redisを使ったワーカー・タスク間で共有するトークンバケット"""
+
+    SCRIPT = """
+    local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local tokens = tonumber(data[1]) or burst
+    local ts = tonumber(data[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        retry_after = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url):
+        import redis  # 共有バックエンドを使う場合のみ必要
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._script = self._client.register_script(self.SCRIPT)
+        # Redisに接続できない間はプロセス内のバケットで代替する
+        self._fallback = MemoryBackend()
+
+    def take(self, key, rate, burst, cost=1):
+        try:
+            allowed, retry_after = self._script(
+                keys=[f"ratelimit:{key}"], args=[rate, burst, time.time(), cost]
+            )
+            return bool(allowed), float(retry_after)
+        except Exception as e:
+            logger.warning(f"Rate limit backend unavailable, using in-process buckets: {e}")
+            return self._fallback.take(key, rate, burst, cost)
+
+class ConcurrencyLimiter:
+    """エンドポイント分類ごとの同時実行数の上限（プロセス内）"""
+
+    def __init__(self, limits):
+        self._semaphores = {name: threading.BoundedSemaphore(n) for name, n in limits.items()}
+
+    def try_acquire(self, endpoint_class):
+        semaphore = self._semaphores.get(endpoint_class)
+        if semaphore is None:
+            return True
+        return semaphore.acquire(blocking=False)
+
+    def release(self, endpoint_class):
+        semaphore = self._semaphores.get(endpoint_class)
+        if semaphore is not None:
+            semaphore.release()
+
+def parse_limits(value):
+    """'export:2,bulk:2' 形式の設定を辞書に変換"""
+    limits = {}
+    for item in value.split(','):
+        if ':' in item:
+            name, n = item.split(':', 1)
+            limits[name.strip()] = int(n)
+    return limits
+
+def _client_ip():
+    """プロキシの段数を考慮してクライアントIPを取得（先頭の値は偽装できるため使わない）"""
+    proxy_count = current_app.config['RATE_LIMIT_PROXY_COUNT']
+    route = request.access_route
+    if proxy_count and len(route) >= proxy_count:
+        return route[-proxy_count]
+    return request.remote_addr or 'unknown'
+
+def _too_many_requests(retry_after, message='Too many requests'):
+    response = jsonify({'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def _endpoint_class(endpoint):
+    return current_app.config['RATE_LIMIT_ENDPOINT_CLASSES'].get(endpoint)
+
+def check_user_rate_limit(user):
+    """
+    ユーザー単位のレート制限（認証後に login_required から呼ばれる）
+
+    Returns:
+        Response: 制限を超えた場合は429レスポンス、許可された場合はNone
+    """
+    limiter = current_app.extensions.get('rate_limiter')
+    if limiter is None:
+        return None
+    config = current_app.config
+    allowed, retry_after = limiter.take(
+        f"user:{user.id}", config['RATE_LIMIT_USER_RATE'], config['RATE_LIMIT_USER_BURST']
+    )
+    if not allowed:
+        return _too_many_requests(retry_after)
+    return None
+
+def init_rate_limit(app):
+    """
+    レート制限と同時実行数の制御をアプリケーションに登録
+
+    Args:
+        app: Flask アプリケーション
+    """
+    if not app.config.get('RATE_LIMIT_ENABLED', False):
+        return
+
+    redis_url = app.config.get('RATE_LIMIT_REDIS_URL')
+    limiter = RedisBackend(redis_url) if redis_url else MemoryBackend()
+    concurrency = ConcurrencyLimiter(parse_limits(app.config['RATE_LIMIT_CONCURRENCY']))
+    app.extensions['rate_limiter'] = limiter
+
+    exempt = {'health_check', 'livez', 'readyz', 'uploaded_file'}
+
+    @app.before_request
+    def _admit_request():
+        if request.method == 'OPTIONS' or request.endpoint in exempt:
+            return None
+
+        allowed, retry_after = limiter.take(
+            f"ip:{_client_ip()}", app.config['RATE_LIMIT_IP_RATE'], app.config['RATE_LIMIT_IP_BURST']
+        )
+        if not allowed:
+            return _too_many_requests(retry_after)
+
+        endpoint_class = _endpoint_class(request.endpoint)
+        if endpoint_class:
+            if not concurrency.try_acquire(endpoint_class):
+                response = _too_many_requests(1, 'Server busy, please retry')
+                response.status_code = 503
+                return response
+            g.admitted_class = endpoint_class
+        return None
+
+    @app.teardown_request
+    def _release_request(exc):
+        endpoint_class = g.pop('admitted_class', None)
+        if endpoint_class:
+            concurrency.release(endpoint_class)
@@ -0,0 +1,331 @@
+"""
+外部依存（S3・Cognito JWKS・Secrets Manager）の呼び出しの保護
+依存ごとの接続/読み取りタイムアウト、リトライ予算の範囲でのジッター付きリトライ、
+サーキットブレーカー（オープン中は即座に失敗させ、呼び出し側はキャッシュの古い値を返す）
+
+依存が遅くなった場合にワーカーのスレッドが待ち続けて全体が詰まるのを防ぐ
+"""
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+from flask import jsonify, request
+
+logger = logging.getLogger(__name__)
+
+class DependencyUnavailable(Exception):
+    """サーキットブレーカーがオープン中、またはリトライしても失敗した"""
+
+    def __init__(self, name, message):
+        super().__init__(f"{name} unavailable: {message}")
+        self.name = name
+
+class InjectedFault(ConnectionError):
+    """FAULT_INJECTION で発生させた障害"""
+
+class CircuitBreaker:
+    """連続失敗でオープンし、一定時間後に1回だけ試行（ハーフオープン）して復旧を確認する"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def allow(self):
+        """呼び出してよいか（オープン中は False）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.stats['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            # ハーフオープン中は1件だけ通す
+            if self._probing:
+                self.stats['rejected'] += 1
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.stats['successes'] += 1
+            self._consecutive_failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                logger.info(f"Circuit breaker for {self.name} closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.stats['failures'] += 1
+            self._consecutive_failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.stats['opened'] += 1
+                logger.warning(f"Circuit breaker for {self.name} opened after "
+                               f"{self._consecutive_failures} consecutive failures")
+
+    def metrics(self):
+        with self._lock:
+            state = self.state
+            if state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                state = self.HALF_OPEN
+            return dict(self.stats, state=state, consecutive_failures=self._consecutive_failures)
+
+class RetryBudget:
+    """
+    リトライの予算
+    呼び出しごとに ratio 枚のトークンを貯め、リトライごとに1枚使う（最低でも毎秒 min_per_second 枚は補充）
+    障害時に全ての呼び出しがリトライして負荷が何倍にもなるのを防ぐ
+    """
+
+    def __init__(self, ratio, min_per_second=1.0, capacity=10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, amount):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + amount + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def withdraw(self):
+        """リトライしてよいか（予算を1つ消費する）"""
+        with self._lock:
+            self._refill(0)
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill(0)
+            return round(self._tokens, 2)
+
+class Fault:
+    """障害の注入（失敗率と遅延）"""
+
+    def __init__(self, error=0.0, latency=0.0):
+        self.error = error
+        self.latency = latency
+
+    def apply(self, name, read_timeout):
+        if self.latency:
+            # タイムアウトより長い遅延はタイムアウトとして扱う
+            time.sleep(min(self.latency, read_timeout))
+            if self.latency >= read_timeout:
+                raise InjectedFault(f"injected timeout for {name}")
+        if self.error and random.random() < self.error:
+            raise InjectedFault(f"injected error for {name}")
+
+def parse_faults(value):
+    """
+    FAULT_INJECTION の値を解析
+
+    例: "jwks:error=0.5,latency=3;s3:error=1" -> {'jwks': Fault(0.5, 3), 's3': Fault(1, 0)}
+    """
+    faults = {}
+    for item in value.split(';'):
+        if not item.strip():
+            continue
+        name, _, options = item.partition(':')
+        params = {}
+        for option in options.split(','):
+            key, _, number = option.partition('=')
+            if key.strip() in ('error', 'latency'):
+                params[key.strip()] = float(number)
+        faults[name.strip()] = Fault(**params)
+    return faults
+
+class Dependency:
+    """1つの外部依存の呼び出し設定と状態"""
+
+    def __init__(self, name, connect_timeout, read_timeout, max_attempts, failure_threshold,
+                 reset_timeout, retry_budget_ratio, fault=None, base_delay=0.1, max_delay=2.0):
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.fault = fault
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.budget = RetryBudget(retry_budget_ratio)
+        self.retries = 0
+
+    @property
+    def timeout(self):
+        """requests に渡す (接続, 読み取り) タイムアウト"""
+        return (self.connect_timeout, self.read_timeout)
+
+    def backoff(self, attempt):
+        """指数バックオフ（フルジッター）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, func, *args, retry_on=(Exception,), **kwargs):
+        """
+        タイムアウト・リトライ・サーキットブレーカー付きで func を呼び出す
+
+        Args:
+            func: 依存を呼び出す関数（タイムアウトは func 側で self.timeout を使って設定する）
+            retry_on: リトライする（＝依存の障害とみなす）例外。それ以外の例外はそのまま送出する
+
+        Raises:
+            DependencyUnavailable: ブレーカーがオープン中、またはリトライしても失敗した
+        """
+        if not self.breaker.allow():
+            raise DependencyUnavailable(self.name, 'circuit open')
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if self.fault:
+                    self.fault.apply(self.name, self.read_timeout)
+                result = func(*args, **kwargs)
+            except retry_on as e:
+                if attempt >= self.max_attempts or not self.budget.withdraw():
+                    self.breaker.record_failure()
+                    raise DependencyUnavailable(self.name, f"{e} (after {attempt} attempts)") from e
+                self.retries += 1
+                delay = self.backoff(attempt)
+                logger.info(f"Retrying {self.name} in {delay:.2f}s after error: {e}")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # 依存の障害ではない（404等）
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def metrics(self):
+        return dict(
+            self.breaker.metrics(),
+            retries=self.retries,
+            retry_budget_tokens=self.budget.tokens,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+        )
+
+_dependencies = {}
+_dependencies_lock = threading.Lock()
+
+def get_dependency(name):
+    """
+    依存の設定と状態を取得（ワーカー内で共有）
+    Secrets Manager はアプリケーション作成前に使うため、current_app ではなく環境変数から設定を作る
+    """
+    dependency = _dependencies.get(name)
+    if dependency is None:
+        from config import get_dependency_settings
+        with _dependencies_lock:
+            dependency = _dependencies.get(name)
+            if dependency is None:
+                faults = parse_faults(os.getenv('FAULT_INJECTION', ''))
+                dependency = Dependency(name, fault=faults.get(name), **get_dependency_settings()[name])
+                _dependencies[name] = dependency
+    return dependency
+
+def dependency_metrics():
+    """依存ごとのブレーカーの状態と回数"""
+    with _dependencies_lock:
+        dependencies = list(_dependencies.values())
+    return {dependency.name: dependency.metrics() for dependency in dependencies}
+
+def botocore_config(name):
+    """
+    boto3クライアント用の設定（タイムアウトとリトライ）
+    standard モードはジッター付きの指数バックオフと、クライアントごとのリトライ予算（retry quota）を持つ
+    """
+    from botocore.config import Config as BotoConfig
+    dependency = get_dependency(name)
+    return BotoConfig(
+        connect_timeout=dependency.connect_timeout,
+        read_timeout=dependency.read_timeout,
+        retries={'mode': 'standard', 'total_max_attempts': dependency.max_attempts}
+    )
+
+def instrument_boto_client(client, name):
+    """
+    boto3クライアントの全API呼び出しにサーキットブレーカーと障害の注入を適用
+    （リトライは botocore が行い、リトライ後の最終結果を1回としてブレーカーに記録する）
+    """
+    from botocore.exceptions import ConnectionClosedError
+    dependency = get_dependency(name)
+    service = client.meta.service_model.service_id.hyphenize()
+
+    def before_call(**kwargs):
+        if not dependency.breaker.allow():
+            raise DependencyUnavailable(name, 'circuit open')
+
+    def before_send(request, **kwargs):
+        # botocore の接続エラーとして発生させ、通常のリトライ処理を通す
+        if dependency.fault:
+            try:
+                dependency.fault.apply(name, dependency.read_timeout)
+            except InjectedFault as e:
+                raise ConnectionClosedError(endpoint_url=request.url, error=str(e))
+
+    def after_call(http_response, **kwargs):
+        if http_response.status_code >= 500:
+            dependency.breaker.record_failure()
+        else:
+            dependency.breaker.record_success()
+
+    def after_call_error(**kwargs):
+        dependency.breaker.record_failure()
+
+    client.meta.events.register(f"before-call.{service}", before_call)
+    client.meta.events.register(f"before-send.{service}", before_send)
+    client.meta.events.register(f"after-call.{service}", after_call)
+    client.meta.events.register(f"after-call-error.{service}", after_call_error)
+    return client
+
+def init_resilience(app):
+    """
+    依存ごとの状態を確認するエンドポイントを登録（DEPENDENCY_METRICS_TOKEN 設定時のみ）
+
+    Args:
+        app: Flask アプリケーション
+    """
+    access_token = app.config.get('DEPENDENCY_METRICS_TOKEN')
+    if not access_token:
+        return
+
+    @app.route('/api/debug/dependencies')
+    def dependency_status():
+        """このワーカーのサーキットブレーカーの状態（X-Debug-Token ヘッダーが必要）"""
+        token = request.headers.get('X-Debug-Token', '')
+        if not hmac.compare_digest(token, access_token):
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify({'pid': os.getpid(), 'dependencies': dependency_metrics()})
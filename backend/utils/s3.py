@@ -1,10 +1,11 @@
 import os
-import boto3
 from flask import current_app
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import uuid
 from .aws_client import create_s3_client_for_flask
+from .profiling import timed
+from .image_dedup import content_key, checksum_header, release_image_for_delete
 
 def allowed_file(filename):
     """ファイル拡張子が許可されているかをチェック"""
@@ -36,36 +37,105 @@ def save_file_locally(file):
     # ローカルファイルの相対的URLを返す
     return f"/uploads/{filename}"
 
-def generate_presigned_url(filename, file_type, user_id=None):
+def build_upload_key(filename, user_id=None):
+    """アップロード先のS3キーを生成"""
+    if user_id:
+        return f"users/{user_id}/diary-images/{generate_unique_filename(filename)}"
+    return f"diary-images/{generate_unique_filename(filename)}"
+
+def build_file_url(key):
+    """S3キーから保存用のファイルURLを生成"""
+    return f"https://{current_app.config['S3_BUCKET_NAME']}.s3.{current_app.config['AWS_REGION']}.amazonaws.com/{key}"
+
+def _presign_put(s3_client, key, file_type, content_hash=None):
+    """PUTアップロード用の署名付きURLを生成（ハッシュ指定時はS3側で内容を検証）"""
+    params = {
+        'Bucket': current_app.config['S3_BUCKET_NAME'],
+        'Key': key,
+        'ContentType': file_type
+    }
+    if content_hash:
+        params['ChecksumSHA256'] = checksum_header(content_hash)
+    
+    result = {
+        'upload_url': s3_client.generate_presigned_url(
+            'put_object',
+            Params=params,
+            # 1時間
+            ExpiresIn=3600
+        ),
+        'file_url': build_file_url(key)
+    }
+    if content_hash:
+        # クライアントはこのヘッダーを付けてPUTする
+        result['headers'] = {'x-amz-checksum-sha256': params['ChecksumSHA256']}
+    return result
+
+def generate_presigned_url(filename, file_type, user_id=None, content_hash=None):
     """S3アップロード用の署名付きURLを生成"""
     if not current_app.config['USE_S3']:
         return None
     
-    s3_client = create_s3_client_for_flask(current_app)
-    
-    if user_id:
-        key = f"users/{user_id}/diary-images/{generate_unique_filename(filename)}"
+    if content_hash and user_id:
+        key = content_key(user_id, content_hash, filename)
     else:
-        key = f"diary-images/{generate_unique_filename(filename)}"
+        key = build_upload_key(filename, user_id)
     
-    presigned_url = s3_client.generate_presigned_url(
-        'put_object',
-        Params={
-            'Bucket': current_app.config['S3_BUCKET_NAME'],
-            'Key': key,
-            'ContentType': file_type
-        },
-        # 1時間
-        ExpiresIn=3600
-    )
+    with timed('s3'):
+        s3_client = create_s3_client_for_flask(current_app)
+        # プリサインドURLと最終ファイルURLの両方を返す
+        return _presign_put(s3_client, key, file_type, content_hash)
+
+def generate_presigned_uploads(files, user_id=None, use_post=False):
+    """
+    複数ファイル分のS3アップロード用署名をまとめて生成
     
-    # プリサインドURLと最終ファイルURLの両方を返す
-    file_url = f"https://{current_app.config['S3_BUCKET_NAME']}.s3.{current_app.config['AWS_REGION']}.amazonaws.com/{key}"
+    Args:
+        files: {'filename': ..., 'file_type': ..., 'content_hash': ...（任意）} のリスト
+        user_id: ユーザーID
+        use_post: Trueの場合はサイズ上限付きのPOSTポリシーを生成
+        
+    Returns:
+        list: ファイルごとの署名結果（入力と同じ順序）
+    """
+    if not current_app.config['USE_S3']:
+        return None
     
-    return {
-        'upload_url': presigned_url,
-        'file_url': file_url
-    }
+    bucket_name = current_app.config['S3_BUCKET_NAME']
+    max_size = current_app.config['MAX_UPLOAD_SIZE']
+    results = []
+    
+    with timed('s3'):
+        s3_client = create_s3_client_for_flask(current_app)
+        for f in files:
+            content_hash = f.get('content_hash')
+            if content_hash and user_id:
+                key = content_key(user_id, content_hash, f['filename'])
+            else:
+                key = build_upload_key(f['filename'], user_id)
+            file_type = f.get('file_type', 'image/jpeg')
+            
+            if use_post:
+                # POSTポリシー: Content-Typeとファイルサイズをサーバー側で制限
+                post = s3_client.generate_presigned_post(
+                    Bucket=bucket_name,
+                    Key=key,
+                    Fields={'Content-Type': file_type},
+                    Conditions=[
+                        {'Content-Type': file_type},
+                        ['content-length-range', 1, max_size]
+                    ],
+                    ExpiresIn=3600
+                )
+                results.append({
+                    'upload_url': post['url'],
+                    'fields': post['fields'],
+                    'file_url': build_file_url(key)
+                })
+            else:
+                results.append(_presign_put(s3_client, key, file_type, content_hash))
+    
+    return results
 
 def delete_file(file_url, user_id=None):
     """ストレージからファイルを削除"""
@@ -83,12 +153,17 @@ def delete_file(file_url, user_id=None):
         if file_url.startswith(expected_prefix):
             key = file_url[len(expected_prefix):]
             
-            current_app.logger.info(f"S3オブジェクトの削除を試行中: Bucket={bucket_name}, Key={key}")
+            # 重複排除された画像は他の日記から参照されている間は削除しない
+            if not release_image_for_delete(user_id, key):
+                current_app.logger.info(f"他の日記から参照されているため削除をスキップ: {key}")
+                return
             
-            s3_client = create_s3_client_for_flask(current_app)
+            current_app.logger.info(f"S3オブジェクトの削除を試行中: Bucket={bucket_name}, Key={key}")
             
             try:
-                s3_client.delete_object(Bucket=bucket_name, Key=key)
+                with timed('s3'):
+                    s3_client = create_s3_client_for_flask(current_app)
+                    s3_client.delete_object(Bucket=bucket_name, Key=key)
                 current_app.logger.info(f"S3オブジェクトを正常に削除しました: {key}")
             except Exception as e:
                 current_app.logger.error(f"S3オブジェクトの削除に失敗しました: Bucket={bucket_name}, Key={key}, Error={e}")
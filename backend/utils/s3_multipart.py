@@ -0,0 +1,222 @@
+"""
+S3マルチパートアップロードユーティリティ
+大きな画像・動画をパートに分割して並列・再開可能にアップロードする
+"""
+from botocore.exceptions import ClientError
+from flask import current_app
+from models import db, MultipartUpload
+from .aws_client import create_s3_client_for_flask
+from .profiling import timed
+
+# S3の制約: パート番号は1〜10000
+MAX_PART_NUMBER = 10000
+
+# 完了時にクライアントの指定したパートが不正な場合のエラーコード（400として返す）
+INVALID_PART_ERRORS = {'InvalidPart', 'InvalidPartOrder', 'EntityTooSmall'}
+
+def is_invalid_part_error(error):
+    """complete_multipart_upload の失敗がクライアントの指定したパートによるものか"""
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in INVALID_PART_ERRORS
+
+def create_multipart_upload(key, file_type):
+    """マルチパートアップロードを開始してS3のUploadIdを返す"""
+    with timed('s3'):
+        s3_client = create_s3_client_for_flask(current_app)
+        response = s3_client.create_multipart_upload(
+            Bucket=current_app.config['S3_BUCKET_NAME'],
+            Key=key,
+            ContentType=file_type
+        )
+    return response['UploadId']
+
+def presign_part_urls(key, upload_id, part_numbers, part_sizes, expires_in=3600):
+    """
+    指定したパート番号分のアップロード用署名付きURLをまとめて生成
+    Content-Length を署名に含め、宣言したファイルサイズから求めたバイト数以外のパートは拒否させる
+    
+    Args:
+        part_sizes: {パート番号: バイト数}
+    
+    Returns:
+        list: [{'part_number': n, 'upload_url': url}, ...]
+    """
+    bucket_name = current_app.config['S3_BUCKET_NAME']
+    results = []
+    with timed('s3'):
+        s3_client = create_s3_client_for_flask(current_app)
+        for part_number in part_numbers:
+            url = s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': bucket_name,
+                    'Key': key,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number,
+                    'ContentLength': part_sizes[part_number]
+                },
+                ExpiresIn=expires_in
+            )
+            results.append({'part_number': part_number, 'upload_url': url})
+    return results
+
+def list_uploaded_parts(key, upload_id):
+    """アップロード済みのパート一覧を取得（再開用）"""
+    bucket_name = current_app.config['S3_BUCKET_NAME']
+    parts = []
+    with timed('s3'):
+        s3_client = create_s3_client_for_flask(current_app)
+        paginator = s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                parts.append({
+                    'part_number': part['PartNumber'],
+                    'etag': part['ETag'],
+                    'size': part['Size']
+                })
+    return parts
+
+def verify_uploaded_parts(upload, parts, uploaded):
+    """
+    完了させるパートがS3にアップロードされ、宣言したファイルサイズどおりかを確認
+
+    Args:
+        upload: MultipartUpload
+        parts: クライアントが指定した [{'part_number': n, 'etag': '...'}, ...]
+        uploaded: list_uploaded_parts の結果
+
+    Returns:
+        tuple: (エラー文, アップロードを破棄すべきか)。問題がない場合は (None, False)
+    """
+    uploaded = {part['part_number']: part for part in uploaded}
+    total = 0
+    for part in parts:
+        actual = uploaded.get(part['part_number'])
+        if actual is None or actual['etag'].strip('"') != str(part['etag']).strip('"'):
+            # 再アップロードすれば完了できる
+            return 'Part has not been uploaded', False
+        if actual['size'] != upload.expected_part_size(part['part_number']):
+            return 'Part size does not match file_size', True
+        total += actual['size']
+    if total != upload.file_size:
+        return 'Uploaded size does not match file_size', True
+    return None, False
+
+def complete_multipart_upload(key, upload_id, parts):
+    """
+    マルチパートアップロードを完了
+    
+    Args:
+        parts: [{'part_number': n, 'etag': '...'}, ...]
+    """
+    ordered = sorted(parts, key=lambda p: p['part_number'])
+    with timed('s3'):
+        s3_client = create_s3_client_for_flask(current_app)
+        s3_client.complete_multipart_upload(
+            Bucket=current_app.config['S3_BUCKET_NAME'],
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                'Parts': [{'PartNumber': p['part_number'], 'ETag': p['etag']} for p in ordered]
+            }
+        )
+
+def abort_multipart_upload(s3_client, bucket_name, key, upload_id):
+    """マルチパートアップロードを中止してアップロード済みパートを破棄"""
+    try:
+        s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+    except s3_client.exceptions.NoSuchUpload:
+        # 既に完了・中止済み
+        pass
+
+def _mark_aborted(upload_id, cutoff):
+    """
+    DB上の放置されたアップロードを中止済みにしてコミット
+    （判定後にパートの署名が発行された場合は updated_at が更新されているため対象外になる）
+
+    Returns:
+        bool: 中止済みにした場合True
+    """
+    result = db.session.execute(
+        db.update(MultipartUpload)
+        .where(MultipartUpload.s3_upload_id == upload_id, MultipartUpload.status == 'in_progress',
+               MultipartUpload.updated_at < cutoff)
+        .values(status='aborted')
+    )
+    db.session.commit()
+    return result.rowcount > 0
+
+def cleanup_abandoned_uploads(s3_client, bucket_name, cutoff, dry_run=False, log=print):
+    """
+    放置されたマルチパートアップロードを中止
+
+    1. S3上で cutoff より前に開始された未完了アップロードを中止する（DBに記録のないものも含む）
+       ただしDB上で最近パートの署名を発行した（updated_at が cutoff 以降の）再開可能なアップロードは中止しない
+       DBに記録のあるものは先に中止済みにしてから S3 で中止する（S3での中止に失敗しても次回再試行される）
+    2. DB上で放置されているが S3 に存在しない（完了・中止済みの）アップロードを中止済みにする
+
+    Returns:
+        dict: 集計結果
+    """
+    summary = {'aborted': 0, 'active': 0, 'marked': 0, 'missing': 0, 'errors': 0}
+    seen = set()
+
+    paginator = s3_client.get_paginator('list_multipart_uploads')
+    for page in paginator.paginate(Bucket=bucket_name):
+        uploads = page.get('Uploads', [])
+        seen.update(upload['UploadId'] for upload in uploads)
+        uploads = [upload for upload in uploads if upload['Initiated'] < cutoff]
+        if not uploads:
+            continue
+
+        tracked = {
+            row.s3_upload_id: row for row in db.session.execute(
+                db.select(MultipartUpload.s3_upload_id, MultipartUpload.status, MultipartUpload.updated_at)
+                .where(MultipartUpload.s3_upload_id.in_([upload['UploadId'] for upload in uploads]))
+            )
+        }
+        for upload in uploads:
+            row = tracked.get(upload['UploadId'])
+            if row is not None and row.status == 'in_progress' and row.updated_at >= cutoff:
+                # 開始は古いが最近もパートをアップロードしている再開可能なアップロード
+                summary['active'] += 1
+                continue
+
+            log(f"{'[dry-run] ' if dry_run else ''}Abort {upload['Key']} (initiated {upload['Initiated']})")
+            if dry_run:
+                summary['aborted'] += 1
+                continue
+            if row is not None and row.status == 'in_progress':
+                if not _mark_aborted(upload['UploadId'], cutoff):
+                    summary['active'] += 1
+                    continue
+                summary['marked'] += 1
+            try:
+                abort_multipart_upload(s3_client, bucket_name, upload['Key'], upload['UploadId'])
+                summary['aborted'] += 1
+            except Exception as e:
+                log(f"✗ Failed to abort {upload['Key']}: {e}")
+                summary['errors'] += 1
+
+    stale = db.session.execute(
+        db.select(MultipartUpload.s3_key, MultipartUpload.s3_upload_id).where(
+            MultipartUpload.status == 'in_progress', MultipartUpload.updated_at < cutoff
+        )
+    ).all()
+    for row in stale:
+        if row.s3_upload_id in seen:
+            continue
+        # 一覧の取得後に開始されたものでないことを確認してから中止済みにする
+        try:
+            s3_client.list_parts(Bucket=bucket_name, Key=row.s3_key, UploadId=row.s3_upload_id, MaxParts=1)
+            continue
+        except s3_client.exceptions.NoSuchUpload:
+            pass
+        except Exception as e:
+            log(f"✗ Failed to check {row.s3_key}: {e}")
+            summary['errors'] += 1
+            continue
+        log(f"{'[dry-run] ' if dry_run else ''}Mark {row.s3_key} as aborted (no longer in S3)")
+        if dry_run or _mark_aborted(row.s3_upload_id, cutoff):
+            summary['missing'] += 1
+    db.session.rollback()
+    return summary
@@ -1,43 +1,119 @@
 """
 画像アクセス用の署名付きURL生成のためのS3 URLユーティリティ
 """
-import boto3
+import threading
+import time
+from collections import OrderedDict
 from flask import current_app
 from datetime import datetime, timedelta
 from .aws_client import create_s3_client_for_flask
+from .profiling import timed
+from .cloudfront_signer import is_cookie_mode, get_cloudfront_url
 
-def get_presigned_url(image_url):
-    """S3オブジェクトアクセス用の署名付きURLを生成"""
-    if not image_url or not current_app.config['USE_S3']:
-        return image_url
-    
+PRESIGNED_URL_EXPIRES = 3600  # 1 hour
+
+# 署名に失敗した場合（認証情報の更新失敗など）に返す直近の署名付きURL（キー -> (URL, 署名時刻)）
+MAX_REMEMBERED_URLS = 10000
+STALE_URL_MIN_REMAINING = 300  # 有効期限までこの秒数以上残っているURLのみ返す
+_signed_urls = OrderedDict()
+_signed_urls_lock = threading.Lock()
+
+def _remember_url(key, url):
+    with _signed_urls_lock:
+        _signed_urls[key] = (url, time.time())
+        _signed_urls.move_to_end(key)
+        while len(_signed_urls) > MAX_REMEMBERED_URLS:
+            _signed_urls.popitem(last=False)
+
+def _stale_url(key):
+    """まだ有効な直近の署名付きURL（なければNone）"""
+    with _signed_urls_lock:
+        entry = _signed_urls.get(key)
+    if entry and time.time() - entry[1] < PRESIGNED_URL_EXPIRES - STALE_URL_MIN_REMAINING:
+        return entry[0]
+    return None
+
+def extract_s3_key(image_url):
+    """画像URLからS3キーを取り出す（S3の画像でない場合はNone）"""
     bucket_name = current_app.config['S3_BUCKET_NAME']
     s3_prefix = f"https://{bucket_name}.s3.{current_app.config['AWS_REGION']}.amazonaws.com/"
-    
+
     # ローカルパスの場合はS3キーに変換
     if image_url.startswith('/uploads/'):
         filename = image_url.replace('/uploads/', '')
-        key = f"diary-images/{filename}"
+        return f"diary-images/{filename}"
     elif image_url.startswith(s3_prefix):
         # S3 URLの場合はキーを抽出
-        key = image_url.replace(s3_prefix, '')
-    else:
-        # その他の形式はそのまま返す
+        return image_url.replace(s3_prefix, '')
+    # その他の形式はそのまま扱う
+    return None
+
+def _sign_get_object(s3_client, key):
+    url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': current_app.config['S3_BUCKET_NAME'],
+            'Key': key
+        },
+        ExpiresIn=PRESIGNED_URL_EXPIRES
+    )
+    _remember_url(key, url)
+    return url
+
+def get_presigned_url(image_url):
+    """S3オブジェクトアクセス用の署名付きURLを生成"""
+    if not image_url or not current_app.config['USE_S3']:
+        return image_url
+
+    key = extract_s3_key(image_url)
+    if key is None:
         return image_url
     
+    # 署名付きCookie方式ではユーザー配下の画像は署名なしの安定したURLを返す
+    if key.startswith('users/') and is_cookie_mode():
+        return get_cloudfront_url(key)
+
     # プリサインドURLを生成
-    s3_client = create_s3_client_for_flask(current_app)
-    
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': bucket_name,
-                'Key': key
-            },
-            ExpiresIn=3600  # 1 hour
-        )
+        with timed('s3'):
+            s3_client = create_s3_client_for_flask(current_app)
+            presigned_url = _sign_get_object(s3_client, key)
         return presigned_url
     except Exception as e:
         current_app.logger.error(f"Failed to generate presigned URL: {e}")
-        return image_url
\ No newline at end of file
+        return _stale_url(key) or image_url
+
+def get_presigned_urls(image_urls):
+    """
+    複数の画像URLをまとめて署名付きURLに変換
+    S3クライアントは1回だけ作成して使い回す
+
+    Args:
+        image_urls: 画像URLのリスト（Noneを含んでもよい）
+
+    Returns:
+        list: 入力と同じ順序の署名付きURLのリスト
+    """
+    if not current_app.config['USE_S3']:
+        return list(image_urls)
+
+    results = []
+    s3_client = None
+    cookie_mode = is_cookie_mode()
+    with timed('s3'):
+        for image_url in image_urls:
+            key = extract_s3_key(image_url) if image_url else None
+            if key is None:
+                results.append(image_url)
+                continue
+            if cookie_mode and key.startswith('users/'):
+                results.append(get_cloudfront_url(key))
+                continue
+            try:
+                if s3_client is None:
+                    s3_client = create_s3_client_for_flask(current_app)
+                results.append(_sign_get_object(s3_client, key))
+            except Exception as e:
+                current_app.logger.error(f"Failed to generate presigned URL: {e}")
+                results.append(_stale_url(key) or image_url)
+    return results
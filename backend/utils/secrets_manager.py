@@ -6,9 +6,11 @@ import json
 import boto3
 from botocore.exceptions import ClientError
 from utils.cache import cached_function
+from utils.resilience import botocore_config, instrument_boto_client
 
 
-@cached_function('secrets_manager', ttl_seconds=600)  # 10分キャッシュ
+# 10分キャッシュ（取得できない場合は最大1時間前の値を使い続ける）
+@cached_function('secrets_manager', ttl_seconds=600, stale_seconds=3600)
 def get_secret(secret_name, region_name='ap-northeast-1'):
     """
     AWS Secrets Managerからシークレットを取得
@@ -25,11 +27,14 @@ def get_secret(secret_name, region_name='ap-northeast-1'):
     """
     # Secrets Managerクライアントを作成
     # 本番環境ではIAMロールを使用（クレデンシャル省略）
+    # タイムアウト・リトライ・サーキットブレーカーを適用
     session = boto3.session.Session()
     client = session.client(
         service_name='secretsmanager',
-        region_name=region_name
+        region_name=region_name,
+        config=botocore_config('secrets_manager')
     )
+    instrument_boto_client(client, 'secrets_manager')
 
     try:
         get_secret_value_response = client.get_secret_value(
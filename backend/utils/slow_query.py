@@ -0,0 +1,238 @@
+"""
+遅いSQLの自動記録（SLOW_QUERY_ENABLED=true の場合のみ）
+しきい値を超えた文を正規化して集計し、パラメータ・リテラルを伏せた上で呼び出し元と EXPLAIN をログに出力する
+ログと EXPLAIN はレート制限・サンプリングし、ワーカーごとの上位N件をエンドポイントで返す
+"""
+import hmac
+import logging
+import os
+import random
+import re
+import threading
+import time
+import traceback
+from flask import jsonify, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .rate_limit import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+# 集計する正規化済みの文の数の上限（超えた場合は合計時間の最も小さいものを捨てる）
+MAX_TRACKED_STATEMENTS = 500
+
+_PARAM_PATTERN = re.compile(r"%\([^)]+\)s|%s|\$\d+")
+_STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_PATTERN = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# EXPLAIN の出力に展開されたパラメータ（比較の右辺の数値。コスト・行数などの数値は残す）
+_PLAN_NUMBER_PATTERN = re.compile(r"( (?:=|<>|!=|<=|>=|<|>)) +-?\d+(?:\.\d+)?\b")
+
+EXPLAINABLE = {'select', 'with', 'insert', 'update', 'delete'}
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def normalize_sql(statement):
+    """リテラル・パラメータ・IN リストを ? にまとめ、同じ形の文を1つに集計できるようにする"""
+    sql = _STRING_PATTERN.sub('?', statement)
+    sql = _PARAM_PATTERN.sub('?', sql)
+    sql = _NUMBER_PATTERN.sub('?', sql)
+    sql = _IN_LIST_PATTERN.sub('IN (...)', sql)
+    return _WHITESPACE_PATTERN.sub(' ', sql).strip()
+
+def redact_plan(plan):
+    """
+    EXPLAIN の出力からリテラルを伏せる
+    （psycopg2 はパラメータを文字列に展開して送るため、プランの条件にメールアドレスなどの値がそのまま現れる）
+    """
+    plan = _STRING_PATTERN.sub("'?'", plan)
+    return _PLAN_NUMBER_PATTERN.sub(r"\1 ?", plan)
+
+def redact(value):
+    """ログに出すパラメータ値（文字列・バイト列は長さのみ）"""
+    if isinstance(value, (str, bytes)):
+        return f"<redacted len={len(value)}>"
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    text = repr(value)
+    return text if len(text) <= 64 else text[:61] + '...'
+
+def call_site():
+    """アプリケーションのコード内でクエリを発行した関数（ルート名と関数）"""
+    endpoint = request.endpoint if has_request_context() else None
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(_APP_ROOT) and filename != __file__ and 'site-packages' not in filename:
+            location = f"{os.path.relpath(filename, _APP_ROOT)}:{frame.lineno} {frame.name}"
+            return {'endpoint': endpoint, 'function': location}
+    return {'endpoint': endpoint, 'function': None}
+
+class SlowQueryTracker:
+    """遅い文の記録・集計"""
+
+    def __init__(self, threshold_ms, explain, sample_rate, logs_per_minute):
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.sample_rate = sample_rate
+        self.logs_per_minute = logs_per_minute
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._limiter = MemoryBackend(max_keys=1)
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def on_error(self, exception_context):
+        """失敗した文の開始時刻を捨てる（残すと以降の文の経過時間がずれる）"""
+        if exception_context.cursor is None or exception_context.connection is None:
+            return
+        starts = exception_context.connection.info.get('slow_query_start')
+        if starts:
+            starts.pop()
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed < self.threshold:
+            return
+
+        normalized = normalize_sql(statement)
+        site = call_site()
+        self._record(normalized, elapsed, site)
+
+        # ログ（とEXPLAIN）はサンプリングした上でレート制限する
+        if random.random() >= self.sample_rate:
+            return
+        allowed, _ = self._limiter.take('log', self.logs_per_minute / 60, self.logs_per_minute)
+        if not allowed:
+            return
+
+        fields = {
+            'duration_ms': round(elapsed * 1000, 2),
+            'endpoint': site['endpoint'],
+            'function': site['function'],
+            'sql': normalized,
+            'params': redact(parameters),
+        }
+        if self.explain and not executemany:
+            fields['plan'] = self._explain(cursor, statement, parameters)
+        logger.warning(
+            f"slow query {fields['duration_ms']}ms at {site['function']} ({site['endpoint']}): {normalized}",
+            extra={'slow_query': fields}
+        )
+
+    def _explain(self, cursor, statement, parameters):
+        """
+        同じ接続で EXPLAIN を取得（ANALYZE は付けないので文は再実行されない）
+        SQLAlchemyのイベントを発生させないようDBAPIのカーソルを直接使う
+        EXPLAIN が失敗してもリクエストのトランザクションを中断させないよう SAVEPOINT の中で実行する
+        """
+        words = statement.split(None, 1)
+        if not words or words[0].lower() not in EXPLAINABLE:
+            return None
+        dbapi_conn = cursor.connection
+        in_transaction = not getattr(dbapi_conn, 'autocommit', False)
+        try:
+            explain_cursor = dbapi_conn.cursor()
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+        try:
+            if in_transaction:
+                explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(f"EXPLAIN {statement}", parameters)
+                plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+            except Exception as e:
+                if in_transaction:
+                    explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                    explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+                return f"EXPLAIN failed: {type(e).__name__}"
+            if in_transaction:
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return redact_plan(plan)
+        except Exception as e:
+            return f"EXPLAIN failed: {type(e).__name__}"
+        finally:
+            explain_cursor.close()
+
+    def _record(self, normalized, elapsed, site):
+        with self._lock:
+            stats = self._stats.get(normalized)
+            if stats is None:
+                if len(self._stats) >= MAX_TRACKED_STATEMENTS:
+                    smallest = min(self._stats, key=lambda key: self._stats[key]['total_ms'])
+                    del self._stats[smallest]
+                stats = self._stats[normalized] = {
+                    'sql': normalized, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'call_sites': {}
+                }
+            elapsed_ms = elapsed * 1000
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            key = f"{site['endpoint']} {site['function']}"
+            stats['call_sites'][key] = stats['call_sites'].get(key, 0) + 1
+
+    def top(self, n, order_by='total_ms'):
+        """合計時間（または最大時間・回数）の多い順に上位n件"""
+        with self._lock:
+            rows = [dict(stats, call_sites=dict(stats['call_sites'])) for stats in self._stats.values()]
+        for row in rows:
+            row['mean_ms'] = round(row['total_ms'] / row['count'], 2)
+            row['total_ms'] = round(row['total_ms'], 2)
+            row['max_ms'] = round(row['max_ms'], 2)
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+def init_slow_query_log(app):
+    """
+    遅いSQLの記録をアプリケーションに登録
+    SLOW_QUERY_ENABLEDがfalseの場合は何も登録しない
+
+    Args:
+        app: Flask アプリケーション
+    """
+    if not app.config.get('SLOW_QUERY_ENABLED', False):
+        return
+
+    tracker = SlowQueryTracker(
+        threshold_ms=app.config['SLOW_QUERY_THRESHOLD_MS'],
+        explain=app.config['SLOW_QUERY_EXPLAIN'],
+        sample_rate=app.config['SLOW_QUERY_SAMPLE_RATE'],
+        logs_per_minute=app.config['SLOW_QUERY_LOGS_PER_MINUTE']
+    )
+    app.extensions['slow_query_tracker'] = tracker
+    event.listen(Engine, 'before_cursor_execute', tracker.before)
+    event.listen(Engine, 'after_cursor_execute', tracker.after)
+    event.listen(Engine, 'handle_error', tracker.on_error)
+
+    access_token = app.config.get('SLOW_QUERY_ACCESS_TOKEN')
+    default_limit = app.config['SLOW_QUERY_TOP_N']
+
+    @app.route('/api/debug/slow-queries', methods=['GET', 'DELETE'])
+    def slow_queries():
+        """このワーカーで記録した遅い文の上位N件（X-Debug-Token ヘッダーが必要）"""
+        token = request.headers.get('X-Debug-Token', '')
+        if not access_token or not hmac.compare_digest(token, access_token):
+            return jsonify({'error': 'Not found'}), 404
+        if request.method == 'DELETE':
+            tracker.reset()
+            return jsonify({'message': 'Slow query stats cleared'})
+
+        order_by = request.args.get('order_by', 'total_ms')
+        if order_by not in ('total_ms', 'max_ms', 'count', 'mean_ms'):
+            return jsonify({'error': 'order_by must be one of total_ms, max_ms, count, mean_ms'}), 400
+        limit = min(max(request.args.get('limit', default_limit, type=int), 1), MAX_TRACKED_STATEMENTS)
+        return jsonify({
+            'pid': os.getpid(),
+            'threshold_ms': app.config['SLOW_QUERY_THRESHOLD_MS'],
+            'statements': tracker.top(limit, order_by)
+        })
@@ -0,0 +1,81 @@
+"""
+差分同期（/api/sync）のトークンと削除記録（tombstone）
+"""
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from models import db, Diary, DiaryArchiveEntry, Tombstone
+
+class InvalidSyncToken(ValueError):
+    pass
+
+def encode_token(state):
+    """同期状態をクライアントに渡す不透明なトークンに変換"""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_token(token):
+    """
+    トークンを同期状態に戻す
+
+    Returns:
+        dict: since（この時刻より後の変更を返す、Noneは全件）、high（次回のsinceになる時刻）、
+              cursor（日記のページング位置 [updated_at, id]）
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        state = json.loads(raw)
+        return {
+            'since': _parse_time(state.get('since')),
+            'high': _parse_time(state.get('high')),
+            'cursor': (_parse_time(state['cursor'][0]), uuid.UUID(state['cursor'][1]))
+                      if state.get('cursor') else None,
+        }
+    except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+        raise InvalidSyncToken(str(e))
+
+def _parse_time(value):
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        raise ValueError('timezone is required')
+    return parsed
+
+def record_diary_tombstones(user_id, diary_ids):
+    """削除した日記を記録（コミットは呼び出し側で行う）"""
+    if diary_ids:
+        db.session.execute(db.insert(Tombstone), [
+            {'user_id': user_id, 'entity_type': 'diary', 'entity_id': diary_id}
+            for diary_id in diary_ids
+        ])
+
+def record_pet_tombstones(pet):
+    """削除するペットとカスケード削除される日記（アーカイブした日記を含む）を記録（コミットは呼び出し側で行う）"""
+    db.session.execute(db.insert(Tombstone).values(
+        user_id=pet.user_id, entity_type='pet', entity_id=pet.id
+    ))
+    db.session.execute(
+        db.insert(Tombstone).from_select(
+            ['user_id', 'entity_type', 'entity_id'],
+            db.select(Diary.user_id, db.literal('diary'), Diary.id).where(Diary.pet_id == pet.id)
+            .union_all(
+                db.select(DiaryArchiveEntry.user_id, db.literal('diary'), DiaryArchiveEntry.id)
+                .where(DiaryArchiveEntry.pet_id == pet.id)
+            )
+        )
+    )
+
+def purge_tombstones(engine, retention_days):
+    """
+    保持期間を過ぎた削除記録を削除
+
+    Returns:
+        int: 削除した件数
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    with engine.begin() as conn:
+        result = conn.execute(text("DELETE FROM tombstones WHERE deleted_at < :cutoff"), {'cutoff': cutoff})
+    return result.rowcount
@@ -26,6 +26,74 @@ export const authAPI = {
   },
 };
 
+// ダッシュボードAPI（ユーザー・ペット・最新の日記を1回で取得）
+export const dashboardAPI = {
+  get: async (limit = 10, perPet = 0) => {
+    const response = await api.get(`/dashboard?limit=${limit}&per_pet=${perPet}`);
+    return response.data;
+  },
+};
+
+// 差分同期API（前回のnext_tokenを渡すと変更分のみ返る。has_moreの間は続けて取得）
+export const syncAPI = {
+  get: async (since?: string) => {
+    const response = await api.get('/sync', { params: since ? { since } : {} });
+    return response.data;
+  },
+};
+
+// 変更通知API（Server-Sent Events）
+// EventSourceは認証ヘッダーを送れないためfetchのストリームで受信する
+// 戻り値の関数を呼ぶと購読を終了する
+export const eventsAPI = {
+  subscribe: (onEvent: (event: { type: string; data: any }) => void) => {
+    const controller = new AbortController();
+
+    const connect = async () => {
+      let retryMs = 3000;
+      try {
+        const token = localStorage.getItem('token');
+        const response = await fetch(`${API_BASE_URL}/events`, {
+          headers: token ? { Authorization: `Bearer ${token}` } : {},
+          signal: controller.signal,
+        });
+        if (!response.ok || !response.body) {
+          retryMs = Number(response.headers.get('Retry-After') || 5) * 1000;
+          throw new Error(`events: ${response.status}`);
+        }
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value;
+          let end;
+          while ((end = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let type = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+              if (line.startsWith('event: ')) type = line.slice(7);
+              else if (line.startsWith('data: ')) data += line.slice(6);
+              else if (line.startsWith('retry: ')) retryMs = Number(line.slice(7));
+            }
+            if (data) onEvent({ type, data: JSON.parse(data) });
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+      }
+      // サーバー側の切断・エラー時は再接続
+      if (!controller.signal.aborted) setTimeout(connect, retryMs);
+    };
+
+    connect();
+    return () => controller.abort();
+  },
+};
+
 // ペットAPI
 export const petsAPI = {
   getAll: async () => {
@@ -36,8 +104,11 @@ export const petsAPI = {
     const response = await api.get(`/pets/${id}`);
     return response.data;
   },
-  create: async (data: any) => {
-    const response = await api.post('/pets', data);
+  // 再送時に同じキーを渡すと二重に作成されない
+  create: async (data: any, idempotencyKey: string = crypto.randomUUID()) => {
+    const response = await api.post('/pets', data, {
+      headers: { 'Idempotency-Key': idempotencyKey },
+    });
     return response.data;
   },
   update: async (id: string, data: any) => {
@@ -48,26 +119,62 @@ export const petsAPI = {
     const response = await api.delete(`/pets/${id}`);
     return response.data;
   },
+  // 投稿カレンダーと月別統計（from/to: YYYY-MM-DD）
+  getStats: async (id: string, from?: string, to?: string) => {
+    const params = new URLSearchParams();
+    if (from) params.append('from', from);
+    if (to) params.append('to', to);
+    const response = await api.get(`/pets/${id}/stats?${params.toString()}`);
+    return response.data;
+  },
+};
+
+// 日記一覧の絞り込み（サーバー側で絞り込んでからページ分割する）
+export interface DiaryFilters {
+  from?: string;  // YYYY-MM-DD（その日を含む）
+  to?: string;
+  hasImage?: boolean;
+  tags?: string[];
+  tagsMatch?: 'all' | 'any';
+}
+
+const diaryFilterParams = (page: number, filters: DiaryFilters = {}) => {
+  const params = new URLSearchParams({ page: String(page) });
+  if (filters.from) params.append('from', filters.from);
+  if (filters.to) params.append('to', filters.to);
+  if (filters.hasImage !== undefined) params.append('has_image', String(filters.hasImage));
+  if (filters.tags?.length) params.append('tags', filters.tags.join(','));
+  if (filters.tagsMatch) params.append('tags_match', filters.tagsMatch);
+  return params.toString();
 };
 
 // 日記API
 export const diariesAPI = {
-  getAllByPet: async (petId: string, page = 1) => {
-    const response = await api.get(`/pets/${petId}/diaries?page=${page}`);
+  getAllByPet: async (petId: string, page = 1, filters?: DiaryFilters) => {
+    const response = await api.get(`/pets/${petId}/diaries?${diaryFilterParams(page, filters)}`);
+    return response.data;
+  },
+  getAll: async (page = 1, filters?: DiaryFilters) => {
+    const response = await api.get(`/diaries?${diaryFilterParams(page, filters)}`);
     return response.data;
   },
-  getAll: async (page = 1) => {
-    const response = await api.get(`/diaries?page=${page}`);
+  // 使われているタグと件数（多い順）
+  getTags: async () => {
+    const response = await api.get('/diaries/tags');
     return response.data;
   },
   getOne: async (id: string) => {
     const response = await api.get(`/diaries/${id}`);
     return response.data;
   },
-  create: async (data: FormData | any) => {
+  // 再送時に同じキーを渡すと二重に作成されない
+  create: async (data: FormData | any, idempotencyKey: string = crypto.randomUUID()) => {
     const isFormData = data instanceof FormData;
     const response = await api.post('/diaries', data, {
-      headers: isFormData ? { 'Content-Type': 'multipart/form-data' } : {},
+      headers: {
+        ...(isFormData ? { 'Content-Type': 'multipart/form-data' } : {}),
+        'Idempotency-Key': idempotencyKey,
+      },
     });
     return response.data;
   },
@@ -79,8 +186,51 @@ export const diariesAPI = {
     const response = await api.delete(`/diaries/${id}`);
     return response.data;
   },
-  getPresignedUrl: async (filename: string, fileType: string) => {
-    const response = await api.post('/upload/presigned-url', { filename, file_type: fileType });
+  // contentHash（SHA-256の16進）を渡すと、同じ画像がアップロード済みの場合は exists: true が返る
+  getPresignedUrl: async (filename: string, fileType: string, contentHash?: string) => {
+    const response = await api.post('/upload/presigned-url', {
+      filename,
+      file_type: fileType,
+      content_hash: contentHash,
+    });
+    return response.data;
+  },
+  // 複数画像の署名付きURLを1回のリクエストでまとめて取得
+  getPresignedUrls: async (
+    files: { filename: string; file_type: string; content_hash?: string }[],
+    usePost = false,
+  ) => {
+    const response = await api.post('/upload/presigned-urls', { files, use_post: usePost });
+    return response.data;
+  },
+};
+
+// マルチパートアップロードAPI（大きな画像・動画用）
+export const multipartAPI = {
+  initiate: async (filename: string, fileType: string, fileSize: number) => {
+    const response = await api.post('/upload/multipart', {
+      filename,
+      file_type: fileType,
+      file_size: fileSize,
+    });
+    return response.data;
+  },
+  // 複数パートの署名付きURLをまとめて取得
+  presignParts: async (uploadId: string, partNumbers: number[]) => {
+    const response = await api.post(`/upload/multipart/${uploadId}/parts`, { part_numbers: partNumbers });
+    return response.data;
+  },
+  // アップロード済みパートを取得（再開用）
+  getStatus: async (uploadId: string) => {
+    const response = await api.get(`/upload/multipart/${uploadId}`);
+    return response.data;
+  },
+  complete: async (uploadId: string, parts?: { part_number: number; etag: string }[]) => {
+    const response = await api.post(`/upload/multipart/${uploadId}/complete`, { parts });
+    return response.data;
+  },
+  abort: async (uploadId: string) => {
+    const response = await api.delete(`/upload/multipart/${uploadId}`);
     return response.data;
   },
 };
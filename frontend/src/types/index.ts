@@ -25,6 +25,8 @@ export interface Diary {
   title?: string;
   content: string;
   image_url?: string;
+  images?: string[];
+  tags?: string[];
   created_at: string;
 }
 
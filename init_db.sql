@@ -1,6 +1,14 @@
 -- 開発環境でのデータベース初期化
 
 -- 既存のテーブルが存在する場合は削除
+DROP TABLE IF EXISTS diary_archive_entries CASCADE;
+DROP TABLE IF EXISTS diary_archive_chunks CASCADE;
+DROP TABLE IF EXISTS tombstones CASCADE;
+DROP TABLE IF EXISTS idempotency_keys CASCADE;
+DROP TABLE IF EXISTS multipart_uploads CASCADE;
+DROP TABLE IF EXISTS image_objects CASCADE;
+DROP TABLE IF EXISTS diary_daily_counts CASCADE;
+DROP TABLE IF EXISTS diary_images CASCADE;
 DROP TABLE IF EXISTS diaries CASCADE;
 DROP TABLE IF EXISTS pets CASCADE;
 DROP TABLE IF EXISTS users CASCADE;
@@ -29,6 +37,7 @@ CREATE TABLE pets (
 );
 
 -- diariesテーブルの作成
+-- 行数が増えた環境では backend/partition_diaries.py で created_at の月次パーティションへ移行する
 CREATE TABLE diaries (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     pet_id UUID NOT NULL REFERENCES pets(id) ON DELETE CASCADE,
@@ -36,15 +45,126 @@ CREATE TABLE diaries (
     title VARCHAR(200),
     content TEXT NOT NULL,
     image_url VARCHAR(500),
+    tags TEXT[] NOT NULL DEFAULT '{}',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- diary_imagesテーブルの作成（1つの日記に複数画像）
+CREATE TABLE diary_images (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    diary_id UUID NOT NULL REFERENCES diaries(id) ON DELETE CASCADE,
+    image_url VARCHAR(500) NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- multipart_uploadsテーブルの作成（進行中のマルチパートアップロードの追跡）
+CREATE TABLE multipart_uploads (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    s3_key VARCHAR(500) NOT NULL,
+    s3_upload_id VARCHAR(1024) NOT NULL,
+    file_type VARCHAR(100),
+    file_size BIGINT,
+    part_size INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'in_progress',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- diary_daily_countsテーブルの作成（ペットごとの日別日記数ロールアップ）
+CREATE TABLE diary_daily_counts (
+    pet_id UUID NOT NULL REFERENCES pets(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (pet_id, day)
+);
+
+-- image_objectsテーブルの作成（コンテンツハッシュによる画像の重複排除と参照カウント）
+CREATE TABLE image_objects (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    content_hash VARCHAR(64) NOT NULL,
+    s3_key VARCHAR(500) NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    verified BOOLEAN NOT NULL DEFAULT FALSE,
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_image_objects_user_hash UNIQUE (user_id, content_hash)
+);
+
+-- idempotency_keysテーブルの作成（作成APIの再送に同じレスポンスを返すための記録）
+CREATE TABLE idempotency_keys (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    key VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'in_progress',
+    response_status INTEGER,
+    response_body TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+
+-- tombstonesテーブルの作成（差分同期のための削除記録）
+CREATE TABLE tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    entity_type VARCHAR(20) NOT NULL,
+    entity_id UUID NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- diary_archive_chunksテーブルの作成（古い日記をユーザー・月ごとに圧縮してオブジェクトストレージに保存）
+CREATE TABLE diary_archive_chunks (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    storage_key VARCHAR(500) NOT NULL,
+    diary_count INTEGER NOT NULL,
+    raw_size BIGINT NOT NULL,
+    compressed_size BIGINT NOT NULL,
+    checksum VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- diary_archive_entriesテーブルの作成（アーカイブした日記の索引）
+CREATE TABLE diary_archive_entries (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    pet_id UUID NOT NULL REFERENCES pets(id) ON DELETE CASCADE,
+    chunk_id UUID NOT NULL REFERENCES diary_archive_chunks(id),
+    image_url VARCHAR(500),
+    tags TEXT[] NOT NULL DEFAULT '{}',
+    image_urls TEXT[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
 -- パフォーマンス向上のためのインデックス作成
 CREATE INDEX idx_pets_user_id ON pets(user_id);
-CREATE INDEX idx_diaries_pet_id ON diaries(pet_id);
-CREATE INDEX idx_diaries_user_id ON diaries(user_id);
+-- 日記一覧（ペット別・ユーザー別、新しい順）はソートなしのインデックススキャンで返す
+-- （外部キーの検索にも先頭列として使われる。backend/models.py と同じ定義を保つ）
+CREATE INDEX idx_diaries_pet_id_created_at ON diaries(pet_id, created_at DESC, id DESC);
+CREATE INDEX idx_diaries_user_id_created_at ON diaries(user_id, created_at DESC, id DESC);
 CREATE INDEX idx_diaries_created_at ON diaries(created_at DESC);
+-- 一覧の絞り込み（画像ありの日記のみ・タグ）
+CREATE INDEX idx_diaries_user_id_created_at_with_image ON diaries(user_id, created_at DESC, id DESC) WHERE image_url IS NOT NULL;
+CREATE INDEX idx_diaries_tags ON diaries USING gin (tags);
+CREATE INDEX ix_diary_images_diary_id ON diary_images(diary_id);
+CREATE INDEX ix_multipart_uploads_user_id ON multipart_uploads(user_id);
+CREATE INDEX ix_multipart_uploads_status ON multipart_uploads(status);
+CREATE INDEX ix_image_objects_s3_key ON image_objects(s3_key);
+CREATE INDEX ix_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+CREATE INDEX idx_pets_user_id_updated_at ON pets(user_id, updated_at);
+CREATE INDEX idx_diaries_user_id_updated_at ON diaries(user_id, updated_at, id);
+CREATE INDEX idx_tombstones_user_id_deleted_at ON tombstones(user_id, deleted_at);
+CREATE INDEX idx_diary_archive_chunks_user_id_month ON diary_archive_chunks(user_id, month);
+CREATE INDEX ix_diary_archive_entries_chunk_id ON diary_archive_entries(chunk_id);
+CREATE INDEX idx_diary_archive_entries_user_id_created_at ON diary_archive_entries(user_id, created_at DESC, id DESC);
+CREATE INDEX idx_diary_archive_entries_pet_id_created_at ON diary_archive_entries(pet_id, created_at DESC, id DESC);
+CREATE INDEX idx_diary_archive_entries_user_id_updated_at ON diary_archive_entries(user_id, updated_at, id);
 
 -- 開発用テストデータの挿入
 INSERT INTO users (cognito_sub, email, username) VALUES 
@@ -67,7 +187,13 @@ BEGIN
         (test_user_id, 'タマ', '猫', 'スコティッシュフォールド', '2019-03-10', 'おとなしい性格の猫です');
     
     -- 最初のペット用のテスト日記データの挿入
-    INSERT INTO diaries (pet_id, user_id, title, content, image_url) VALUES 
-        (test_pet_id, test_user_id, '今日のお散歩', '今日は公園でたくさん遊びました！', NULL),
-        (test_pet_id, test_user_id, 'お昼寝タイム', 'ずっと寝ていました。かわいい寝顔です。', NULL);
-END $$;
\ No newline at end of file
+    INSERT INTO diaries (pet_id, user_id, title, content, image_url, tags) VALUES 
+        (test_pet_id, test_user_id, '今日のお散歩', '今日は公園でたくさん遊びました！', NULL, ARRAY['散歩', '公園']),
+        (test_pet_id, test_user_id, 'お昼寝タイム', 'ずっと寝ていました。かわいい寝顔です。', NULL, ARRAY['お昼寝']);
+END $$;
+
+-- テストデータの日別日記数ロールアップを作成
+INSERT INTO diary_daily_counts (pet_id, day, count)
+SELECT pet_id, date(timezone('Asia/Tokyo', created_at)), count(*)
+FROM diaries
+GROUP BY pet_id, date(timezone('Asia/Tokyo', created_at));
\ No newline at end of file